@@ -0,0 +1,331 @@
+"""
+Benchmark of execute_plan over the bundled plans, on local SQLite stand-ins.
+
+Commands:
+- run: build the stand-ins of each suite at the requested scale factors, run
+  every plans/<suite> plan against them and save per-phase timings and peak
+  memory to a JSON file.
+- compare: compare two saved runs phase by phase per suite and scale, and
+  list the plans behind each regression; exits with status 1 when there
+  are regressions.
+
+Phases come from the executor's instrumentation (src/utils/instrumentation.py):
+prepare (resolving and rendering $stepN values), queue, connect, execute,
+fetch, join and aggregation; "other" is the rest of the wall time. With
+--parallel, step phases overlap and may add up to more than the wall time.
+Timings are medians over --repeats runs after one warm-up run; peak memory
+comes from one extra run under tracemalloc, so tracing does not skew timings.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import pandas as pd
+import sqlalchemy
+
+from src.plan_execution import execute_plan
+from src.plan_rewrite import execute_rewritten
+from src.query_translation import TranslationReturn
+from src.utils.instrumentation import CollectingHooks, PlanMetrics
+from src.utils.sqlite_standins import build_standin, find_standins, localize_plan
+
+PHASES = ["prepare", "queue", "connect", "execute", "fetch", "join", "aggregation", "other"]
+_STEP_PHASES = {
+    "prepare": "prepare_s",
+    "queue": "queue_wait_s",
+    "connect": "connect_s",
+    "execute": "execute_s",
+    "fetch": "fetch_s",
+    "join": "join_s",
+}
+PLAN_RE = re.compile(r"plan_(\d+)\.json$")
+
+
+def load_plans(plans_dir: Path, suite: str) -> Dict[int, TranslationReturn]:
+    plans = {}
+    for path in sorted((plans_dir / suite).glob("plan_*.json")):
+        m = PLAN_RE.search(path.name)
+        if m:
+            plans[int(m.group(1))] = TranslationReturn(**json.loads(path.read_text(encoding="utf-8")))
+    return dict(sorted(plans.items()))
+
+
+def phase_seconds(metrics: PlanMetrics, wall_seconds: float) -> Dict[str, float]:
+    phases = {
+        phase: sum(getattr(step, attribute) for step in metrics.steps)
+        for phase, attribute in _STEP_PHASES.items()
+    }
+    phases["aggregation"] = metrics.aggregation_s
+    phases["other"] = max(0.0, wall_seconds - sum(phases.values()))
+    return phases
+
+
+def run_plan(plan: TranslationReturn, options: dict, pushdown: bool) -> tuple[pd.DataFrame, float, PlanMetrics]:
+    hooks = CollectingHooks()
+    run = execute_rewritten if pushdown else execute_plan
+    started = time.perf_counter()
+    df = run(plan, hooks=hooks, quiet=True, **options)
+    seconds = time.perf_counter() - started
+    return df, seconds, hooks.plans[-1]
+
+
+def benchmark_plan(
+    suite: str, plan_num: int, plan: TranslationReturn, scale: int, repeats: int, options: dict, pushdown: bool
+) -> dict:
+    record = {"suite": suite, "plan": plan_num, "scale": scale, "steps": len(plan.execution_plan)}
+    try:
+        df, _, _ = run_plan(plan, options, pushdown)  # warm-up: engines, pools, imports
+        timings = [run_plan(plan, options, pushdown) for _ in range(repeats)]
+
+        tracemalloc.start()
+        try:
+            run_plan(plan, options, pushdown)
+            peak_bytes = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    except Exception as e:
+        record.update(status="error", error=f"{type(e).__name__}: {str(e).splitlines()[0][:200]}")
+        return record
+
+    record.update(
+        status="ok",
+        rows=len(df),
+        seconds=statistics.median(seconds for _, seconds, _ in timings),
+        phases={
+            phase: statistics.median(phase_seconds(metrics, seconds)[phase] for _, seconds, metrics in timings)
+            for phase in PHASES
+        },
+        peak_mb=peak_bytes / 1024 / 1024,
+    )
+    return record
+
+
+def git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        )
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True)
+        return out.stdout.strip() + ("-dirty" if dirty.stdout.strip() else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def summarize(results: List[dict]) -> pd.DataFrame:
+    rows = []
+    for (suite, scale), group in pd.DataFrame(results).groupby(["suite", "scale"], sort=True):
+        ok = group[group["status"] == "ok"]
+        row = {"suite": suite, "scale": scale, "ok": len(ok), "failed": len(group) - len(ok)}
+        row["seconds"] = ok["seconds"].sum() if len(ok) else 0.0
+        for phase in PHASES:
+            row[phase] = sum(phases[phase] for phases in ok.get("phases", [])) if len(ok) else 0.0
+        row["peak_mb"] = ok["peak_mb"].max() if len(ok) else 0.0
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def cmd_run(args: argparse.Namespace) -> int:
+    standins = find_standins(args.schemas_dir)
+    suites = args.suite or list(standins)
+    missing = [suite for suite in suites if suite not in standins]
+    for suite in missing:
+        print(f"⚠️ Skipping suite '{suite}': no SQLite stand-in under {args.schemas_dir}/{suite}/sqlite")
+    suites = [suite for suite in suites if suite in standins]
+    if not suites:
+        print("No suite to benchmark.")
+        return 1
+
+    options = dict(
+        parallel=args.parallel,
+        chunksize=args.chunksize,
+        value_transport=args.value_transport,
+        semi_join_pushdown=args.semi_join_pushdown,
+        dtype_backend=args.dtype_backend,
+    )
+    results = []
+    for scale in args.scale:
+        for suite in suites:
+            metadata_path = args.metadata_dir / f"{suite}.json"
+            database = build_standin(
+                standins[suite], scale, args.work_dir, metadata_path if metadata_path.exists() else None
+            )
+            plans = load_plans(args.plans_dir, suite)
+            if args.limit:
+                plans = dict(list(plans.items())[: args.limit])
+            print(f"▶️ {suite} x{scale}: {len(plans)} plan(s) on {database}")
+            started = time.perf_counter()
+            for plan_num, plan in plans.items():
+                results.append(
+                    benchmark_plan(
+                        suite, plan_num, localize_plan(plan, database), scale, args.repeats, options, args.pushdown
+                    )
+                )
+            print(f"✅ {suite} x{scale} done in {time.perf_counter() - started:.1f}s")
+
+    created = datetime.now(timezone.utc)
+    output = args.output or Path("bench_results") / f"benchmark_{created.strftime('%Y%m%dT%H%M%SZ')}.json"
+    payload = {
+        "meta": {
+            "created_at": created.isoformat(),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "sqlalchemy": sqlalchemy.__version__,
+            "platform": platform.platform(),
+            "plans_dir": str(args.plans_dir),
+            "scales": args.scale,
+            "repeats": args.repeats,
+            "options": {**options, "pushdown": args.pushdown},
+        },
+        "results": results,
+    }
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(payload, indent=2, ensure_ascii=False))
+
+    print("=== Benchmark Summary (seconds are sums of per-plan medians) ===")
+    print(summarize(results).to_string(index=False, float_format=lambda v: f"{v:.4f}"))
+    print(f"\nResults saved to: {output.resolve()}")
+    return 0
+
+
+def cmd_compare(args: argparse.Namespace) -> int:
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+    candidate = json.loads(args.candidate.read_text(encoding="utf-8"))
+    if baseline["meta"].get("options") != candidate["meta"].get("options"):
+        print(f"⚠️ Runs used different options: {baseline['meta'].get('options')} vs {candidate['meta'].get('options')}")
+
+    def key(record: dict) -> tuple:
+        return record["suite"], record["scale"], record["plan"]
+
+    base = {key(r): r for r in baseline["results"]}
+    cand = {key(r): r for r in candidate["results"]}
+
+    changes = []
+    paired = []
+    for k in sorted(base.keys() & cand.keys()):
+        b, c = base[k], cand[k]
+        if b["status"] != c["status"]:
+            changes.append(f"{k[0]} x{k[1]} plan {k[2]}: {b['status']} -> {c['status']} {c.get('error') or ''}".rstrip())
+        elif b["status"] == "ok":
+            if b["rows"] != c["rows"]:
+                changes.append(f"{k[0]} x{k[1]} plan {k[2]}: {b['rows']} -> {c['rows']} rows")
+            paired.append((k, b, c))
+
+    def value(record: dict, phase: str) -> float:
+        if phase == "total":
+            return record["seconds"]
+        if phase == "peak_mb":
+            return record["peak_mb"]
+        return record["phases"][phase]
+
+    def regressed(b_value: float, c_value: float, min_delta: float) -> bool:
+        return c_value - b_value >= min_delta and c_value > b_value * (1 + args.threshold)
+
+    # Single plans take milliseconds and jitter as much, so timings are judged
+    # on suite totals; tracemalloc peaks are exact and are judged per plan.
+    rows = []
+    regressions = []
+    for suite, scale in sorted({k[:2] for k, _, _ in paired}):
+        group = [(k, b, c) for k, b, c in paired if k[:2] == (suite, scale)]
+        for phase in ["total", *PHASES, "peak_mb"]:
+            total = max if phase == "peak_mb" else sum
+            b_value = total(value(b, phase) for _, b, _ in group)
+            c_value = total(value(c, phase) for _, _, c in group)
+            rows.append({
+                "suite": suite,
+                "scale": scale,
+                "phase": phase,
+                "baseline": b_value,
+                "candidate": c_value,
+                "ratio": c_value / b_value if b_value else float("nan"),
+            })
+            if phase == "peak_mb":
+                slower = [
+                    (value(c, phase) - value(b, phase), k, value(b, phase), value(c, phase))
+                    for k, b, c in group
+                    if regressed(value(b, phase), value(c, phase), args.min_delta_mb)
+                ]
+            elif regressed(b_value, c_value, args.min_delta_ms / 1000):
+                slower = sorted(
+                    ((value(c, phase) - value(b, phase), k, value(b, phase), value(c, phase)) for k, b, c in group),
+                    reverse=True,
+                )[: args.top]
+            else:
+                slower = []
+            if slower:
+                regressions.append((suite, scale, phase, b_value, c_value, slower))
+
+    print(f"=== {args.baseline.name} -> {args.candidate.name} ({len(paired)} plan(s) in both) ===")
+    if rows:
+        print(pd.DataFrame(rows).to_string(index=False, float_format=lambda v: f"{v:.4f}"))
+    only = len(base.keys() ^ cand.keys())
+    if only:
+        print(f"\nℹ️ {only} plan(s) appear in only one of the runs")
+    if changes:
+        print("\n⚠️ Changed outcomes:")
+        for line in changes:
+            print(f"- {line}")
+    if not regressions:
+        print("\n✅ No regressions")
+        return 0
+
+    print(f"\n⚠️ Regressions (>{args.threshold:.0%} and >{args.min_delta_ms}ms per suite / >{args.min_delta_mb}MB per plan):")
+    for suite, scale, phase, b_value, c_value, slower in regressions:
+        print(f"- {suite} x{scale} {phase}: {b_value:.4f} -> {c_value:.4f}")
+        for _, (_, _, plan), b_plan, c_plan in slower:
+            print(f"    plan {plan}: {b_plan:.4f} -> {c_plan:.4f}")
+    return 1
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Benchmark execute_plan on local SQLite stand-ins.")
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="Run the plan corpus and save timings")
+    run.add_argument("--suite", action="append", help="Suite to run (repeatable; default: every suite with a SQLite stand-in)")
+    run.add_argument("--scale", action="append", type=int, help="Scale factor of the synthetic data (repeatable; default: 1)")
+    run.add_argument("--repeats", type=int, default=5, help="Timed runs per plan; the median is kept")
+    run.add_argument("--limit", type=int, default=None, help="Only run the first N plans of each suite")
+    run.add_argument("--plans-dir", type=Path, default=Path("plans"), help="Directory with one folder of plan_*.json per suite")
+    run.add_argument("--schemas-dir", type=Path, default=Path("test/schemas"), help="Directory with the suites' schemas")
+    run.add_argument("--metadata-dir", type=Path, default=Path("metadata"), help="Metadata catalogs whose column spelling the stand-ins adopt")
+    run.add_argument("--work-dir", type=Path, default=Path(".cache/benchmark"), help="Where the scaled databases are built")
+    run.add_argument("--output", type=Path, default=None, help="Results file (default: bench_results/benchmark_<timestamp>.json)")
+    run.add_argument("--parallel", action="store_true", help="Run independent plan steps concurrently")
+    run.add_argument("--chunksize", type=int, default=None, help="Stream step results in chunks of this many rows")
+    run.add_argument("--value-transport", default="auto", help="How $stepN values reach the database")
+    run.add_argument("--semi-join-pushdown", action="store_true", help="Prefilter join steps with the dependency's join keys")
+    run.add_argument("--dtype-backend", choices=["numpy", "pyarrow"], default="numpy", help="Dtypes of step results")
+    run.add_argument("--pushdown", action="store_true", help="Fold the final aggregation/projection into the SQL")
+    run.set_defaults(func=cmd_run)
+
+    compare = sub.add_parser("compare", help="Compare two saved runs")
+    compare.add_argument("baseline", type=Path)
+    compare.add_argument("candidate", type=Path)
+    compare.add_argument("--threshold", type=float, default=0.15, help="Relative growth that counts as a regression")
+    compare.add_argument("--min-delta-ms", type=float, default=10.0, help="Ignore suite-level slowdowns smaller than this (noise)")
+    compare.add_argument("--min-delta-mb", type=float, default=0.5, help="Ignore per-plan peak memory growth smaller than this")
+    compare.add_argument("--top", type=int, default=5, help="Plans listed under each regressed phase")
+    compare.set_defaults(func=cmd_compare)
+
+    args = ap.parse_args()
+    if args.command == "run":
+        args.scale = args.scale or [1]
+        if args.repeats < 1 or any(scale < 1 for scale in args.scale):
+            ap.error("--repeats and --scale must be at least 1")
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
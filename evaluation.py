@@ -1,12 +1,19 @@
 from pathlib import Path
+import io
+import os
 import re
 import json
 import argparse
 import pandas as pd
-from typing import Dict, List, Tuple
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Iterator, List, Optional, Tuple
 
-ID_RE_CROSS = re.compile(r"^result_(\d+)\.csv$", re.IGNORECASE)
-ID_RE_PLAN = re.compile(r"^result_plan_(\d+)\.csv$", re.IGNORECASE)
+from src.utils.result_files import COLUMNAR_SUFFIXES, read_result
+
+ID_RE_CROSS = re.compile(r"^result_(\d+)\.(csv|parquet|arrow)$", re.IGNORECASE)
+# test.py run_plans saves result_<n>; result_plan_<n> is the older name
+ID_RE_PLAN = re.compile(r"^result_(?:plan_)?(\d+)\.(csv|parquet|arrow)$", re.IGNORECASE)
 
 
 def find_subdirs(base: Path) -> List[Path]:
@@ -16,93 +23,228 @@ def find_subdirs(base: Path) -> List[Path]:
 
 
 def list_ids_in_cross(cross_subdir: Path) -> Dict[str, Path]:
-    out = {}
-    for p in cross_subdir.glob("*.csv"):
-        m = ID_RE_CROSS.match(p.name)
-        if m:
-            out[m.group(1)] = p
-    return out
+    return _list_results(cross_subdir, ID_RE_CROSS)
 
 
 def list_plan_files(results_subdir: Path) -> Dict[str, Path]:
+    return _list_results(results_subdir, ID_RE_PLAN)
+
+
+def _list_results(subdir: Path, pattern: re.Pattern) -> Dict[str, Path]:
     out = {}
-    for p in results_subdir.glob("*.csv"):
-        m = ID_RE_PLAN.match(p.name)
-        if m:
+    for p in sorted(subdir.iterdir()):
+        m = pattern.match(p.name)
+        # A columnar file wins over a CSV of the same ID: it keeps the dtypes
+        if m and (m.group(1) not in out or is_columnar(p)):
             out[m.group(1)] = p
     return out
 
 
+def is_columnar(path: Path) -> bool:
+    return path.suffix.lower() in COLUMNAR_SUFFIXES
+
+
 def read_csv_normalized(path: Path) -> pd.DataFrame:
-    df = pd.read_csv(path)
+    # Parquet and Arrow results are memory-mapped; only CSVs go through type inference
+    df = read_result(path)
     df = df.rename(columns=lambda c: str(c).strip().lower())
-    df = df.sort_index(axis=1)
+    return df.sort_index(axis=1)
+
+
+def align_dtypes(csv_df: pd.DataFrame, typed_df: pd.DataFrame) -> None:
+    """Make a CSV-parsed frame comparable with a columnar one, column by column.
+
+    CSV columns are cast to the columnar dtype when the cast is exact (dates,
+    nullable ints); otherwise the columnar column is read back as a CSV would be.
+    Floats always are, since pandas' CSV parser can be off by one ulp.
+    """
+    for i, (csv_dtype, typed_dtype) in enumerate(zip(csv_df.dtypes, typed_df.dtypes)):
+        is_float = pd.api.types.is_float_dtype(typed_dtype)
+        if csv_dtype == typed_dtype and not is_float:
+            continue
+        cast = None if is_float else _cast_csv_column(csv_df.iloc[:, i], typed_dtype)
+        if cast is not None:
+            csv_df.isetitem(i, cast)
+        else:
+            column = typed_df.iloc[:, i].to_frame().to_csv(index=False)
+            typed_df.isetitem(i, pd.read_csv(io.StringIO(column)).iloc[:, 0])
+
+
+def _cast_csv_column(column: pd.Series, dtype) -> Optional[pd.Series]:
     try:
-        df = df.sort_values(by=list(df.columns)).reset_index(drop=True)
+        if pd.api.types.is_datetime64_any_dtype(dtype):
+            return pd.to_datetime(column).astype(dtype)
+        if isinstance(dtype, pd.api.extensions.ExtensionDtype):
+            # Lossy casts (1.5 to Int64) raise instead of truncating
+            return column.astype(dtype)
     except Exception:
-        df = df.reset_index(drop=True)
-    return df
+        # pyarrow-backed dtypes raise ArrowInvalid rather than ValueError
+        return None
+    return None
 
 
 def equals_csv(a: Path, b: Path, strict: bool = False) -> bool:
-    if strict:
-        return a.read_bytes() == b.read_bytes()
-    try:
-        da = read_csv_normalized(a)
-        db = read_csv_normalized(b)
-    except Exception:
-        return a.read_bytes() == b.read_bytes()
-    if da.shape != db.shape or list(da.columns) != list(db.columns):
-        return False
-    return da.equals(db)
+    return compare_pair(a, b, strict=strict)["status"] == "equal"
 
 
 def is_csv_empty(path: Path) -> bool:
     try:
-        df = pd.read_csv(path)
-        return df.empty
+        if is_columnar(path):
+            return read_result(path).empty
+        return pd.read_csv(path, nrows=1).empty
     except Exception:
         return path.stat().st_size == 0
 
 
-def compare_subdir(
-    cross_subdir: Path, results_subdir: Path, strict: bool = False
+def compare_pair(
+    cross_path: Path, plan_path: Path, strict: bool = False, max_diff_rows: int = 5
 ) -> Dict:
-    cross_ids = list_ids_in_cross(cross_subdir)
-    plan_ids = list_plan_files(results_subdir)
-    missing = []
-    equals = []
-    diffs = []
-
-    for id_, cross_path in cross_ids.items():
-        plan_path = plan_ids.get(id_)
-        if plan_path is None:
-            missing.append(id_)
-            continue
-        if equals_csv(cross_path, plan_path, strict=strict):
-            equals.append(id_)
+    """Compare one crossing_data CSV with its plan result, parsing each file once."""
+    try:
+        dp = read_csv_normalized(plan_path)
+        plan_empty = dp.empty
+    except Exception:
+        dp = None
+        plan_empty = plan_path.stat().st_size == 0
+
+    if strict or dp is None:
+        equal = cross_path.read_bytes() == plan_path.read_bytes()
+        return {"status": "equal" if equal else "different", "plan_empty": plan_empty}
+    try:
+        dc = read_csv_normalized(cross_path)
+    except Exception:
+        equal = cross_path.read_bytes() == plan_path.read_bytes()
+        return {"status": "equal" if equal else "different", "plan_empty": plan_empty}
+    if list(dc.columns) == list(dp.columns) and is_columnar(plan_path) != is_columnar(cross_path):
+        if is_columnar(plan_path):
+            align_dtypes(dc, dp)
         else:
-            diffs.append(id_)
+            align_dtypes(dp, dc)
+
+    out = {"status": "different", "plan_empty": plan_empty}
+    if list(dc.columns) != list(dp.columns):
+        out["columns_only_in_cross"] = [c for c in dc.columns if c not in dp.columns]
+        out["columns_only_in_results"] = [c for c in dp.columns if c not in dc.columns]
+        return out
+    dtypes_differ = [c for c, a, b in zip(dc.columns, dc.dtypes, dp.dtypes) if a != b]
+    if dtypes_differ:
+        out["dtypes_differ"] = dtypes_differ
+
+    cross_hashes = _row_hashes(dc)
+    plan_hashes = _row_hashes(dp)
+    delta = cross_hashes.value_counts().sub(plan_hashes.value_counts(), fill_value=0)
+    delta = delta[delta != 0]
+    if delta.empty and not dtypes_differ:
+        return {"status": "equal", "plan_empty": plan_empty}
+
+    missing = delta[delta > 0]
+    extra = -delta[delta < 0]
+    out["rows_only_in_cross_count"] = int(missing.sum())
+    out["rows_only_in_results_count"] = int(extra.sum())
+    out["rows_only_in_cross"] = _sample_rows(dc, cross_hashes, missing, max_diff_rows)
+    out["rows_only_in_results"] = _sample_rows(dp, plan_hashes, extra, max_diff_rows)
+    return out
+
+
+def _row_hashes(df: pd.DataFrame) -> pd.Series:
+    if df.empty:
+        return pd.Series(dtype="uint64")
+    return pd.util.hash_pandas_object(df, index=False).reset_index(drop=True)
 
-    empty_plan_ids = sorted(
-        [pid for pid, ppath in plan_ids.items() if is_csv_empty(ppath)],
-        key=lambda x: int(x),
-    )
+
+def _sample_rows(
+    df: pd.DataFrame, hashes: pd.Series, counts: pd.Series, limit: int
+) -> List[Dict]:
+    if counts.empty or limit <= 0:
+        return []
+    wanted = set(counts.index[:limit])
+    first = hashes[hashes.isin(wanted)].drop_duplicates()
+    rows = df.loc[first.index]
+    samples = json.loads(rows.to_json(orient="records", date_format="iso"))
+    for sample, h in zip(samples, first):
+        sample["_count"] = int(counts[h])
+    return samples
+
+
+def _compare_task(
+    subdir: str, id_: str, cross_path: Optional[Path], plan_path: Optional[Path],
+    strict: bool, max_diff_rows: int,
+) -> Dict:
+    if plan_path is None:
+        return {"subdir": subdir, "id": id_, "status": "missing_in_results", "plan_empty": False}
+    if cross_path is None:
+        # Only the emptiness of results without a crossing file is reported.
+        return {"subdir": subdir, "id": id_, "status": None, "plan_empty": is_csv_empty(plan_path)}
+    return {"subdir": subdir, "id": id_, **compare_pair(cross_path, plan_path, strict, max_diff_rows)}
+
+
+def list_tasks(cross_subdir: Path, results_subdir: Optional[Path]) -> List[Tuple]:
+    cross_ids = list_ids_in_cross(cross_subdir)
+    plan_ids = list_plan_files(results_subdir) if results_subdir is not None else {}
+    ids = sorted(set(cross_ids) | set(plan_ids), key=lambda x: int(x))
+    return [(cross_subdir.name, id_, cross_ids.get(id_), plan_ids.get(id_)) for id_ in ids]
+
+
+def summarize_subdir(subdir: str, outcomes: List[Dict]) -> Dict:
+    by_status: Dict[str, List[str]] = {"missing_in_results": [], "equal": [], "different": []}
+    for o in outcomes:
+        if o["status"] is not None:
+            by_status[o["status"]].append(o["id"])
+    empty_plan_ids = [o["id"] for o in outcomes if o["plan_empty"]]
+
+    def ordered(ids):
+        return sorted(ids, key=lambda x: int(x))
 
     return {
-        "subdir": cross_subdir.name,
-        "total_cross_files": len(cross_ids),
-        "missing_in_results_count": len(missing),
-        "missing_in_results_ids": sorted(missing, key=lambda x: int(x)),
-        "equal_count": len(equals),
-        "equal_ids": sorted(equals, key=lambda x: int(x)),
-        "different_count": len(diffs),
-        "different_ids": sorted(diffs, key=lambda x: int(x)),
+        "subdir": subdir,
+        "total_cross_files": sum(len(ids) for ids in by_status.values()),
+        "missing_in_results_count": len(by_status["missing_in_results"]),
+        "missing_in_results_ids": ordered(by_status["missing_in_results"]),
+        "equal_count": len(by_status["equal"]),
+        "equal_ids": ordered(by_status["equal"]),
+        "different_count": len(by_status["different"]),
+        "different_ids": ordered(by_status["different"]),
         "empty_in_results_count": len(empty_plan_ids),
-        "empty_in_results_ids": empty_plan_ids,
+        "empty_in_results_ids": ordered(empty_plan_ids),
     }
 
 
+def compare_subdir(
+    cross_subdir: Path, results_subdir: Path, strict: bool = False
+) -> Dict:
+    outcomes = [
+        _compare_task(*task, strict, 5) for task in list_tasks(cross_subdir, results_subdir)
+    ]
+    return summarize_subdir(cross_subdir.name, outcomes)
+
+
+def write_subdir_report(outdir: Path, rep: Dict) -> None:
+    rows = []
+    for id_ in rep["missing_in_results_ids"]:
+        rows.append({"id": int(id_), "status": "missing_in_results"})
+    for id_ in rep["equal_ids"]:
+        rows.append({"id": int(id_), "status": "equal"})
+    for id_ in rep["different_ids"]:
+        rows.append({"id": int(id_), "status": "different"})
+    df = (
+        pd.DataFrame(rows).sort_values(by="id")
+        if rows
+        else pd.DataFrame(columns=["id", "status"])
+    )
+    df.to_csv(outdir / f"comparison_report_{rep['subdir']}.csv", index=False)
+
+
+def _run_tasks(tasks: List[Tuple], strict: bool, max_diff_rows: int, workers: int) -> Iterator[Dict]:
+    if workers <= 1:
+        for task in tasks:
+            yield _compare_task(*task, strict, max_diff_rows)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_compare_task, *task, strict, max_diff_rows) for task in tasks]
+        for future in as_completed(futures):
+            yield future.result()
+
+
 def main():
     ap = argparse.ArgumentParser(
         description="Compare CSVs between crossing_data and results."
@@ -119,6 +261,18 @@ def main():
         help="Use byte-for-byte comparison instead of CSV-normalized",
     )
     ap.add_argument("--outdir", type=str, default=".", help="Where to write reports")
+    ap.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Processes comparing files in parallel (1 compares in-process)",
+    )
+    ap.add_argument(
+        "--max-diff-rows",
+        type=int,
+        default=5,
+        help="Differing rows to sample per side for each different result",
+    )
     args = ap.parse_args()
 
     base = Path(args.base).resolve()
@@ -128,57 +282,33 @@ def main():
     cross_subdirs = {p.name: p for p in find_subdirs(cross_base)}
     results_subdirs = {p.name: p for p in find_subdirs(results_base)}
 
-    # Intersect subdir names that exist in both; still process ones that exist only in crossing_data (to count missing)
-    subdir_names = sorted(set(cross_subdirs.keys()) | set(results_subdirs.keys()))
-
-    all_reports = []
-    for name in subdir_names:
-        cross_sub = cross_subdirs.get(name, None)
-        results_sub = results_subdirs.get(name, None)
-
-        # If crossing subdir doesn't exist, nothing to compare for that subdir
-        if cross_sub is None:
-            continue
-
-        if results_sub is None:
-            # Count all files as "missing in results"
-            cross_ids = list_ids_in_cross(cross_sub)
-            rep = {
-                "subdir": name,
-                "total_cross_files": len(cross_ids),
-                "missing_in_results_count": len(cross_ids),
-                "missing_in_results_ids": sorted(
-                    list(cross_ids.keys()), key=lambda x: int(x)
-                ),
-                "equal_count": 0,
-                "equal_ids": [],
-                "different_count": 0,
-                "different_ids": [],
-            }
-        else:
-            rep = compare_subdir(cross_sub, results_sub, strict=args.strict)
-
-        all_reports.append(rep)
+    # Only subdirs in crossing_data are compared; a missing results subdir counts every file as missing
+    tasks = []
+    for name, cross_sub in cross_subdirs.items():
+        tasks.extend(list_tasks(cross_sub, results_subdirs.get(name)))
 
     outdir = Path(args.outdir)
     outdir.mkdir(parents=True, exist_ok=True)
 
-    # Write per-subdir CSV and combined JSON
-    for rep in all_reports:
-        sub = rep["subdir"]
-        rows = []
-        for id_ in rep["missing_in_results_ids"]:
-            rows.append({"id": int(id_), "status": "missing_in_results"})
-        for id_ in rep["equal_ids"]:
-            rows.append({"id": int(id_), "status": "equal"})
-        for id_ in rep["different_ids"]:
-            rows.append({"id": int(id_), "status": "different"})
-        df = (
-            pd.DataFrame(rows).sort_values(by="id")
-            if rows
-            else pd.DataFrame(columns=["id", "status"])
-        )
-        df.to_csv(outdir / f"comparison_report_{sub}.csv", index=False)
+    pending = Counter(task[0] for task in tasks)
+    outcomes: Dict[str, List[Dict]] = {name: [] for name in cross_subdirs}
+    reports = {}
+    # Outcomes are appended as they finish, and a subdir's CSV is written once its last file is in
+    with (outdir / "comparison_details.jsonl").open("w", encoding="utf-8") as details:
+        for outcome in _run_tasks(tasks, args.strict, args.max_diff_rows, args.workers):
+            sub = outcome["subdir"]
+            outcomes[sub].append(outcome)
+            if outcome["status"] is not None:
+                details.write(json.dumps(outcome, ensure_ascii=False, default=str) + "\n")
+                details.flush()
+            pending[sub] -= 1
+            if pending[sub] == 0:
+                reports[sub] = summarize_subdir(sub, outcomes.pop(sub))
+                write_subdir_report(outdir, reports[sub])
+    for sub, rest in outcomes.items():
+        reports[sub] = summarize_subdir(sub, rest)
+        write_subdir_report(outdir, reports[sub])
+    all_reports = [reports[name] for name in sorted(reports)]
 
     (outdir / "comparison_summary.json").write_text(
         json.dumps(all_reports, indent=2, ensure_ascii=False)
@@ -193,6 +323,7 @@ def main():
     print(f"\nReports saved to: {outdir.resolve()}")
     print("- Per-subdir CSV: comparison_report_<subdir>.csv")
     print("- Combined JSON: comparison_summary.json")
+    print("- Per-file outcomes and differing rows: comparison_details.jsonl")
 
 
 if __name__ == "__main__":
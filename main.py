@@ -1,12 +1,12 @@
 from datetime import datetime
 import typer
 import json
-from typing import List
+from typing import List, Optional
 from pathlib import Path
 
 from src.utils.sort import sort_execution_plan
-from src.utils.metadata_extraction import extract_db_info
-from src.query_translation import translate_query
+from src.utils.metadata_extraction import refresh_metadata
+from src.query_translation import DEFAULT_CACHE_DIR, DEFAULT_MODEL, PROMPTS, translate_query
 
 app = typer.Typer()
 
@@ -17,11 +17,12 @@ def extract_metadata(
     output_path: str = typer.Option(
         "./metadata.json", help="Path to save the extracted metadata"
     ),
+    incremental: bool = typer.Option(
+        True, "--incremental/--full", help="Reaproveitar tabelas cujo DDL não mudou desde a última extração"
+    ),
+    max_workers: int = typer.Option(8, help="Bancos extraídos em paralelo"),
 ):
-    info = extract_db_info(db_urls)
-    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
-    with open(output_path, "w") as f:
-        json.dump(info, f, indent=4, ensure_ascii=False)
+    refresh_metadata(db_urls, output_path, incremental=incremental, max_workers=max_workers)
 
     print(f"Databases metadata extracted and saved to {output_path}")
 
@@ -35,8 +36,21 @@ def translate(
     output_path: str = typer.Option(
         None, help="Onde salvar o plano (padrão: execution_plan_YYYYmmdd-HHMMSS.json)"
     ),
+    prompt_version: str = typer.Option("prompt_2", help=f"Prompt usado: {', '.join(PROMPTS)}"),
+    model: str = typer.Option(DEFAULT_MODEL, help="Modelo usado na tradução"),
+    cache: bool = typer.Option(True, "--cache/--no-cache", help="Reutilizar traduções em cache"),
+    refresh_cache: bool = typer.Option(False, "--refresh-cache", help="Traduzir novamente e sobrescrever o cache"),
+    schema_budget: Optional[int] = typer.Option(None, help="Enviar só as tabelas mais relevantes, até este número de tokens, em vez de todo o metadata"),
 ):
-    data = translate_query(metadata_path, query)
+    data = translate_query(
+        metadata_path,
+        query,
+        prompt_version=prompt_version,
+        model=model,
+        cache_dir=DEFAULT_CACHE_DIR if cache else None,
+        refresh_cache=refresh_cache,
+        schema_budget=schema_budget,
+    )
 
     if not output_path:
         Path("./plans").mkdir(parents=True, exist_ok=True)
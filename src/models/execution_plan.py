@@ -1,9 +1,21 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, PrivateAttr
+
+from src.utils.query_template import QueryTemplate, compile_query
 
 
 class JoinInfo(BaseModel):
     type: str
-    on: dict[str, str]
+    # One {current_step_column, dependency_step_column} pair, or a list of
+    # them for a composite key.
+    on: dict[str, str] | list[dict[str, str]]
+    # The dependency joined; defaults to the matching position in depends_on.
+    dependency_step: int | None = None
+
+    @property
+    def key_pairs(self) -> list[tuple[str, str]]:
+        """``(dependency_step_column, current_step_column)`` for each key column."""
+        conditions = [self.on] if isinstance(self.on, dict) else self.on
+        return [(c["dependency_step_column"], c["current_step_column"]) for c in conditions]
 
 
 class ExecutionPlan(BaseModel):
@@ -13,4 +25,27 @@ class ExecutionPlan(BaseModel):
     query: str
     depends_on: list[int]
     output_columns: list[dict[str, str]] = []
-    join_info: JoinInfo | None = None
+    join_info: JoinInfo | list[JoinInfo] | None = None
+
+    _template: QueryTemplate | None = PrivateAttr(default=None)
+
+    @property
+    def template(self) -> QueryTemplate:
+        """The compiled query, recompiled only if ``query`` was reassigned."""
+        if self._template is None or self._template.source != self.query:
+            self._template = compile_query(self.query)
+        return self._template
+
+    @property
+    def joins(self) -> list[JoinInfo]:
+        """``join_info`` as a list, each entry bound to the dependency it joins."""
+        if self.join_info is None:
+            return []
+
+        infos = self.join_info if isinstance(self.join_info, list) else [self.join_info]
+        joins = []
+        for position, info in enumerate(infos):
+            if info.dependency_step is None and position < len(self.depends_on):
+                info = info.model_copy(update={"dependency_step": self.depends_on[position]})
+            joins.append(info)
+        return joins
@@ -0,0 +1,310 @@
+"""Run a batch of plans, reading steps that several plans share only once.
+
+Plans translated for the same suite often open with the same query against
+the same database. ``share_steps`` groups the steps that read no
+``$stepN`` values by database URL and SQL (whitespace and a trailing
+semicolon aside), runs each query asked for by more than one step once,
+and serves the result to every step that asks for it through
+``SharedStepResults``, a step cache the plans are then executed with.
+
+With ``merge_filters``, plain scans of the same table (column references
+only, a single FROM item, any WHERE clause, nothing that groups, sorts or
+limits) are also merged into one query that selects the union of their
+columns where any of their filters holds, plus one marker column per
+filter; each step then gets the rows of its own marker and its own
+columns. Merging trades several selective reads for one wider scan, and
+rows of a step without ORDER BY may come back in another order, so it is
+opt-in.
+
+Shared results bypass the chunked reader, so ``chunksize`` runs only share
+steps through the regular cache lookups they already make.
+"""
+
+import re
+import threading
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from typing import Callable, Optional, Union
+
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+
+from src.plan_execution import execute_plan
+from src.query_translation import TranslationReturn
+from src.utils.column_types import read_sql_options
+from src.utils.engine_registry import get_engine_registry
+from src.utils.instrumentation import say
+from src.utils.metadata_extraction import add_url_driver
+from src.utils.result_cache import CacheStats, StepCache
+from src.utils.sql_tokens import tokenize
+
+_WHITESPACE_RE = re.compile(r"""\s+|('(?:[^']|'')*'|"(?:[^"]|"")*"|`[^`]*`)""")
+
+# Words that make a scan's rows depend on more than its own filter.
+_NOT_MERGEABLE = frozenset(
+    """
+    distinct group having order limit offset fetch top union intersect except join
+    window over into for with lateral natural using qualify connect start
+    """.split()
+)
+
+_MARKER = "monk_shared_{}"
+
+
+class SharedStepResults(StepCache):
+    """Step results read once for a batch, in front of the batch's own step cache.
+
+    Each result is kept until every step that shares it has read it; other
+    lookups, and every store, go to ``fallback``.
+    """
+
+    def __init__(self, fallback: Optional[StepCache] = None):
+        self.fallback = fallback
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        self._frames: dict[tuple[str, str], list] = {}
+
+    def share(self, db_url: str, sql: str, df: pd.DataFrame, uses: int) -> None:
+        with self._lock:
+            self._frames[(add_url_driver(db_url), sql)] = [df, uses]
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+    def get(self, db_url: str, sql: str) -> Optional[pd.DataFrame]:
+        key = (add_url_driver(db_url), sql)
+        with self._lock:
+            entry = self._frames.get(key)
+            if entry is not None:
+                entry[1] -= 1
+                if entry[1] <= 0:
+                    del self._frames[key]
+                self.stats.hits += 1
+                return entry[0].copy(deep=False)
+        if self.fallback is not None:
+            return self.fallback.get(db_url, sql)
+        with self._lock:
+            self.stats.misses += 1
+        return None
+
+    def put(self, db_url: str, sql: str, df: pd.DataFrame) -> None:
+        if self.fallback is not None:
+            self.fallback.put(db_url, sql, df)
+
+    def invalidate(self, db_url: Optional[str] = None) -> None:
+        with self._lock:
+            db = None if db_url is None else add_url_driver(db_url)
+            for key in [key for key in self._frames if db is None or key[0] == db]:
+                del self._frames[key]
+        if self.fallback is not None:
+            self.fallback.invalidate(db_url)
+
+
+@dataclass
+class _Scan:
+    """A static step query in the form ``SELECT items FROM source [WHERE condition]``."""
+
+    sql: str
+    items: list[str]
+    source: str
+    condition: Optional[str]
+
+
+@dataclass
+class _SharedQuery:
+    db_url: str
+    consumers: Counter = field(default_factory=Counter)  # step SQL -> steps reading it
+
+
+def share_steps(
+    plans: list[TranslationReturn],
+    dtype_backend: str = "numpy",
+    merge_filters: bool = False,
+    fallback: Optional[StepCache] = None,
+) -> SharedStepResults:
+    """Read the static steps ``plans`` have in common once; the results serve as their step cache.
+
+    A shared query that fails is left to the steps themselves, which then
+    run (and fail) on their own.
+    """
+    shared = SharedStepResults(fallback)
+    groups: dict[tuple[str, str], _SharedQuery] = {}
+    for plan in plans:
+        for step in plan.execution_plan:
+            try:
+                template = step.template
+            except ValueError:
+                continue
+            if template.slots:
+                continue
+            db_url = add_url_driver(step.database)
+            group = groups.setdefault((db_url, _normalize(template.source)), _SharedQuery(db_url))
+            group.consumers[template.source] += 1
+
+    scans: dict[tuple[str, str], list[tuple[_Scan, _SharedQuery]]] = defaultdict(list)
+    for group in groups.values():
+        # Run a step's own text: normalizing would fold away the end of a -- comment.
+        sql = next(iter(group.consumers))
+        scan = _parse_scan(sql, group.db_url) if merge_filters else None
+        if scan is not None:
+            scans[(group.db_url, _normalize(scan.source))].append((scan, group))
+        elif sum(group.consumers.values()) > 1:
+            _share_query(shared, group, sql, dtype_backend)
+
+    for members in scans.values():
+        if len(members) > 1:
+            _share_merged_scan(shared, members, dtype_backend)
+        else:
+            scan, group = members[0]
+            if sum(group.consumers.values()) > 1:
+                _share_query(shared, group, scan.sql, dtype_backend)
+
+    if len(shared):
+        say(f"♻️ Shared {len(shared)} step result(s) across {len(plans)} plan(s)")
+    return shared
+
+
+def execute_plans(
+    plans: list[TranslationReturn],
+    merge_filters: bool = False,
+    cache: Optional[StepCache] = None,
+    run: Callable[..., pd.DataFrame] = execute_plan,
+    **options,
+) -> list[Union[pd.DataFrame, Exception]]:
+    """Execute ``plans`` in order with their shared steps read once; one result or exception per plan.
+
+    ``options`` are passed to ``run`` (``execute_plan`` by default), with
+    ``cache`` behind the shared results.
+    """
+    shared = share_steps(
+        plans,
+        dtype_backend=options.get("dtype_backend", "numpy"),
+        merge_filters=merge_filters,
+        fallback=cache,
+    )
+    results: list[Union[pd.DataFrame, Exception]] = []
+    for plan in plans:
+        try:
+            results.append(run(plan, cache=shared, **options))
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+def _share_query(shared: SharedStepResults, group: _SharedQuery, sql: str, dtype_backend: str) -> None:
+    try:
+        with get_engine_registry().get(group.db_url).connect() as conn:
+            df = pd.read_sql(text(sql), conn, **read_sql_options(dtype_backend))
+    except Exception as e:
+        say(f"⚠️ Shared step query failed, its steps run on their own: {e}")
+        return
+    for step_sql, uses in group.consumers.items():
+        shared.share(group.db_url, step_sql, df, uses)
+
+
+def _share_merged_scan(
+    shared: SharedStepResults, members: list[tuple[_Scan, _SharedQuery]], dtype_backend: str
+) -> None:
+    items = list(dict.fromkeys(item for scan, _ in members for item in scan.items))
+    markers = [
+        f"CASE WHEN {scan.condition or '1 = 1'} THEN 1 ELSE 0 END AS {_MARKER.format(i)}"
+        for i, (scan, _) in enumerate(members)
+    ]
+    sql = f"SELECT {', '.join(items + markers)} FROM {members[0][0].source}"
+    if all(scan.condition for scan, _ in members):
+        sql += " WHERE " + " OR ".join(f"({scan.condition})" for scan, _ in members)
+
+    db_url = members[0][1].db_url
+    try:
+        with get_engine_registry().get(db_url).connect() as conn:
+            result = conn.execute(text(sql))
+            names = list(result.keys())
+            rows = result.fetchall()
+    except Exception as e:
+        say(f"⚠️ Merged scan of {members[0][0].source} failed, its steps run on their own: {e}")
+        return
+
+    for i, (scan, group) in enumerate(members):
+        marker = len(items) + i
+        positions = [items.index(item) for item in scan.items]
+        # Rebuilt from the raw rows so each step infers its dtypes from its own
+        # rows, as it would reading them alone.
+        df = pd.DataFrame.from_records(
+            [tuple(row[p] for p in positions) for row in rows if row[marker] == 1],
+            columns=[names[p] for p in positions],
+            coerce_float=True,
+        )
+        if dtype_backend == "pyarrow":
+            df = df.convert_dtypes(dtype_backend="pyarrow")
+        for step_sql, uses in group.consumers.items():
+            shared.share(db_url, step_sql, df, uses)
+    say(f"♻️ Merged {len(members)} scan(s) of {members[0][0].source} into one query")
+
+
+def _normalize(sql: str) -> str:
+    """``sql`` with whitespace runs outside quotes collapsed and no trailing semicolon."""
+    collapsed = _WHITESPACE_RE.sub(lambda m: m.group(1) or " ", sql)
+    return collapsed.strip().rstrip(";").strip()
+
+
+def _parse_scan(sql: str, db_url: str) -> Optional[_Scan]:
+    try:
+        tokens = tokenize(sql, make_url(db_url).get_backend_name())
+    except ValueError:
+        return None
+    if tokens and tokens[-1].text == ";":
+        tokens = tokens[:-1]
+    if any(sql[a.end : b.start].strip() for a, b in zip(tokens, tokens[1:])):
+        return None  # a comment would swallow what the merged query adds after it
+    words = [token.text.lower() for token in tokens if token.kind == "word"]
+    if (
+        not tokens
+        or not tokens[0].is_word("select")
+        or words.count("select") != 1
+        or _NOT_MERGEABLE.intersection(words)
+        or any(token.kind in ("param", "placeholder") or token.text == ";" for token in tokens)
+    ):
+        return None
+
+    from_at = next((i for i, token in enumerate(tokens) if token.is_word("from")), None)
+    if from_at is None:
+        return None
+    where_at = next((i for i, token in enumerate(tokens) if token.is_word("where")), len(tokens))
+
+    items = _column_items(sql, tokens[1:from_at])
+    source = tokens[from_at + 1 : where_at]
+    if items is None or not _is_reference(source):
+        return None
+    condition = tokens[where_at + 1 :]
+    if where_at < len(tokens) and not condition:
+        return None
+    return _Scan(
+        sql=sql,
+        items=items,
+        source=sql[source[0].start : source[-1].end],
+        condition=sql[condition[0].start : condition[-1].end] if condition else None,
+    )
+
+
+def _column_items(sql: str, tokens: list) -> Optional[list[str]]:
+    """Text of each select item when every item is a (qualified) column, optionally aliased."""
+    items, start = [], 0
+    for end in [i for i, token in enumerate(tokens) if token.text == ","] + [len(tokens)]:
+        item = tokens[start:end]
+        if not _is_reference(item):
+            return None
+        items.append(sql[item[0].start : item[-1].end])
+        start = end + 1
+    return items
+
+
+def _is_reference(tokens: list) -> bool:
+    """``name[.name...] [[AS] alias]``: a column or table, optionally qualified and aliased."""
+    if len(tokens) >= 2 and tokens[-2].is_word("as"):
+        tokens = tokens[:-2] if tokens[-1].is_name else []
+    elif len(tokens) >= 2 and tokens[-1].is_name and tokens[-2].is_name:
+        tokens = tokens[:-1]
+    return len(tokens) % 2 == 1 and all(
+        token.is_name if i % 2 == 0 else token.text == "." for i, token in enumerate(tokens)
+    )
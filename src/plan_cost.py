@@ -0,0 +1,254 @@
+"""Cost estimates of translated plans from the databases' ``EXPLAIN``, without running them.
+
+``PlanCostEstimator.estimate`` asks the database of each step for its
+optimizer's estimate (PostgreSQL ``EXPLAIN (FORMAT JSON)``, MySQL
+``EXPLAIN FORMAT=JSON``) in dependency order. A ``$stepN.column`` slot has
+no values before the plan runs, so a step that filters on upstream values
+is explained twice: once with each ``IN ($stepN.column)`` list replaced by
+``IS NOT NULL`` (the step without the filter) and once with a single
+literal in every slot (one probe). With ``k`` the estimated rows of the
+upstream step, the step costs whichever is cheaper of the unfiltered query
+and ``k`` probes, and returns at most ``k`` times the rows of one probe.
+
+A plan's cost is its critical path: the most expensive chain of steps
+through the dependency graph, since independent steps can run at the same
+time. Costs are in each database's own units, so they rank candidates of
+the same question against each other rather than measure time. Dialects
+without a cost-reporting ``EXPLAIN`` (SQLite among them) leave the steps,
+and the plans reading them, unestimated.
+"""
+
+import json
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+from sqlalchemy import text
+
+from src.plan_steps import ExecutionError, step_reads
+from src.plan_validation import PlanValidationError, PlanValidator
+from src.query_translation import TranslationReturn
+from src.utils.engine_registry import get_engine_registry
+from src.utils.instrumentation import say
+from src.utils.metadata_extraction import add_url_driver
+from src.utils.query_template import QueryTemplate, Slot
+
+# Literal standing in for one upstream value; an untyped string literal
+# converts to the integer and text keys plans join on.
+_PROBE_LITERAL = "'0'"
+
+Explain = Callable[[str, str], Optional["Estimate"]]
+
+
+@dataclass(frozen=True)
+class Estimate:
+    cost: float
+    rows: float
+
+
+@dataclass(frozen=True)
+class StepCost:
+    step_id: int
+    cost: Optional[float]
+    rows: Optional[float]
+    critical_path_cost: Optional[float]
+
+
+@dataclass(frozen=True)
+class PlanCost:
+    steps: tuple[StepCost, ...]
+    critical_path_cost: Optional[float]
+    error: Optional[str] = None
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "critical_path_cost": self.critical_path_cost,
+            "error": self.error,
+            "steps": [
+                {
+                    "id": step.step_id,
+                    "cost": step.cost,
+                    "rows": step.rows,
+                    "critical_path_cost": step.critical_path_cost,
+                }
+                for step in self.steps
+            ],
+        }
+
+
+class PlanCostEstimator:
+    """Estimates plan costs, explaining each distinct (database, SQL) pair once."""
+
+    def __init__(self, explain: Optional[Explain] = None):
+        self._explain = explain or explain_query
+        self._explained: dict[tuple[str, str], Optional[Estimate]] = {}
+
+    def estimate(self, plan: TranslationReturn) -> PlanCost:
+        """Cost of every step and of the plan's critical path.
+
+        A step whose ``EXPLAIN`` fails would fail when run, so the plan gets
+        an ``error`` instead of a cost.
+        """
+        estimates: dict[int, Optional[Estimate]] = {}
+        critical: dict[int, Optional[float]] = {}
+        steps: list[StepCost] = []
+        try:
+            for step in plan.execution_plan:
+                reads = step_reads(step)
+                estimate = self._estimate_step(step, {i: estimates.get(i) for i in reads})
+                estimates[step.id] = estimate
+                upstream = [critical.get(i) for i in reads]
+                if estimate is None or any(cost is None for cost in upstream):
+                    critical[step.id] = None
+                else:
+                    critical[step.id] = estimate.cost + max(upstream, default=0.0)
+                steps.append(
+                    StepCost(
+                        step_id=step.id,
+                        cost=estimate.cost if estimate else None,
+                        rows=estimate.rows if estimate else None,
+                        critical_path_cost=critical[step.id],
+                    )
+                )
+        except Exception as e:
+            return PlanCost(steps=tuple(steps), critical_path_cost=None, error=f"{type(e).__name__}: {e}")
+
+        path_costs = list(critical.values())
+        total = None if not path_costs or None in path_costs else max(path_costs)
+        return PlanCost(steps=tuple(steps), critical_path_cost=total)
+
+    def _estimate_step(self, step, upstream: dict[int, Optional[Estimate]]) -> Optional[Estimate]:
+        try:
+            template = step.template
+        except ValueError as e:
+            raise ExecutionError(f"Step {step.id}: {e}") from e
+        url = add_url_driver(step.database)
+        if not template.slots:
+            return self._explain_once(url, template.source)
+
+        if any(upstream.get(slot.step_id) is None for slot in template.slots):
+            return None
+        fanout = min(upstream[slot.step_id].rows for slot in template.slots)
+        probe = self._explain_once(url, _render(template, open_lists=False), required=False)
+        if not any(slot.in_list for slot in template.slots):
+            return probe
+
+        unfiltered = self._explain_once(url, _render(template, open_lists=True))
+        if unfiltered is None:
+            return None
+        if probe is None:
+            return unfiltered
+        return Estimate(
+            cost=min(unfiltered.cost, max(fanout, 1.0) * probe.cost),
+            rows=min(unfiltered.rows, fanout * probe.rows),
+        )
+
+    def _explain_once(self, url: str, sql: str, required: bool = True) -> Optional[Estimate]:
+        key = (url, sql)
+        if key not in self._explained:
+            try:
+                self._explained[key] = self._explain(url, sql)
+            except Exception:
+                if required:
+                    raise
+                self._explained[key] = None
+        return self._explained[key]
+
+
+def explain_query(url: str, sql: str) -> Optional[Estimate]:
+    """Optimizer estimate of ``sql`` on ``url``; ``None`` for dialects without one."""
+    engine = get_engine_registry().get(url)
+    dialect = engine.dialect.name
+    sql = sql.strip().rstrip(";")
+    if dialect == "postgresql":
+        statement = f"EXPLAIN (FORMAT JSON) {sql}"
+    elif dialect in ("mysql", "mariadb"):
+        statement = f"EXPLAIN FORMAT=JSON {sql}"
+    else:
+        return None
+
+    with engine.connect() as conn:
+        document = conn.execute(text(statement)).scalar()
+    if isinstance(document, str):
+        document = json.loads(document)
+    if dialect == "postgresql":
+        return _postgres_estimate(document)
+    return _mysql_estimate(document)
+
+
+def select_plan(
+    candidates: list[TranslationReturn],
+    estimator: Optional[PlanCostEstimator] = None,
+    validator: Optional[PlanValidator] = None,
+) -> tuple[int, list[PlanCost]]:
+    """Index of the candidate with the cheapest critical path, and every candidate's cost.
+
+    Candidates that fail ``validator`` or whose ``EXPLAIN`` fails are never
+    chosen over one that passes; unestimated candidates rank after
+    estimated ones, and ties go to the earlier candidate.
+    """
+    if not candidates:
+        raise ValueError("No candidate plans to choose from")
+    estimator = estimator or PlanCostEstimator()
+
+    costs = []
+    for plan in candidates:
+        try:
+            if validator is not None:
+                validator.compile(plan)
+        except PlanValidationError as e:
+            costs.append(PlanCost(steps=(), critical_path_cost=None, error=str(e)))
+            continue
+        costs.append(estimator.estimate(plan))
+
+    def rank(index: int) -> tuple:
+        cost = costs[index]
+        return (cost.error is not None, cost.critical_path_cost is None, cost.critical_path_cost or 0.0, index)
+
+    chosen = min(range(len(candidates)), key=rank)
+    for index, cost in enumerate(costs):
+        mark = "👉" if index == chosen else "  "
+        detail = cost.error or (
+            f"critical path cost {cost.critical_path_cost:.1f}"
+            if cost.critical_path_cost is not None
+            else "cost unknown"
+        )
+        say(f"{mark} Candidate {index + 1}: {detail}")
+    return chosen, costs
+
+
+def _render(template: QueryTemplate, open_lists: bool) -> str:
+    def fragment(slot: Slot) -> str:
+        if open_lists and slot.in_list:
+            return " IS NOT NULL"
+        if slot.in_list:
+            return f"{slot.prefix}{_PROBE_LITERAL}{slot.suffix}"
+        return _PROBE_LITERAL
+
+    return template.render(fragment)
+
+
+def _postgres_estimate(document: Any) -> Estimate:
+    plan = document[0]["Plan"]
+    return Estimate(cost=float(plan["Total Cost"]), rows=float(plan["Plan Rows"]))
+
+
+def _mysql_estimate(document: Any) -> Estimate:
+    block = document["query_block"]
+    cost = float(block.get("cost_info", {}).get("query_cost", 0.0))
+    # Tables are listed in join order and each reports the rows its join
+    # produces, so the last one carries the estimate for the whole query.
+    tables = list(_mysql_tables(block))
+    rows = float(tables[-1].get("rows_produced_per_join", 1)) if tables else 1.0
+    return Estimate(cost=cost, rows=rows)
+
+
+def _mysql_tables(node: Any):
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key == "table" and isinstance(value, dict):
+                yield value
+            elif key not in ("attached_subqueries", "select_list_subqueries", "optimized_away_subqueries"):
+                yield from _mysql_tables(value)
+    elif isinstance(node, list):
+        for item in node:
+            yield from _mysql_tables(item)
@@ -1,284 +1,416 @@
-import re
+import contextvars
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from contextlib import contextmanager
-from typing import Dict, Optional
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, Optional, Sequence, Union
 import pandas as pd
-from sqlalchemy import create_engine, text
 from sqlalchemy.engine import Engine
 
 from src.models.execution_plan import ExecutionPlan
-from src.query_translation import FinalAggregationModel
+from src.plan_steps import (
+    ExecutionError,
+    ExecutionOptions,
+    check_dtype_backend,
+    count_placeholder_values,
+    enforce_step_schema,
+    finalize_results,
+    handle_joins,
+    join_chunks,
+    placeholder_slots,
+    prefiltered_template,
+    read_step,
+    read_step_chunks,
+    step_dependencies,
+    step_reads,
+    step_template,
+)
+from src.utils.column_types import ColumnTypeCatalog, compact_frame
+from src.utils.engine_registry import get_engine_registry
+from src.utils.instrumentation import (
+    ExecutionHooks,
+    PlanRecorder,
+    StepMetrics,
+    quiet_output,
+    say,
+    timer,
+)
 from src.utils.metadata_extraction import add_url_driver
+from src.utils.query_template import QueryTemplate, compile_query
+from src.utils.result_cache import StepCache
+from src.utils.result_store import ResultStore
+from src.utils.value_transport import SlotValues, ValueTransport, render_literal
 
-class ExecutionError(Exception):
-    pass
+if TYPE_CHECKING:
+    from src.plan_validation import PlanValidator
 
 @contextmanager
 def get_db_engines(databases: set[str]) -> Dict[str, Engine]:
-    engines = {}
-    try:
-        for db_url in databases:
-            engines[db_url] = create_engine(db_url)
-        yield engines
-    finally:
-        for engine in engines.values():
-            engine.dispose()
-
-def execute_plan(plan: ExecutionPlan) -> pd.DataFrame:
-    partial_results: Dict[int, pd.DataFrame] = {}
-    
+    # Engines are owned by the process-wide registry and stay pooled after the
+    # plan finishes; see src.utils.engine_registry for disposal.
+    registry = get_engine_registry()
+    yield {db_url: registry.get(db_url) for db_url in databases}
+
+def execute_plan(
+    plan: ExecutionPlan,
+    parallel: bool = False,
+    max_workers: int = 8,
+    max_concurrency_per_db: int = 2,
+    chunksize: Optional[int] = None,
+    memory_budget_mb: Optional[float] = None,
+    value_transport: Union[str, ValueTransport] = "auto",
+    semi_join_pushdown: bool = False,
+    cache: Optional[StepCache] = None,
+    dtype_backend: str = "numpy",
+    column_types: Optional[ColumnTypeCatalog] = None,
+    spill_threshold_mb: Optional[float] = None,
+    spill_dir: Optional[Union[str, Path]] = None,
+    hooks: Union[ExecutionHooks, Sequence[ExecutionHooks], None] = None,
+    quiet: bool = False,
+    label: Optional[str] = None,
+    validator: Optional["PlanValidator"] = None,
+) -> pd.DataFrame:
+    """Execute every step of ``plan`` and return the finalized result.
+
+    When ``chunksize`` is set, steps are fetched through server-side cursors
+    and joined chunk by chunk; ``memory_budget_mb`` then caps the size of each
+    step's accumulated result. ``value_transport`` selects how ``$stepN``
+    values reach the database (see ``src.utils.value_transport``), and
+    ``semi_join_pushdown`` prefilters INNER/LEFT join steps with a summary of
+    the dependency's join keys (see ``src.utils.semi_join``). Non-streaming
+    step results are looked up in and stored to ``cache`` when one is given.
+    ``dtype_backend`` picks the dtypes of step results: ``numpy`` (pandas'
+    defaults), ``pyarrow`` or ``schema``, which uses the catalog types in
+    ``column_types`` (see ``src.utils.column_types``).
+
+    Each step result is dropped once every step reading it has finished.
+    With ``spill_threshold_mb`` set, results held past that size are spilled
+    to Arrow files under ``spill_dir`` (see ``src.utils.result_store``).
+
+    Per-step timings, row counts and sizes go to ``hooks`` as steps finish,
+    and the plan's totals once it ends, tagged with ``label`` (see
+    ``src.utils.instrumentation``). ``quiet`` silences the progress output.
+
+    With a ``validator``, the plan is first checked against its metadata
+    catalog, raising ``PlanValidationError`` before any database is touched;
+    its warnings are printed (see ``src.plan_validation``).
+    """
+    check_dtype_backend(dtype_backend, column_types)
+    if validator is not None:
+        compiled = validator.compile(plan)
+        with quiet_output(quiet):
+            for warning in compiled.warnings:
+                say(f"⚠️ {warning}")
+    options = ExecutionOptions(
+        chunksize=chunksize,
+        memory_budget_mb=memory_budget_mb,
+        value_transport=value_transport,
+        semi_join_pushdown=semi_join_pushdown,
+        cache=cache,
+        dtype_backend=dtype_backend,
+        column_types=column_types,
+    )
     db_urls = {add_url_driver(step.database) for step in plan.execution_plan}
+    last_step_id = plan.execution_plan[-1].id
+    final_columns = _final_columns(plan)
+    partial_results = ResultStore(
+        dependencies={step.id: step_reads(step) for step in plan.execution_plan},
+        keep={last_step_id},
+        spill_threshold_mb=spill_threshold_mb,
+        spill_dir=spill_dir,
+    )
     
-    with get_db_engines(db_urls) as db_engines:
-        for step in plan.execution_plan:
-            print("-" * 40)
-            print(f"▶️ Executing Step {step.id}: {step.description}")
-            
-            query = _replace_placeholders(step.query, partial_results)
-            current_df = _execute_query(step, query, db_engines)
-            
-            final_step_df = _handle_joins(step, current_df, partial_results)
-            
-            partial_results[step.id] = final_step_df
-
-    print("-" * 40)
-    
-    final_df = partial_results[plan.execution_plan[-1].id]
-    return _finalize_results(final_df, plan)
+    recorder = PlanRecorder(hooks, label=label)
 
+    def run_step(step) -> pd.DataFrame:
+        with recorder.step(step, streamed=options.chunksize is not None) as metrics:
+            if options.chunksize is None:
+                df = _execute_step(step, partial_results, db_engines, options, metrics)
+            else:
+                df = _execute_step_streaming(
+                    step,
+                    partial_results,
+                    db_engines,
+                    options,
+                    keep_columns=final_columns if step.id == last_step_id else None,
+                    metrics=metrics,
+                )
+            metrics.observe(df)
+        return df
 
-def _execute_query(step, query: str, db_engines: Dict[str, Engine]) -> pd.DataFrame:
-    db_url = add_url_driver(step.database)
-    engine = db_engines[db_url]
-    
-    print(f"Executing {step.id} on database: {db_url}")
-    
     try:
-        with engine.connect() as conn:
-            df = pd.read_sql(text(query), conn)
-            df = _enforce_step_schema(df, step)
-        print(f"✅ Step executed successfully - Returned {len(df)} rows.")
-        return df
+        with quiet_output(quiet), partial_results, get_db_engines(db_urls) as db_engines:
+            if parallel:
+                _execute_steps_parallel(
+                    plan.execution_plan,
+                    partial_results,
+                    run_step,
+                    max_workers=max_workers,
+                    max_concurrency_per_db=max_concurrency_per_db,
+                    on_ready=recorder.mark_ready,
+                )
+            else:
+                for step in plan.execution_plan:
+                    partial_results[step.id] = run_step(step)
+
+            say("-" * 40)
+
+            final_df = partial_results[last_step_id]
+            with timer(recorder.plan, "aggregation_s"):
+                result = finalize_results(final_df, plan)
     except Exception as e:
-        raise ExecutionError(
-            f"Failed to execute step {step.id} on database {db_url}: {e}"
-        ) from e
+        recorder.end_plan(error=e)
+        raise
+    recorder.end_plan(result)
+    return result
+
 
-def _handle_joins(
-    step, 
-    current_df: pd.DataFrame, 
-    partial_results: Dict[int, pd.DataFrame]
+def _execute_step(
+    step,
+    partial_results: Dict[int, pd.DataFrame],
+    db_engines: Dict[str, Engine],
+    options: ExecutionOptions = ExecutionOptions(),
+    metrics: Optional[StepMetrics] = None,
 ) -> pd.DataFrame:
-    """Handle joining current results with dependencies."""
-    if not (step.depends_on and step.join_info):
-        return current_df
+    say("-" * 40)
+    say(f"▶️ Executing Step {step.id}: {step.description}")
     
-    print("-" * 40)
-    print(f"▶️ Joining results with step(s): {step.depends_on}")
-    
-    dep_id = step.depends_on[0]
-    if dep_id not in partial_results:
-        raise ExecutionError(f"Step {step.id} depends on step {dep_id} which hasn't been executed")
-    
-    dep_df = partial_results[dep_id]
-    
-    left_col = step.join_info.on["dependency_step_column"]
-    right_col = step.join_info.on["current_step_column"]
-    
-    if left_col not in dep_df.columns:
-        raise ExecutionError(f"Join column '{left_col}' not found in step {dep_id} results")
-    if right_col not in current_df.columns:
-        raise ExecutionError(f"Join column '{right_col}' not found in step {step.id} results")
-    
-    joined_df = pd.merge(
-        left=dep_df,
-        right=current_df,
-        how=step.join_info.type.lower(),
-        left_on=left_col,
-        right_on=right_col,
-    )
-    
-    print(f"✅ Join resulted in {len(joined_df)} rows.")
-    return joined_df
-
-def _replace_placeholders(query: str, partial_results: dict[int, pd.DataFrame]) -> str:
-    placeholders = re.findall(r"(\$step\d+).(\w+)", query)
-    for step_ref, col in placeholders:
-        dep_id_str = step_ref.replace("$step", "")
-        if not dep_id_str.isdigit():
-            raise ExecutionError(f"Invalid placeholder '{step_ref}.{col}' in query")
-        
-        dep_id = int(dep_id_str)
-        
-        if dep_id not in partial_results:
-            raise ExecutionError(f"Referenced step {dep_id} not found in results")
-        
-        dep_df = partial_results[dep_id]
-        
-        if col not in dep_df.columns:
-            raise ExecutionError(f"Column '{col}' not found in step {dep_id} results")
-        
-        values_sql = _format_column_values(dep_df[col])
-        query = query.replace(f"{step_ref}.{col}", values_sql)
+    template = step_template(step)
+    with timer(metrics, "prepare_s"):
+        slots = placeholder_slots(template, partial_results)
+        prefiltered = prefiltered_template(step, template, partial_results, db_engines, options)
+    count_placeholder_values(metrics, slots)
+    try:
+        current_df = _execute_query(step, prefiltered, db_engines, slots, options, metrics)
+    except ExecutionError as e:
+        if prefiltered is template:
+            raise
+        say(f"⚠️ Semi-join prefilter failed, retrying step {step.id} without it: {e}")
+        current_df = _execute_query(step, template, db_engines, slots, options, metrics)
     
-    return query
+    if metrics is not None:
+        metrics.query_rows = len(current_df)
+    with timer(metrics, "join_s"):
+        return handle_joins(step, current_df, partial_results)
 
-def _format_column_values(series: pd.Series) -> str:
-    dtype = series.dtype
-    values = series.dropna().unique()
-    
-    if len(values) == 0:
-        return 'NULL'
-    
-    if pd.api.types.is_string_dtype(dtype) or pd.api.types.is_datetime64_any_dtype(dtype):
-        values_list = [
-            "'" + str(v).replace("'", "''") + "'" 
-            for v in values
-        ]
-    else:
-        values_list = [str(v) for v in values]
-    
-    return ', '.join(values_list)
 
-def _finalize_results(
-    df: pd.DataFrame, 
-    plan: ExecutionPlan
+def _execute_step_streaming(
+    step,
+    partial_results: Dict[int, pd.DataFrame],
+    db_engines: Dict[str, Engine],
+    options: ExecutionOptions,
+    keep_columns: Optional[list[str]] = None,
+    metrics: Optional[StepMetrics] = None,
 ) -> pd.DataFrame:
-    if plan.final_aggregation:
-        df = _aggregate_results(df, plan.final_aggregation, plan.final_output_columns)
-    
-    if plan.final_output_columns:
-        existing_cols = [col for col in plan.final_output_columns if col in df.columns]
-        if not existing_cols:
+    say("-" * 40)
+    say(f"▶️ Executing Step {step.id} (streaming): {step.description}")
+
+    template = step_template(step)
+    with timer(metrics, "prepare_s"):
+        slots = placeholder_slots(template, partial_results)
+        prefiltered = prefiltered_template(step, template, partial_results, db_engines, options)
+    count_placeholder_values(metrics, slots)
+
+    def stream(t: QueryTemplate) -> Iterator[pd.DataFrame]:
+        return _execute_query_chunks(step, t, db_engines, slots, options, metrics)
+
+    chunks = stream(prefiltered)
+    if prefiltered is not template:
+        chunks = _unfiltered_on_failure(step, chunks, lambda: stream(template))
+    joined_chunks = join_chunks(step, chunks, partial_results, metrics)
+
+    memory_budget_mb = options.memory_budget_mb
+    budget_bytes = memory_budget_mb * 1024 * 1024 if memory_budget_mb else None
+    parts: list[pd.DataFrame] = []
+    used_bytes = 0
+    for chunk in joined_chunks:
+        if keep_columns:
+            kept = [col for col in keep_columns if col in chunk.columns]
+            if kept:
+                chunk = chunk[kept]
+
+        used_bytes += int(chunk.memory_usage(index=False, deep=True).sum())
+        if budget_bytes is not None and used_bytes > budget_bytes:
             raise ExecutionError(
-                f"None of the requested output columns {plan.final_output_columns} "
-                f"found in final results"
+                f"Step {step.id} exceeded its memory budget of {memory_budget_mb} MB"
             )
-        df = df[existing_cols]
-    
+        parts.append(chunk)
+
+    df = pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0]
+    say(f"✅ Step streamed successfully - Kept {len(df)} rows in {len(parts)} chunk(s).")
     return df
 
 
-def _aggregate_results(
-    df: pd.DataFrame, 
-    aggregation_info: FinalAggregationModel,
-    final_output_columns: Optional[list[str]]
-) -> pd.DataFrame:
-    agg_type = (aggregation_info.type or "NONE").upper()
-    agg_column = aggregation_info.column
-    distinct = bool(getattr(aggregation_info, "distinct", False))
-    
-    if agg_type == "NONE":
-        return df
-    
-    if not agg_column:
-        raise ExecutionError(f"Aggregation column not specified for type {agg_type}")
-    
-    if agg_column not in df.columns:
-        if final_output_columns and all(col in df.columns for col in final_output_columns):
-            return df[final_output_columns]
-        raise ExecutionError(f"Aggregation column '{agg_column}' not found in DataFrame")
-    
-    group_by_cols: list[str] = []
-    if final_output_columns:
-        group_by_cols = [
-            col for col in final_output_columns
-            if col != agg_column and col in df.columns
-        ]
-    
-    if not group_by_cols:
-        return _global_aggregation(df, agg_type, agg_column, final_output_columns, distinct)
-    else:
-        return _grouped_aggregation(df, agg_type, agg_column, group_by_cols)
-
-
-def _global_aggregation(
-    df: pd.DataFrame,
-    agg_type: str,
-    agg_column: str,
-    final_output_columns: Optional[list[str]],
-    distinct: bool = False
-) -> pd.DataFrame:
-    s = df[agg_column] 
-    if distinct:
-        s = s.dropna().drop_duplicates()
-        
-    agg_functions = {
-        "COUNT": lambda x: x.nunique(dropna=True) if not distinct else len(x),  
-        "SUM": lambda s: s.sum(),
-        "AVG": lambda s: s.mean(),
-        "MAX": lambda s: s.max(),
-        "MIN": lambda s: s.min(),
+def _unfiltered_on_failure(
+    step,
+    chunks: Iterator[pd.DataFrame],
+    unfiltered: Callable[[], Iterator[pd.DataFrame]],
+) -> Iterator[pd.DataFrame]:
+    try:
+        first = next(chunks)
+    except StopIteration:
+        return
+    except ExecutionError as e:
+        say(f"⚠️ Semi-join prefilter failed, retrying step {step.id} without it: {e}")
+        yield from unfiltered()
+        return
+
+    yield first
+    yield from chunks
+
+
+def _execute_steps_parallel(
+    steps: list,
+    partial_results: Dict[int, pd.DataFrame],
+    run_step: Callable[[object], pd.DataFrame],
+    max_workers: int,
+    max_concurrency_per_db: int,
+    on_ready: Optional[Callable[[int], None]] = None,
+) -> None:
+    """Run every step as soon as its dependencies finish.
+
+    Dispatch happens on the calling thread, so a step only occupies a worker
+    once its database is below ``max_concurrency_per_db`` in-flight queries.
+    ``on_ready`` is called with each step id once its dependencies are done.
+    """
+    if max_workers < 1 or max_concurrency_per_db < 1:
+        raise ExecutionError("max_workers and max_concurrency_per_db must be at least 1")
+
+    step_ids = {step.id for step in steps}
+    waiting_on = {
+        step.id: (step_dependencies(step) & step_ids) - {step.id}
+        for step in steps
     }
-    
-    if agg_type not in agg_functions:
-        raise ExecutionError(f"Unsupported global aggregation type: {agg_type}")
-    
-    result_val = agg_functions[agg_type](s)
-    
-    if final_output_columns and len(final_output_columns) == 1:
-        col_name = final_output_columns[0]
-    else:
-        suffix = f"{agg_type.lower()}{'_distinct' if distinct else ''}"
-        col_name = f"{agg_column}_{suffix}"
+    pending = list(steps)
+    running: Dict[Future, object] = {}
+    in_flight: Counter = Counter()
+    announced: set[int] = set()
 
-    return pd.DataFrame({col_name: [result_val]})
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while pending or running:
+            for step in list(pending):
+                if waiting_on[step.id]:
+                    continue
+                if on_ready is not None and step.id not in announced:
+                    announced.add(step.id)
+                    on_ready(step.id)
+                db_url = add_url_driver(step.database)
+                if in_flight[db_url] >= max_concurrency_per_db:
+                    continue
+                pending.remove(step)
+                in_flight[db_url] += 1
+                # Workers inherit the caller's context, e.g. quiet output.
+                context = contextvars.copy_context()
+                running[pool.submit(context.run, run_step, step)] = step
 
+            if not running:
+                blocked = [step.id for step in pending]
+                raise ExecutionError(f"Circular dependency between steps {blocked}")
 
-def _grouped_aggregation(
-    df: pd.DataFrame,
-    agg_type: str,
-    agg_column: str,
-    group_by_cols: list[str],
-    distinct: bool = False
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                step = running.pop(future)
+                in_flight[add_url_driver(step.database)] -= 1
+                try:
+                    partial_results[step.id] = future.result()
+                except Exception:
+                    for other in running:
+                        other.cancel()
+                    raise
+                for deps in waiting_on.values():
+                    deps.discard(step.id)
+
+
+def _execute_query(
+    step,
+    template: QueryTemplate,
+    db_engines: Dict[str, Engine],
+    slots: Optional[Dict[str, SlotValues]] = None,
+    options: ExecutionOptions = ExecutionOptions(),
+    metrics: Optional[StepMetrics] = None,
 ) -> pd.DataFrame:
-    grouped = df.groupby(group_by_cols, dropna=False)[agg_column]
-    if agg_type == "COUNT":
-        if distinct:
-            result_df = grouped.nunique(dropna=True).reset_index(name=agg_column)
-        else:
-            result_df = grouped.count().reset_index(name=agg_column)
-            
-        return result_df
-    
-    if distinct:
-        grouped = grouped.apply(lambda s: s.dropna().drop_duplicates())
-
-    agg_functions = {
-        "SUM": lambda s: s.sum(),
-        "AVG": lambda s: s.mean(),
-        "MAX": lambda s: s.max(),
-        "MIN": lambda s: s.min(),
-    }
+    db_url = add_url_driver(step.database)
+    engine = db_engines[db_url]
+    cache = options.cache
     
-    if agg_type not in agg_functions:
-        raise ExecutionError(f"Unsupported grouped aggregation type: {agg_type}")
+    if cache is not None:
+        cache_sql = render_literal(template, slots or {})
+        cached_df = cache.get(db_url, cache_sql)
+        if cached_df is not None:
+            if metrics is not None:
+                metrics.cache_hit = True
+            say(f"♻️ Step {step.id} served from cache - Returned {len(cached_df)} rows.")
+            cached_df = compact_frame(cached_df, options.dtype_backend, step, options.column_types)
+            return enforce_step_schema(cached_df, step)
     
-    result_df = agg_functions[agg_type](grouped[agg_column]).reset_index()
+    say(f"Executing {step.id} on database: {db_url}")
     
-    if agg_type not in agg_functions:
-        raise ExecutionError(f"Unsupported grouped aggregation type: {agg_type}")
-
-    result_series = grouped.apply(agg_functions[agg_type])
-    result_df = result_series.reset_index(name=agg_column)
-    return result_df
-
-def _enforce_step_schema(df: pd.DataFrame, step) -> pd.DataFrame:
-    if not step.output_columns:
+    try:
+        with _connect(engine, metrics) as conn:
+            df = read_step(conn, template, slots, options, metrics)
+            if cache is not None:
+                cache.put(db_url, cache_sql, df)
+            df = compact_frame(df, options.dtype_backend, step, options.column_types)
+            df = enforce_step_schema(df, step)
+        say(f"✅ Step executed successfully - Returned {len(df)} rows.")
         return df
+    except Exception as e:
+        raise ExecutionError(
+            f"Failed to execute step {step.id} on database {db_url}: {e}"
+        ) from e
+
+def _execute_query_chunks(
+    step,
+    template: QueryTemplate,
+    db_engines: Dict[str, Engine],
+    slots: Optional[Dict[str, SlotValues]] = None,
+    options: ExecutionOptions = ExecutionOptions(),
+    metrics: Optional[StepMetrics] = None,
+) -> Iterator[pd.DataFrame]:
+    db_url = add_url_driver(step.database)
+    engine = db_engines[db_url]
+    chunksize = options.chunksize
 
-    expected = [c["alias"] if isinstance(c, dict) else c.alias for c in step.output_columns]
-    missing = [c for c in expected if c not in df.columns]
-    extra = [c for c in df.columns if c not in expected]
+    say(f"Streaming {step.id} on database: {db_url} (chunksize={chunksize})")
 
-    if missing:
+    try:
+        with _connect(engine, metrics) as conn:
+            conn = conn.execution_options(stream_results=True, yield_per=chunksize)
+            yield from read_step_chunks(conn, step, template, slots, options, metrics)
+    except ExecutionError:
+        raise
+    except Exception as e:
         raise ExecutionError(
-            f"Step {step.id} returned unexpected schema. Missing columns: {missing}. "
-            f"Got: {list(df.columns)}"
-        )
+            f"Failed to execute step {step.id} on database {db_url}: {e}"
+        ) from e
+
+@contextmanager
+def _connect(engine: Engine, metrics: Optional[StepMetrics]):
+    with timer(metrics, "connect_s"):
+        conn = engine.connect()
+    with conn:
+        yield conn
+
+def _replace_placeholders(query: str, partial_results: dict[int, pd.DataFrame]) -> str:
+    try:
+        template = compile_query(query)
+    except ValueError as e:
+        raise ExecutionError(str(e)) from e
+    return render_literal(template, placeholder_slots(template, partial_results))
+
+def _format_column_values(series: pd.Series) -> str:
+    return SlotValues.from_series(series).literal
 
-    df = df[expected]
+def _final_columns(plan: ExecutionPlan) -> Optional[list[str]]:
+    """Columns of the last step that finalization can read, if known."""
+    if not plan.final_output_columns:
+        return None
 
-    if extra:
-        print(f"ℹ️ Step {step.id}: ignoring extra columns: {extra}")
+    columns = list(plan.final_output_columns)
+    aggregation = plan.final_aggregation
+    if aggregation:
+        for col in [aggregation.column, *getattr(aggregation, "group_by", [])]:
+            if col and col not in columns:
+                columns.append(col)
+    return columns
 
-    return df
\ No newline at end of file
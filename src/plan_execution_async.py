@@ -0,0 +1,278 @@
+"""``execute_plan`` on SQLAlchemy's asyncio engines.
+
+Steps run as tasks on the caller's event loop as soon as their dependencies
+finish, so many plans can share one loop without a thread per connection.
+Queries go through the same transports, caches and dtype handling as the
+synchronous executor (``pd.read_sql`` runs inside ``AsyncConnection.run_sync``),
+and joins and finalization are the synchronous executor's code from
+``src.plan_steps``, so results and ``ExecutionError`` semantics match
+``execute_plan``.
+"""
+
+import asyncio
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Optional, Sequence, Union
+
+import pandas as pd
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from src.models.execution_plan import ExecutionPlan
+from src.plan_steps import (
+    ExecutionError,
+    ExecutionOptions,
+    check_dtype_backend,
+    count_placeholder_values,
+    enforce_step_schema,
+    finalize_results,
+    handle_joins,
+    placeholder_slots,
+    prefiltered_template,
+    read_step,
+    step_dependencies,
+    step_reads,
+    step_template,
+)
+from src.plan_validation import PlanValidator
+from src.utils.column_types import ColumnTypeCatalog, compact_frame
+from src.utils.engine_registry import AsyncEngineRegistry
+from src.utils.instrumentation import (
+    ExecutionHooks,
+    PlanRecorder,
+    StepMetrics,
+    quiet_output,
+    say,
+    timer,
+)
+from src.utils.metadata_extraction import add_url_driver
+from src.utils.query_template import QueryTemplate
+from src.utils.result_cache import StepCache
+from src.utils.result_store import ResultStore
+from src.utils.value_transport import SlotValues, ValueTransport, render_literal
+
+
+async def execute_plan_async(
+    plan: ExecutionPlan,
+    max_concurrency_per_db: int = 2,
+    value_transport: Union[str, ValueTransport] = "auto",
+    semi_join_pushdown: bool = False,
+    cache: Optional[StepCache] = None,
+    dtype_backend: str = "numpy",
+    column_types: Optional[ColumnTypeCatalog] = None,
+    spill_threshold_mb: Optional[float] = None,
+    spill_dir: Optional[Union[str, Path]] = None,
+    engines: Optional[AsyncEngineRegistry] = None,
+    hooks: Union[ExecutionHooks, Sequence[ExecutionHooks], None] = None,
+    quiet: bool = False,
+    label: Optional[str] = None,
+    validator: Optional[PlanValidator] = None,
+) -> pd.DataFrame:
+    """Execute ``plan`` on async engines; the options mean what they do for ``execute_plan``.
+
+    Independent steps always run concurrently, at most
+    ``max_concurrency_per_db`` at a time per database. Engines come from
+    ``engines``, which the caller closes with ``aclose`` on the same loop;
+    without it the plan gets engines of its own, closed before it returns.
+    """
+    check_dtype_backend(dtype_backend, column_types)
+    if validator is not None:
+        compiled = validator.compile(plan)
+        with quiet_output(quiet):
+            for warning in compiled.warnings:
+                say(f"⚠️ {warning}")
+    if max_concurrency_per_db < 1:
+        raise ExecutionError("max_concurrency_per_db must be at least 1")
+
+    options = ExecutionOptions(
+        value_transport=value_transport,
+        semi_join_pushdown=semi_join_pushdown,
+        cache=cache,
+        dtype_backend=dtype_backend,
+        column_types=column_types,
+    )
+    # A registry with no engines yet is falsy (it has a length).
+    registry = engines if engines is not None else AsyncEngineRegistry()
+    try:
+        return await _execute_plan_on(
+            plan, registry, options, max_concurrency_per_db, spill_threshold_mb, spill_dir,
+            hooks, quiet, label,
+        )
+    finally:
+        if engines is None:
+            await registry.aclose()
+
+
+async def _execute_plan_on(
+    plan: ExecutionPlan,
+    registry: AsyncEngineRegistry,
+    options: ExecutionOptions,
+    max_concurrency_per_db: int,
+    spill_threshold_mb: Optional[float],
+    spill_dir: Optional[Union[str, Path]],
+    hooks: Union[ExecutionHooks, Sequence[ExecutionHooks], None],
+    quiet: bool,
+    label: Optional[str],
+) -> pd.DataFrame:
+    db_engines = {
+        add_url_driver(step.database): registry.get(step.database) for step in plan.execution_plan
+    }
+    last_step_id = plan.execution_plan[-1].id
+    partial_results = ResultStore(
+        dependencies={step.id: step_reads(step) for step in plan.execution_plan},
+        keep={last_step_id},
+        spill_threshold_mb=spill_threshold_mb,
+        spill_dir=spill_dir,
+    )
+
+    recorder = PlanRecorder(hooks, label=label)
+
+    async def run_step(step) -> pd.DataFrame:
+        with recorder.step(step) as metrics:
+            df = await _execute_step_async(step, partial_results, db_engines, options, metrics)
+            metrics.observe(df)
+        return df
+
+    try:
+        # Tasks copy the current context when created, so they inherit quiet output.
+        with quiet_output(quiet), partial_results:
+            await _execute_steps_async(
+                plan.execution_plan,
+                partial_results,
+                run_step,
+                max_concurrency_per_db,
+                on_ready=recorder.mark_ready,
+            )
+            say("-" * 40)
+
+            final_df = partial_results[last_step_id]
+            with timer(recorder.plan, "aggregation_s"):
+                result = finalize_results(final_df, plan)
+    except Exception as e:
+        recorder.end_plan(error=e)
+        raise
+    recorder.end_plan(result)
+    return result
+
+
+async def _execute_steps_async(
+    steps: list,
+    partial_results: ResultStore,
+    run_step: Callable[[object], Awaitable[pd.DataFrame]],
+    max_concurrency_per_db: int,
+    on_ready: Optional[Callable[[int], None]] = None,
+) -> None:
+    step_ids = {step.id for step in steps}
+    waiting_on = {
+        step.id: (step_dependencies(step) & step_ids) - {step.id}
+        for step in steps
+    }
+    _check_acyclic(waiting_on)
+
+    limits: Dict[str, asyncio.Semaphore] = {}
+    for step in steps:
+        limits.setdefault(add_url_driver(step.database), asyncio.Semaphore(max_concurrency_per_db))
+
+    tasks: Dict[int, asyncio.Task] = {}
+
+    async def run(step) -> None:
+        for dep_id in waiting_on[step.id]:
+            await tasks[dep_id]
+        if on_ready is not None:
+            on_ready(step.id)
+        async with limits[add_url_driver(step.database)]:
+            partial_results[step.id] = await run_step(step)
+
+    for step in steps:
+        tasks[step.id] = asyncio.create_task(run(step))
+    try:
+        await asyncio.gather(*tasks.values())
+    except BaseException:
+        for task in tasks.values():
+            task.cancel()
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+        raise
+
+
+def _check_acyclic(waiting_on: Dict[int, set[int]]) -> None:
+    remaining = {step_id: set(deps) for step_id, deps in waiting_on.items()}
+    while remaining:
+        ready = [step_id for step_id, deps in remaining.items() if not deps]
+        if not ready:
+            raise ExecutionError(f"Circular dependency between steps {list(remaining)}")
+        for step_id in ready:
+            del remaining[step_id]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+
+
+async def _execute_step_async(
+    step,
+    partial_results: ResultStore,
+    db_engines: Dict[str, AsyncEngine],
+    options: ExecutionOptions,
+    metrics: Optional[StepMetrics] = None,
+) -> pd.DataFrame:
+    say("-" * 40)
+    say(f"▶️ Executing Step {step.id}: {step.description}")
+
+    template = step_template(step)
+    with timer(metrics, "prepare_s"):
+        slots = placeholder_slots(template, partial_results)
+        prefiltered = prefiltered_template(step, template, partial_results, db_engines, options)
+    count_placeholder_values(metrics, slots)
+    try:
+        current_df = await _execute_query_async(
+            step, prefiltered, db_engines, slots, options, metrics
+        )
+    except ExecutionError as e:
+        if prefiltered is template:
+            raise
+        say(f"⚠️ Semi-join prefilter failed, retrying step {step.id} without it: {e}")
+        current_df = await _execute_query_async(step, template, db_engines, slots, options, metrics)
+
+    if metrics is not None:
+        metrics.query_rows = len(current_df)
+    with timer(metrics, "join_s"):
+        return handle_joins(step, current_df, partial_results)
+
+
+async def _execute_query_async(
+    step,
+    template: QueryTemplate,
+    db_engines: Dict[str, AsyncEngine],
+    slots: Dict[str, SlotValues],
+    options: ExecutionOptions,
+    metrics: Optional[StepMetrics] = None,
+) -> pd.DataFrame:
+    db_url = add_url_driver(step.database)
+    engine = db_engines[db_url]
+    cache = options.cache
+
+    if cache is not None:
+        cache_sql = render_literal(template, slots)
+        cached_df = cache.get(db_url, cache_sql)
+        if cached_df is not None:
+            if metrics is not None:
+                metrics.cache_hit = True
+            say(f"♻️ Step {step.id} served from cache - Returned {len(cached_df)} rows.")
+            cached_df = compact_frame(cached_df, options.dtype_backend, step, options.column_types)
+            return enforce_step_schema(cached_df, step)
+
+    say(f"Executing {step.id} on database: {db_url} (async)")
+
+    try:
+        connecting = time.perf_counter()
+        async with engine.connect() as conn:
+            if metrics is not None:
+                metrics.connect_s += time.perf_counter() - connecting
+            df = await conn.run_sync(read_step, template, slots, options, metrics)
+        if cache is not None:
+            cache.put(db_url, cache_sql, df)
+        df = compact_frame(df, options.dtype_backend, step, options.column_types)
+        df = enforce_step_schema(df, step)
+        say(f"✅ Step executed successfully - Returned {len(df)} rows.")
+        return df
+    except Exception as e:
+        raise ExecutionError(
+            f"Failed to execute step {step.id} on database {db_url}: {e}"
+        ) from e
@@ -0,0 +1,238 @@
+"""Plan rewrites that move work from pandas into the source databases.
+
+``rewrite_plan`` folds the final aggregation and projection into the SQL of
+the last step when that step alone makes up the final frame, and prunes
+columns nobody reads from the steps of multi-step plans. Rewrites are only
+applied where the database computes exactly what pandas would.
+"""
+
+import re
+from typing import Callable, Optional
+
+import pandas as pd
+from sqlalchemy.engine import make_url
+
+from src.models.execution_plan import ExecutionPlan
+from src.plan_execution import execute_plan
+from src.plan_steps import ExecutionError, aggregate_names, aggregation_types, group_by_columns
+from src.query_translation import FinalAggregationModel, TranslationReturn
+from src.utils.engine_registry import get_engine_registry
+from src.utils.instrumentation import quiet_output, say
+from src.utils.metadata_extraction import add_url_driver
+
+ColumnsProbe = Callable[[ExecutionPlan], Optional[list[str]]]
+
+_ALL_TYPES = frozenset({"COUNT", "SUM", "AVG", "MIN", "MAX"})
+
+# String comparison is case-insensitive by default in MySQL and SQL Server,
+# and PostgreSQL orders strings by locale, so grouping, DISTINCT and MIN/MAX
+# are only pushed where they cannot change the answer.
+_PUSHABLE = {
+    "sqlite": (True, _ALL_TYPES),
+    "postgresql": (True, frozenset({"COUNT", "SUM", "AVG"})),
+}
+_DEFAULT_PUSHABLE = (False, frozenset({"COUNT", "SUM", "AVG"}))
+
+# pandas averages into floats; AVG over integers is NUMERIC/DECIMAL elsewhere.
+_AVG_CASTS = {"postgresql": "DOUBLE PRECISION", "mysql": "DOUBLE", "mssql": "FLOAT"}
+
+# Dialects that keep the row order of an ORDER BY inside a derived table.
+_ORDER_PRESERVING = {"sqlite", "postgresql"}
+_ORDER_BY_RE = re.compile(r"\bORDER\s+BY\b", re.IGNORECASE)
+
+
+def rewrite_plan(plan: TranslationReturn, probe: Optional[ColumnsProbe] = None) -> TranslationReturn:
+    """Return ``plan`` with aggregation and projections pushed down, or ``plan`` itself.
+
+    Steps without ``output_columns`` are asked for their columns through
+    ``probe`` (by default a zero-row query) before an aggregation is folded
+    into them.
+    """
+    probe = probe or probe_columns
+    rewritten = plan.model_copy(deep=True)
+
+    changed = _push_final_aggregation(rewritten, probe)
+    changed = _push_projections(rewritten) or changed
+    return rewritten if changed else plan
+
+
+def execute_rewritten(plan: TranslationReturn, **options) -> pd.DataFrame:
+    """``execute_plan`` on the rewritten plan, falling back to the original on failure."""
+    with quiet_output(options.get("quiet", False)):
+        rewritten = rewrite_plan(plan)
+        if rewritten is plan:
+            return execute_plan(plan, **options)
+
+        try:
+            return execute_plan(rewritten, **options)
+        except ExecutionError as e:
+            say(f"⚠️ Pushed-down plan failed, running the original plan: {e}")
+            return execute_plan(plan, **options)
+
+
+def probe_columns(step: ExecutionPlan) -> Optional[list[str]]:
+    """Result columns of a step without placeholders, from a query returning no rows."""
+    try:
+        if step.template.slots:
+            return None
+    except ValueError:
+        return None
+
+    engine = get_engine_registry().get(add_url_driver(step.database))
+    if engine.dialect.name == "sqlite":
+        # SQLite names a bare column by its declared spelling in a plain SELECT
+        # but by the query's spelling inside a derived table, so a wrapped
+        # probe can disagree with the columns the step really returns.
+        return None
+
+    sql = f"SELECT * FROM (\n{_strip_semicolon(step.query)}\n) AS monk_probe WHERE 1 = 0"
+    try:
+        with engine.connect() as conn:
+            return list(conn.exec_driver_sql(sql).keys())
+    except Exception:
+        return None
+
+
+def _push_final_aggregation(plan: TranslationReturn, probe: ColumnsProbe) -> bool:
+    step = plan.execution_plan[-1]
+    if step.depends_on and step.join_info:
+        return False
+
+    aggregation = plan.final_aggregation
+    try:
+        agg_types = aggregation_types(aggregation.type if aggregation else None)
+    except ExecutionError:
+        return False
+    if not agg_types:
+        return _push_final_projection(plan, step)
+
+    columns = _step_columns(step) or probe(step)
+    agg_column = aggregation.column
+    if not columns or not agg_column or agg_column not in columns:
+        return False
+
+    dialect = _dialect(step)
+    allows_grouping, pushable_types = _PUSHABLE.get(dialect.name, _DEFAULT_PUSHABLE)
+    distinct = bool(aggregation.distinct)
+    try:
+        group_by_cols = group_by_columns(
+            pd.DataFrame(columns=columns), aggregation, plan.final_output_columns
+        )
+    except ExecutionError:
+        return False
+    if (group_by_cols or distinct) and not allows_grouping:
+        return False
+    if not set(agg_types) <= pushable_types:
+        return False
+
+    names = aggregate_names(
+        agg_types, agg_column, distinct, group_by_cols, plan.final_output_columns, columns
+    )
+    quote = dialect.identifier_preparer.quote
+    value = f"monk_agg.{quote(agg_column)}"
+    keys = [f"monk_agg.{quote(col)}" for col in group_by_cols]
+
+    selected = [f"{key} AS {quote(col)}" for key, col in zip(keys, group_by_cols)]
+    for agg_type, name in zip(agg_types, names):
+        selected.append(f"{_aggregate_sql(agg_type, value, distinct, dialect.name)} AS {quote(name)}")
+
+    sql = f"SELECT {', '.join(selected)} FROM (\n{_strip_semicolon(step.query)}\n) AS monk_agg"
+    if keys:
+        # pandas sorts groups ascending with missing keys last.
+        order = ", ".join(f"{key} IS NULL, {key}" for key in keys)
+        sql += f" GROUP BY {', '.join(keys)} ORDER BY {order}"
+
+    step.query = sql
+    step.output_columns = [{"alias": col, "source": col} for col in group_by_cols] + [
+        {"alias": name, "source": f"{agg_type}({agg_column})"}
+        for agg_type, name in zip(agg_types, names)
+    ]
+    plan.final_aggregation = FinalAggregationModel(type="NONE")
+    say(f"ℹ️ Pushed {'/'.join(agg_types)}({agg_column}) into step {step.id}")
+    return True
+
+
+def _push_final_projection(plan: TranslationReturn, step: ExecutionPlan) -> bool:
+    columns = _step_columns(step)
+    if not columns or not plan.final_output_columns:
+        return False
+
+    kept = [col for col in plan.final_output_columns if col in columns]
+    if not kept or len(kept) == len(columns):
+        return False
+    return _project_step(step, kept)
+
+
+def _push_projections(plan: TranslationReturn) -> bool:
+    """Drop step columns that no join, placeholder, aggregation or output reads."""
+    steps = plan.execution_plan
+    if len(steps) < 2 or not plan.final_output_columns:
+        return False
+
+    step_columns = [_step_columns(step) for step in steps]
+    if any(columns is None for columns in step_columns):
+        return False
+    all_columns = [col for columns in step_columns for col in columns]
+    if len(all_columns) != len(set(all_columns)):
+        # Repeated aliases get pandas' _x/_y suffixes on join; leave them be.
+        return False
+
+    needed = set(plan.final_output_columns)
+    aggregation = plan.final_aggregation
+    if aggregation:
+        needed.add(aggregation.column)
+        needed.update(aggregation.group_by or [])
+    for step in steps:
+        for join in step.joins if step.depends_on else []:
+            for dep_col, cur_col in join.key_pairs:
+                needed.update((dep_col, cur_col))
+        try:
+            needed.update(slot.column for slot in step.template.slots)
+        except ValueError:
+            return False
+
+    changed = False
+    for step, columns in zip(steps, step_columns):
+        kept = [col for col in columns if col in needed]
+        if kept and len(kept) < len(columns):
+            changed |= _project_step(step, kept)
+    return changed
+
+
+def _project_step(step: ExecutionPlan, kept: list[str]) -> bool:
+    dialect = _dialect(step)
+    if dialect.name not in _ORDER_PRESERVING and _ORDER_BY_RE.search(step.query):
+        return False
+
+    quote = dialect.identifier_preparer.quote
+    selected = ", ".join(f"monk_proj.{quote(col)}" for col in kept)
+    step.query = f"SELECT {selected} FROM (\n{_strip_semicolon(step.query)}\n) AS monk_proj"
+    step.output_columns = [c for c in step.output_columns if _alias(c) in kept]
+    say(f"ℹ️ Projected step {step.id} down to {kept}")
+    return True
+
+
+def _aggregate_sql(agg_type: str, value: str, distinct: bool, dialect_name: str) -> str:
+    if agg_type == "AVG" and dialect_name in _AVG_CASTS:
+        value = f"CAST({value} AS {_AVG_CASTS[dialect_name]})"
+    expression = f"{agg_type}({'DISTINCT ' if distinct else ''}{value})"
+    # pandas sums an empty or all-missing column to 0.
+    return f"COALESCE({expression}, 0)" if agg_type == "SUM" else expression
+
+
+def _step_columns(step: ExecutionPlan) -> Optional[list[str]]:
+    if not step.output_columns:
+        return None
+    return [_alias(c) for c in step.output_columns]
+
+
+def _alias(column) -> str:
+    return column["alias"] if isinstance(column, dict) else column.alias
+
+
+def _dialect(step: ExecutionPlan):
+    return make_url(add_url_driver(step.database)).get_dialect()()
+
+
+def _strip_semicolon(query: str) -> str:
+    return query.rstrip().rstrip(";")
@@ -0,0 +1,575 @@
+"""Step machinery shared by the plan executors and the tools that inspect plans.
+
+``execute_plan``, ``execute_plan_async``, the plan rewrites, the validator
+and the cost estimator all read steps the same way; the helpers they share
+live here, so a change to how a step is read reaches all of them at once.
+"""
+
+import re
+from contextlib import closing
+from dataclasses import dataclass
+from typing import Dict, Iterator, Optional, Union
+
+import pandas as pd
+from sqlalchemy.engine import Engine
+
+from src.models.execution_plan import ExecutionPlan
+from src.query_translation import FinalAggregationModel
+from src.utils.column_types import (
+    DTYPE_BACKENDS,
+    ColumnTypeCatalog,
+    compact_frame,
+    read_sql_options,
+)
+from src.utils.instrumentation import StepMetrics, say, timed_read, timer
+from src.utils.join_engine import join_frames, key_isin
+from src.utils.metadata_extraction import add_url_driver
+from src.utils.query_template import QueryTemplate
+from src.utils.result_cache import StepCache
+from src.utils.semi_join import summarize_keys
+from src.utils.value_transport import SlotValues, ValueTransport, resolve_transport
+
+_REDUCERS = {"COUNT": "count", "SUM": "sum", "AVG": "mean", "MIN": "min", "MAX": "max"}
+
+# Words in an output column name that say which aggregate it holds, used to
+# name the results of multi-aggregate types such as "AVG,MIN,MAX".
+_NAME_HINTS = {
+    "COUNT": ("count", "number", "num"),
+    "SUM": ("sum", "total"),
+    "AVG": ("avg", "average", "mean"),
+    "MIN": ("min", "lowest", "smallest"),
+    "MAX": ("max", "highest", "largest"),
+}
+
+
+class ExecutionError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class ExecutionOptions:
+    """Per-step knobs shared by every step of one plan execution."""
+
+    chunksize: Optional[int] = None
+    memory_budget_mb: Optional[float] = None
+    value_transport: Union[str, ValueTransport] = "auto"
+    semi_join_pushdown: bool = False
+    cache: Optional[StepCache] = None
+    dtype_backend: str = "numpy"
+    column_types: Optional[ColumnTypeCatalog] = None
+
+
+def step_template(step) -> QueryTemplate:
+    """The step's compiled query, with compilation errors raised as ``ExecutionError``."""
+    try:
+        return step.template
+    except ValueError as e:
+        raise ExecutionError(f"Step {step.id}: {e}") from e
+
+
+def step_dependencies(step) -> set[int]:
+    """Steps referenced through ``depends_on``, ``join_info`` or ``$stepN`` placeholders."""
+    joined = {info.dependency_step for info in step.joins if info.dependency_step is not None}
+    return set(step.depends_on) | joined | step_template(step).step_ids
+
+
+def step_reads(step) -> set[int]:
+    """Steps whose results ``step`` reads, for deciding how long to keep them."""
+    # A step whose query does not compile fails when it runs; until then only
+    # its declared dependencies need to be kept.
+    try:
+        return step_dependencies(step)
+    except ExecutionError:
+        return set(step.depends_on)
+
+
+def check_dtype_backend(dtype_backend: str, column_types: Optional[ColumnTypeCatalog]) -> None:
+    """Raise ``ExecutionError`` unless ``dtype_backend`` can be used with ``column_types``."""
+    if dtype_backend not in DTYPE_BACKENDS:
+        raise ExecutionError(
+            f"Unknown dtype backend '{dtype_backend}'; expected one of {', '.join(DTYPE_BACKENDS)}"
+        )
+    if dtype_backend == "schema" and column_types is None:
+        raise ExecutionError("The 'schema' dtype backend needs column_types")
+
+
+def placeholder_slots(
+    template: QueryTemplate, partial_results: dict[int, pd.DataFrame]
+) -> Dict[str, SlotValues]:
+    """Resolve each distinct ``$stepN.column`` of ``template`` to its upstream values."""
+    slots: Dict[str, SlotValues] = {}
+    for slot in template.slots:
+        if slot.token in slots:
+            continue
+
+        dep_id, col = slot.step_id, slot.column
+
+        if dep_id not in partial_results:
+            raise ExecutionError(f"Referenced step {dep_id} not found in results")
+
+        dep_df = partial_results[dep_id]
+
+        if col not in dep_df.columns:
+            raise ExecutionError(f"Column '{col}' not found in step {dep_id} results")
+
+        slots[slot.token] = SlotValues.from_series(dep_df[col])
+
+    return slots
+
+
+def count_placeholder_values(
+    metrics: Optional[StepMetrics], slots: Dict[str, SlotValues]
+) -> None:
+    if metrics is not None:
+        metrics.placeholder_values = sum(len(slot.values) for slot in slots.values())
+
+
+def prefiltered_template(
+    step,
+    template: QueryTemplate,
+    partial_results: Dict[int, pd.DataFrame],
+    db_engines: Dict[str, Engine],
+    options: ExecutionOptions,
+) -> QueryTemplate:
+    """Wrap the step query with a semi-join prefilter on its join column, if useful.
+
+    Only INNER and LEFT joins qualify: both drop current-step rows without a
+    matching dependency key, so filtering them server-side is exact.
+    """
+    if not options.semi_join_pushdown:
+        return template
+
+    # With several parents, dropping rows early could change which rows of
+    # another (outer-joined) parent end up unmatched.
+    joins = _resolve_joins(step, partial_results)
+    if len(joins) != 1 or joins[0].how not in ("inner", "left"):
+        return template
+
+    # For a composite key, the first column alone still gives a superset filter.
+    join = joins[0]
+    left_col, right_col = join.dependency_columns[0], join.current_columns[0]
+    if any(
+        slot.step_id == join.dependency_id and slot.column == left_col for slot in template.slots
+    ):
+        return template
+
+    summary = summarize_keys(join.dependency_df[left_col])
+    if summary is None:
+        return template
+
+    dialect = db_engines[add_url_driver(step.database)].dialect
+    column = f"monk_semi_join.{dialect.identifier_preparer.quote(right_col)}"
+    say(f"Pushing semi-join prefilter on '{right_col}' ({summary.describe()})")
+    return template.wrap(
+        "SELECT * FROM (\n",
+        f"\n) AS monk_semi_join WHERE {summary.predicate(column)}",
+    )
+
+
+def read_step(
+    conn,
+    template: QueryTemplate,
+    slots: Optional[Dict[str, SlotValues]],
+    options: ExecutionOptions,
+    metrics: Optional[StepMetrics] = None,
+) -> pd.DataFrame:
+    """Run every statement of the step's transport on ``conn`` and stack the results."""
+    read_options = read_sql_options(options.dtype_backend)
+    frames = []
+    with _transport_statements(conn, template, slots, options.value_transport) as statements:
+        for statement, params in _timed_reads(statements, conn, metrics, "prepare_s"):
+            with timed_read(conn, metrics):
+                frames.append(pd.read_sql(statement, conn, params=params, **read_options))
+    frames = [frame for frame in frames if not frame.empty] or frames[:1]
+    return frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+
+
+def read_step_chunks(
+    conn,
+    step,
+    template: QueryTemplate,
+    slots: Optional[Dict[str, SlotValues]],
+    options: ExecutionOptions,
+    metrics: Optional[StepMetrics] = None,
+) -> Iterator[pd.DataFrame]:
+    """Stream the step's transport statements on ``conn`` in ``options.chunksize`` chunks.
+
+    Each chunk comes back compacted and in the step's declared schema.
+    """
+    read_options = read_sql_options(options.dtype_backend)
+    with _transport_statements(conn, template, slots, options.value_transport) as statements:
+        for statement, params in _timed_reads(statements, conn, metrics, "prepare_s"):
+            with timed_read(conn, metrics):
+                chunks = pd.read_sql(
+                    statement, conn, params=params, chunksize=options.chunksize, **read_options
+                )
+            for chunk in _timed_reads(chunks, conn, metrics):
+                if metrics is not None:
+                    metrics.query_rows += len(chunk)
+                chunk = compact_frame(chunk, options.dtype_backend, step, options.column_types)
+                yield enforce_step_schema(chunk, step)
+
+
+def _timed_reads(
+    items, conn, metrics: Optional[StepMetrics], attribute: str = "fetch_s"
+) -> Iterator:
+    """Yield from ``items``, timing only the reads and not the consumer's work."""
+    items = iter(items)
+    while True:
+        with timed_read(conn, metrics, attribute):
+            item = next(items, _EXHAUSTED)
+        if item is _EXHAUSTED:
+            return
+        yield item
+
+
+_EXHAUSTED = object()
+
+
+def _transport_statements(
+    conn,
+    template: QueryTemplate,
+    slots: Optional[Dict[str, SlotValues]],
+    value_transport: Union[str, ValueTransport],
+):
+    slots = slots or {}
+    transport = resolve_transport(value_transport, conn.dialect.name, template, slots)
+    if transport.name != "literal":
+        say(f"Shipping placeholder values with the '{transport.name}' transport")
+    return closing(transport.statements(conn, template, slots))
+
+
+def enforce_step_schema(df: pd.DataFrame, step) -> pd.DataFrame:
+    """``df`` with the step's declared output columns, in order; missing ones raise."""
+    if not step.output_columns:
+        return df
+
+    expected = [c["alias"] if isinstance(c, dict) else c.alias for c in step.output_columns]
+    missing = [c for c in expected if c not in df.columns]
+    extra = [c for c in df.columns if c not in expected]
+
+    if missing:
+        raise ExecutionError(
+            f"Step {step.id} returned unexpected schema. Missing columns: {missing}. "
+            f"Got: {list(df.columns)}"
+        )
+
+    df = df[expected]
+
+    if extra:
+        say(f"ℹ️ Step {step.id}: ignoring extra columns: {extra}")
+
+    return df
+
+
+def handle_joins(
+    step,
+    current_df: pd.DataFrame,
+    partial_results: Dict[int, pd.DataFrame]
+) -> pd.DataFrame:
+    """Handle joining current results with dependencies."""
+    joins = _resolve_joins(step, partial_results)
+    if not joins:
+        return current_df
+
+    say("-" * 40)
+    say(f"▶️ Joining results with step(s): {[join.dependency_id for join in joins]}")
+
+    joined_df = _apply_joins(step, current_df, joins, announce=True)
+
+    say(f"✅ Join resulted in {len(joined_df)} rows.")
+    return joined_df
+
+
+def join_chunks(
+    step,
+    chunks: Iterator[pd.DataFrame],
+    partial_results: Dict[int, pd.DataFrame],
+    metrics: Optional[StepMetrics] = None,
+) -> Iterator[pd.DataFrame]:
+    """Join each chunk of the current step against its (materialized) dependencies.
+
+    Dependency rows only survive a LEFT/FULL join once every chunk has been
+    seen, so matches are tracked and the unmatched rows are emitted last.
+    """
+    joins = _resolve_joins(step, partial_results)
+    if not joins:
+        yield from chunks
+        return
+
+    if len(joins) > 1:
+        if all(join.how in ("inner", "right") for join in joins):
+            for chunk in chunks:
+                with timer(metrics, "join_s"):
+                    joined = _apply_joins(step, chunk, joins)
+                yield joined
+        else:
+            # Unmatched rows of several preserved parents interact; join once.
+            parts = list(chunks)
+            if parts:
+                with timer(metrics, "join_s"):
+                    joined = _apply_joins(step, pd.concat(parts, ignore_index=True), joins)
+                yield joined
+        return
+
+    join = joins[0]
+    dep_df, left_cols, right_cols = join.dependency_df, join.dependency_columns, join.current_columns
+    keeps_unmatched_dep = join.how in ("left", "outer")
+    chunk_how = {"left": "inner", "outer": "right"}.get(join.how, join.how)
+
+    matched = pd.Series(False, index=dep_df.index)
+    empty_chunk = None
+    for chunk in chunks:
+        for col in right_cols:
+            if col not in chunk.columns:
+                raise ExecutionError(f"Join column '{col}' not found in step {step.id} results")
+
+        with timer(metrics, "join_s"):
+            if keeps_unmatched_dep:
+                matched |= key_isin(dep_df, left_cols, chunk, right_cols)
+                empty_chunk = chunk.iloc[0:0]
+
+            joined, _ = join_frames(dep_df, chunk, left_cols, right_cols, chunk_how)
+        yield joined
+
+    if keeps_unmatched_dep and empty_chunk is not None:
+        with timer(metrics, "join_s"):
+            unmatched = pd.merge(
+                left=dep_df[~matched],
+                right=empty_chunk,
+                how="left",
+                left_on=left_cols,
+                right_on=right_cols,
+            )
+        yield unmatched
+
+
+@dataclass(frozen=True, eq=False)
+class _Join:
+    """One ``join_info`` entry resolved against its dependency's results."""
+
+    dependency_id: int
+    dependency_df: pd.DataFrame
+    dependency_columns: list[str]
+    current_columns: list[str]
+    how: str
+
+
+def _apply_joins(
+    step, current_df: pd.DataFrame, joins: list[_Join], announce: bool = False
+) -> pd.DataFrame:
+    """Join ``current_df`` with each dependency in turn.
+
+    INNER joins commute, so when every join is INNER and keyed on the step's
+    own columns they run smallest dependency first; otherwise the declared
+    order is kept.
+    """
+    own_keys = all(
+        col in current_df.columns for join in joins for col in join.current_columns
+    )
+    if own_keys and all(join.how == "inner" for join in joins):
+        joins = sorted(joins, key=lambda join: len(join.dependency_df))
+
+    for join in joins:
+        for col in join.current_columns:
+            if col not in current_df.columns:
+                raise ExecutionError(f"Join column '{col}' not found in step {step.id} results")
+
+        current_df, strategy = join_frames(
+            join.dependency_df,
+            current_df,
+            join.dependency_columns,
+            join.current_columns,
+            join.how,
+        )
+        if announce:
+            say(f"Joined step {join.dependency_id} on {join.current_columns} ({strategy} join)")
+    return current_df
+
+
+def _resolve_joins(step, partial_results: Dict[int, pd.DataFrame]) -> list[_Join]:
+    if not (step.depends_on and step.join_info):
+        return []
+
+    joins = []
+    for info in step.joins:
+        dep_id = info.dependency_step
+        if dep_id is None:
+            raise ExecutionError(f"Step {step.id} has more join_info entries than dependencies")
+        if dep_id not in partial_results:
+            raise ExecutionError(f"Step {step.id} depends on step {dep_id} which hasn't been executed")
+
+        dep_df = partial_results[dep_id]
+        pairs = info.key_pairs
+        if not pairs:
+            raise ExecutionError(f"Step {step.id}: join with step {dep_id} has no key columns")
+
+        for left_col, _ in pairs:
+            if left_col not in dep_df.columns:
+                raise ExecutionError(f"Join column '{left_col}' not found in step {dep_id} results")
+
+        joins.append(
+            _Join(
+                dependency_id=dep_id,
+                dependency_df=dep_df,
+                dependency_columns=[left_col for left_col, _ in pairs],
+                current_columns=[right_col for _, right_col in pairs],
+                how=_merge_how(info.type),
+            )
+        )
+    return joins
+
+
+def _merge_how(join_type: str) -> str:
+    how = join_type.lower()
+    return "outer" if how == "full" else how
+
+
+def group_by_columns(
+    df: pd.DataFrame,
+    aggregation_info: FinalAggregationModel,
+    final_output_columns: Optional[list[str]],
+) -> list[str]:
+    """Grouping columns of the final aggregation over ``df``.
+
+    ``group_by`` when the plan gives it, otherwise the output columns other
+    than the aggregated one.
+    """
+    group_by = list(getattr(aggregation_info, "group_by", None) or [])
+    if group_by:
+        missing = [col for col in group_by if col not in df.columns]
+        if missing:
+            raise ExecutionError(f"Group by column(s) {missing} not found in DataFrame")
+        return group_by
+
+    return [
+        col for col in final_output_columns or []
+        if col != aggregation_info.column and col in df.columns
+    ]
+
+
+def aggregate_names(
+    agg_types: list[str],
+    agg_column: str,
+    distinct: bool,
+    group_by_cols: list[str],
+    final_output_columns: Optional[list[str]],
+    existing_columns,
+) -> list[str]:
+    """Result column name of each aggregate, preferring names the plan asks for."""
+    outputs = list(final_output_columns or [])
+    candidates = [
+        col for col in outputs if col not in group_by_cols and col not in existing_columns
+    ]
+
+    def fallback(agg_type: str) -> str:
+        return f"{agg_column}_{agg_type.lower()}{'_distinct' if distinct else ''}"
+
+    if len(agg_types) == 1:
+        if not group_by_cols and len(outputs) == 1:
+            name = outputs[0]
+        elif agg_column in outputs:
+            name = agg_column
+        elif len(candidates) == 1:
+            name = candidates[0]
+        else:
+            name = agg_column if group_by_cols else fallback(agg_types[0])
+        return [fallback(agg_types[0]) if name in group_by_cols else name]
+
+    names: list[Optional[str]] = [None] * len(agg_types)
+    for i, agg_type in enumerate(agg_types):
+        for col in candidates:
+            if any(hint in col.lower() for hint in _NAME_HINTS[agg_type]):
+                names[i] = col
+                candidates.remove(col)
+                break
+    for i, agg_type in enumerate(agg_types):
+        if names[i] is None:
+            names[i] = candidates.pop(0) if candidates else fallback(agg_type)
+    return names
+
+
+def finalize_results(df: pd.DataFrame, plan: ExecutionPlan) -> pd.DataFrame:
+    """Apply the plan's final aggregation and output columns to the last step's result."""
+    if plan.final_aggregation:
+        df = _aggregate_results(df, plan.final_aggregation, plan.final_output_columns)
+
+    if plan.final_output_columns:
+        existing_cols = [col for col in plan.final_output_columns if col in df.columns]
+        if not existing_cols:
+            raise ExecutionError(
+                f"None of the requested output columns {plan.final_output_columns} "
+                f"found in final results"
+            )
+        df = df[existing_cols]
+
+    return df
+
+
+def _aggregate_results(
+    df: pd.DataFrame,
+    aggregation_info: FinalAggregationModel,
+    final_output_columns: Optional[list[str]]
+) -> pd.DataFrame:
+    """Aggregate ``df`` in a single groupby pass with pandas' built-in reducers.
+
+    Groups come from ``group_by`` or, when it is empty, from the output
+    columns other than the aggregated one. ``type`` may list several
+    aggregates ("AVG,MIN,MAX"); all of them are computed in the same pass.
+    """
+    agg_types = aggregation_types(aggregation_info.type)
+    agg_column = aggregation_info.column
+    distinct = bool(getattr(aggregation_info, "distinct", False))
+
+    if not agg_types:
+        return df
+
+    if not agg_column:
+        raise ExecutionError(f"Aggregation column not specified for type {aggregation_info.type}")
+
+    if agg_column not in df.columns:
+        if final_output_columns and all(col in df.columns for col in final_output_columns):
+            return df[final_output_columns]
+        raise ExecutionError(f"Aggregation column '{agg_column}' not found in DataFrame")
+
+    group_by_cols = group_by_columns(df, aggregation_info, final_output_columns)
+    names = aggregate_names(
+        agg_types, agg_column, distinct, group_by_cols, final_output_columns, df.columns
+    )
+
+    if isinstance(df[agg_column].dtype, pd.CategoricalDtype):
+        # Unordered categoricals have no MIN/MAX; reduce the plain values.
+        df = df.assign(**{agg_column: df[agg_column].astype(df[agg_column].cat.categories.dtype)})
+
+    reducers = [_REDUCERS[agg_type] for agg_type in agg_types]
+    if distinct:
+        if all(agg_type == "COUNT" for agg_type in agg_types):
+            reducers = ["nunique"] * len(reducers)
+        else:
+            df = df[[*group_by_cols, agg_column]].drop_duplicates()
+
+    try:
+        if not group_by_cols:
+            values = df[agg_column]
+            return pd.DataFrame(
+                {name: [getattr(values, reducer)()] for name, reducer in zip(names, reducers)}
+            )
+
+        grouped = df.groupby(group_by_cols, dropna=False, observed=True)[agg_column]
+        return grouped.agg(**dict(zip(names, reducers))).reset_index()
+    except TypeError as e:
+        raise ExecutionError(
+            f"Cannot compute {'/'.join(agg_types)} of column '{agg_column}': {e}"
+        ) from e
+
+
+def aggregation_types(agg_type: Optional[str]) -> list[str]:
+    """Parse ``type`` into aggregate names; "AVG,MIN,MAX" and "MIN_MAX_AVG" give three."""
+    names = [name for name in re.split(r"[\s,;|/_+]+", (agg_type or "NONE").upper()) if name]
+    if names == ["NONE"]:
+        return []
+
+    unsupported = [name for name in names if name not in _REDUCERS]
+    if unsupported:
+        raise ExecutionError(f"Unsupported aggregation type: {agg_type}")
+    return list(dict.fromkeys(names))
@@ -0,0 +1,659 @@
+"""Static checks of a translated plan against the metadata catalog, before execution.
+
+``PlanValidator.compile`` tokenizes each step's SQL with the quoting and
+comment rules of its dialect, resolves the tables of FROM/JOIN clauses and
+``alias.column`` references against the catalog of the step's database, and
+flags bare names that no table, alias or CTE of the query defines. It then
+derives the columns each step returns (``output_columns``, or the top-level
+SELECT list named the way the database names result columns, plus the
+columns joined in through ``join_info``) and checks ``$stepN`` placeholders,
+join keys, the final aggregation and ``final_output_columns`` against them
+across the DAG.
+
+The checks are conservative: a step whose database is not in the catalog
+has its SQL left unchecked, and a SELECT item whose result name depends on
+the database (an expression without an alias) leaves the step's columns
+open, so references to them are not flagged. Compiled plans are cached by
+their JSON.
+"""
+
+import json
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Optional, Union
+
+from sqlalchemy.engine import make_url
+
+from src.plan_steps import ExecutionError, aggregation_types
+from src.query_translation import TranslationReturn
+from src.utils.metadata_extraction import add_url_driver
+from src.utils.sql_tokens import KEYWORDS, Token, tokenize
+
+# Databases whose result columns are named in lower case unless quoted
+# (Oracle and Snowflake through SQLAlchemy's name normalization).
+_FOLDS_TO_LOWER = {"postgresql", "redshift", "oracle", "snowflake"}
+
+_JOIN_TYPES = {"inner", "left", "right", "full", "outer"}
+
+# Keywords after which FROM does not start a table list (EXTRACT(YEAR FROM d)).
+_CLAUSE_ENDS = frozenset(
+    "where group order having limit offset fetch union intersect except minus window "
+    "on using join inner left right full cross natural straight_join for into".split()
+)
+
+
+class PlanValidationError(ExecutionError):
+    """A plan that cannot run as written; ``errors`` lists every problem found."""
+
+    def __init__(self, errors: list[str]):
+        self.errors = list(errors)
+        super().__init__("Plan failed validation:\n" + "\n".join(f"- {e}" for e in self.errors))
+
+
+@dataclass(frozen=True)
+class CompiledStep:
+    step_id: int
+    # Catalog tables the query reads; empty when its database is not in the catalog.
+    tables: tuple[str, ...]
+    # Result columns after joins, or None when some of them cannot be named statically.
+    columns: Optional[tuple[str, ...]]
+
+
+@dataclass(frozen=True)
+class CompiledPlan:
+    steps: tuple[CompiledStep, ...]
+    warnings: tuple[str, ...]
+
+
+@dataclass
+class _Columns:
+    names: list[str]
+    complete: bool = True
+
+    def has(self, name: str) -> bool:
+        return not self.complete or name in self.names
+
+
+class PlanValidator:
+    """Compiles plans against one metadata catalog, caching the result per plan."""
+
+    def __init__(self, metadata: list[dict[str, Any]], max_plans: int = 1024):
+        self._tables: dict[tuple, dict[str, list[str]]] = {}
+        for db in metadata:
+            key = (db.get("dialect"), db.get("host"), db.get("port"), db.get("database"))
+            self._tables[key] = {
+                table.lower(): [col["name"] for col in columns]
+                for table, columns in db.get("tables", {}).items()
+            }
+        self._max_plans = max_plans
+        self._compiled: dict[str, Union[CompiledPlan, PlanValidationError]] = {}
+
+    @classmethod
+    def from_file(cls, path: Union[str, Path]) -> "PlanValidator":
+        return cls(json.loads(Path(path).read_text(encoding="utf-8")))
+
+    def compile(self, plan: TranslationReturn) -> CompiledPlan:
+        """Check ``plan``; raises ``PlanValidationError`` listing every problem found."""
+        key = plan.model_dump_json()
+        compiled = self._compiled.get(key)
+        if compiled is None:
+            compiled = self._compile(plan)
+            if len(self._compiled) >= self._max_plans:
+                self._compiled.pop(next(iter(self._compiled)))
+            self._compiled[key] = compiled
+        if isinstance(compiled, PlanValidationError):
+            raise PlanValidationError(compiled.errors)
+        return compiled
+
+    def _compile(self, plan: TranslationReturn) -> Union[CompiledPlan, PlanValidationError]:
+        errors: list[str] = []
+        warnings: list[str] = []
+        steps = {step.id: step for step in plan.execution_plan}
+        if len(steps) != len(plan.execution_plan):
+            errors.append("Step ids are not unique")
+        if not steps:
+            return PlanValidationError(["Plan has no steps"])
+
+        position = {step.id: i for i, step in enumerate(plan.execution_plan)}
+        reads: dict[int, set[int]] = {}
+        for step in plan.execution_plan:
+            reads[step.id] = _check_references(step, steps, position, errors, warnings)
+
+        compiled: dict[int, CompiledStep] = {}
+        columns: dict[int, _Columns] = {}
+        for step_id in _topological_order(reads, errors):
+            step = steps[step_id]
+            tables, own = self._compile_sql(step, errors, warnings)
+            joined = _check_step_columns(step, own, columns, errors, warnings)
+            columns[step_id] = joined
+            compiled[step_id] = CompiledStep(
+                step_id=step_id,
+                tables=tuple(tables),
+                columns=tuple(joined.names) if joined.complete else None,
+            )
+
+        last = plan.execution_plan[-1]
+        if last.id in columns:
+            _check_final(plan, columns[last.id], errors, warnings)
+
+        if errors:
+            return PlanValidationError(errors)
+        ordered = tuple(compiled[step.id] for step in plan.execution_plan if step.id in compiled)
+        return CompiledPlan(steps=ordered, warnings=tuple(warnings))
+
+    def _compile_sql(self, step, errors: list[str], warnings: list[str]) -> tuple[list[str], _Columns]:
+        """Tables read by ``step`` and the columns its query returns."""
+        if step.output_columns:
+            declared = _Columns([c["alias"] if isinstance(c, dict) else c.alias for c in step.output_columns])
+        else:
+            declared = None
+
+        try:
+            url = make_url(add_url_driver(step.database))
+        except Exception:
+            errors.append(f"Step {step.id}: invalid database URL")
+            return [], declared or _Columns([], complete=False)
+        dialect = url.get_backend_name()
+        catalog = self._tables.get((dialect, url.host, url.port, url.database))
+        if catalog is None:
+            warnings.append(f"Step {step.id}: database {url.database} is not in the catalog; its SQL is not checked")
+
+        try:
+            tokens = tokenize(step.query, dialect)
+            query = _Query(tokens)
+        except ValueError as e:
+            errors.append(f"Step {step.id}: {e}")
+            return [], declared or _Columns([], complete=False)
+
+        for token in tokens:
+            if token.kind == "param":
+                errors.append(f"Step {step.id}: query has an unbound parameter '{token.text}'")
+
+        tables: list[str] = []
+        if catalog is not None:
+            for problem in query.resolve(catalog):
+                errors.append(f"Step {step.id}: {problem}")
+            tables = list(dict.fromkeys(ref.table for ref in query.tables if ref.table is not None))
+        if declared is not None:
+            return tables, declared
+        return tables, query.result_columns(dialect, catalog)
+
+
+def _check_references(
+    step, steps: dict, position: dict[int, int], errors: list[str], warnings: list[str]
+) -> set[int]:
+    """Steps read by ``step``, reporting references to steps that do not exist."""
+    reads = set()
+    for dep_id in step.depends_on:
+        if dep_id == step.id:
+            errors.append(f"Step {step.id} depends on itself")
+        elif dep_id not in steps:
+            errors.append(f"Step {step.id} depends on step {dep_id}, which is not in the plan")
+        else:
+            reads.add(dep_id)
+
+    for info in step.joins:
+        if info.dependency_step is None:
+            errors.append(f"Step {step.id} has more join_info entries than dependencies")
+        elif info.dependency_step not in steps:
+            errors.append(f"Step {step.id} joins step {info.dependency_step}, which is not in the plan")
+        else:
+            reads.add(info.dependency_step)
+        if info.type.lower() not in _JOIN_TYPES:
+            errors.append(f"Step {step.id}: unsupported join type '{info.type}'")
+        if not info.key_pairs:
+            errors.append(f"Step {step.id}: join with step {info.dependency_step} has no key columns")
+
+    try:
+        placeholder_steps = step.template.step_ids
+    except ValueError as e:
+        errors.append(f"Step {step.id}: {e}")
+        placeholder_steps = set()
+    for dep_id in placeholder_steps:
+        if dep_id not in steps:
+            errors.append(f"Step {step.id} reads $step{dep_id}, which is not in the plan")
+        else:
+            reads.add(dep_id)
+
+    later = sorted(dep_id for dep_id in reads if position[dep_id] > position[step.id])
+    if later:
+        warnings.append(f"Step {step.id} reads step(s) {later}, listed after it; only parallel execution orders them")
+    return reads
+
+
+def _topological_order(reads: dict[int, set[int]], errors: list[str]) -> list[int]:
+    pending = {step_id: len(deps) for step_id, deps in reads.items()}
+    readers: dict[int, list[int]] = {step_id: [] for step_id in reads}
+    for step_id, deps in reads.items():
+        for dep_id in deps:
+            readers[dep_id].append(step_id)
+
+    queue = deque(step_id for step_id, count in pending.items() if count == 0)
+    order = []
+    while queue:
+        step_id = queue.popleft()
+        order.append(step_id)
+        for reader in readers[step_id]:
+            pending[reader] -= 1
+            if pending[reader] == 0:
+                queue.append(reader)
+    blocked = sorted(set(reads) - set(order))
+    if blocked:
+        errors.append(f"Circular dependency between steps {blocked}")
+    return order
+
+
+def _check_step_columns(
+    step, own: _Columns, columns: dict[int, _Columns], errors: list[str], warnings: list[str]
+) -> _Columns:
+    """Check placeholders and join keys of ``step``; returns its columns after joins."""
+    try:
+        slots = step.template.slots
+    except ValueError:
+        slots = ()  # reported by _check_references
+    for slot in slots:
+        if not slot.in_list:
+            warnings.append(
+                f"Step {step.id}: {slot.token} is not the sole item of an IN (...) list; "
+                f"it expands to every value of the column"
+            )
+        dep = columns.get(slot.step_id)
+        if dep is not None and not dep.has(slot.column):
+            errors.append(
+                f"Step {step.id}: placeholder {slot.token} names a column step {slot.step_id} "
+                f"does not return (it returns {dep.names})"
+            )
+
+    current = _Columns(list(own.names), own.complete)
+    if not step.depends_on:
+        return current
+    reorderable = len(step.joins) > 1 and all(info.type.lower() == "inner" for info in step.joins)
+    for info in step.joins:
+        dep = columns.get(info.dependency_step)
+        if dep is None:
+            current.complete = False
+            continue
+        for dep_col, cur_col in info.key_pairs:
+            if not dep.has(dep_col):
+                errors.append(
+                    f"Step {step.id}: join column '{dep_col}' is not returned by step "
+                    f"{info.dependency_step} (it returns {dep.names})"
+                )
+            if not current.has(cur_col):
+                errors.append(
+                    f"Step {step.id}: join column '{cur_col}' is not returned by the step "
+                    f"(it returns {current.names})"
+                )
+        current = _merged_columns(dep, current, info.key_pairs, reorderable)
+    return current
+
+
+def _merged_columns(left: _Columns, right: _Columns, key_pairs, reorderable: bool) -> _Columns:
+    """Columns of ``pd.merge(left, right)`` on ``key_pairs``, with its _x/_y suffixes."""
+    shared_keys = {dep_col for dep_col, cur_col in key_pairs if dep_col == cur_col}
+    clashing = (set(left.names) & set(right.names)) - shared_keys
+    names = [f"{name}_x" if name in clashing else name for name in left.names]
+    names += [
+        f"{name}_y" if name in clashing else name
+        for name in right.names
+        if name not in shared_keys
+    ]
+    # Several INNER joins may run in another order, which changes which side gets each suffix.
+    complete = left.complete and right.complete and not (clashing and reorderable)
+    return _Columns(names, complete)
+
+
+def _check_final(plan: TranslationReturn, last: _Columns, errors: list[str], warnings: list[str]) -> None:
+    aggregation = plan.final_aggregation
+    try:
+        agg_types = aggregation_types(aggregation.type if aggregation else None)
+    except ExecutionError as e:
+        errors.append(str(e))
+        agg_types = []
+
+    if agg_types:
+        final_columns = plan.final_output_columns or []
+        if not aggregation.column:
+            errors.append(f"Aggregation column not specified for type {aggregation.type}")
+        elif not last.has(aggregation.column) and not all(last.has(c) for c in final_columns or [None]):
+            errors.append(
+                f"Aggregation column '{aggregation.column}' is not returned by the last step "
+                f"(it returns {last.names})"
+            )
+        missing = [col for col in aggregation.group_by if not last.has(col)]
+        if missing:
+            errors.append(f"Group by column(s) {missing} are not returned by the last step")
+        return
+
+    if not plan.final_output_columns or not last.complete:
+        return
+    missing = [col for col in plan.final_output_columns if col not in last.names]
+    if len(missing) == len(plan.final_output_columns):
+        errors.append(
+            f"None of the requested output columns {plan.final_output_columns} "
+            f"are returned by the last step (it returns {last.names})"
+        )
+    elif missing:
+        warnings.append(f"Output columns {missing} are not returned by the last step and will be dropped")
+
+
+@dataclass
+class _TableRef:
+    parts: list[str]
+    alias: Optional[str]
+    depth: int  # parentheses around the reference; 0 for the outermost query
+    table: Optional[str] = None  # catalog name once resolved
+
+
+class _Query:
+    """Table sources, aliases and column references of one tokenized statement."""
+
+    def __init__(self, tokens: list[Token]):
+        self.tokens = tokens
+        self.match: dict[int, int] = {}
+        self.depth: list[int] = []
+        self.in_function: list[bool] = []
+        self.tables: list[_TableRef] = []
+        self.derived: set[str] = set()  # aliases of subqueries and CTEs
+        self.aliases: set[str] = set()  # column aliases and CTE column lists
+        self.opaque = False  # a source whose columns are unknown (table functions, VALUES)
+        self.subqueries = 0
+        self._consumed: set[int] = set()
+        self._match_parens()
+        self._collect_sources()
+
+    def _match_parens(self) -> None:
+        stack: list[tuple[int, bool]] = []
+        for i, token in enumerate(self.tokens):
+            self.depth.append(len(stack))
+            self.in_function.append(bool(stack) and stack[-1][1])
+            if token.text == "(" and token.kind == "op":
+                following = self.tokens[i + 1] if i + 1 < len(self.tokens) else None
+                subquery = following is not None and following.is_word("select", "with", "values")
+                stack.append((i, not subquery))
+            elif token.text == ")" and token.kind == "op":
+                if not stack:
+                    raise ValueError("unbalanced parentheses")
+                self.match[stack.pop()[0]] = i
+        if stack:
+            raise ValueError("unbalanced parentheses")
+
+    def _collect_sources(self) -> None:
+        tokens = self.tokens
+        for i, token in enumerate(tokens):
+            if token.kind != "word" or i in self._consumed:
+                continue
+            word = token.text.lower()
+            if word == "with" and (i == 0 or tokens[i - 1].text == "("):
+                self._collect_ctes(i + 1)
+            elif word == "from" and not self.in_function[i]:
+                j = self._collect_source(i + 1)
+                while j < len(tokens) and tokens[j].text == ",":
+                    j = self._collect_source(j + 1)
+            elif word == "join":
+                self._collect_source(i + 1)
+            elif word == "as" and i + 1 < len(tokens) and tokens[i + 1].kind in ("word", "quoted"):
+                if not self.in_function[i]:
+                    self.aliases.add(tokens[i + 1].text.lower())
+                    self._consumed.add(i + 1)
+            elif word == "values":
+                self.opaque = True
+            elif word == "using" and i + 1 < len(tokens) and tokens[i + 1].text == "(":
+                self._consumed.update(range(i + 1, self.match[i + 1] + 1))
+
+        for i, token in enumerate(tokens):
+            if (
+                i > 0
+                and token.is_name
+                and token.kind == "word"
+                and i not in self._consumed
+                and not self.in_function[i]
+                and (i + 1 >= len(tokens) or tokens[i + 1].text in (",", ")") or tokens[i + 1].is_word("from"))
+                and _ends_expression(tokens[i - 1])
+            ):
+                # "SELECT COUNT(*) total" names the result column without AS.
+                self.aliases.add(token.text.lower())
+                self._consumed.add(i)
+
+    def _collect_ctes(self, j: int) -> None:
+        tokens = self.tokens
+        while j < len(tokens):
+            if tokens[j].is_word("recursive"):
+                j += 1
+            if j >= len(tokens) or not tokens[j].is_name:
+                return
+            self.derived.add(tokens[j].text.lower())
+            self._consumed.add(j)
+            j += 1
+            if j < len(tokens) and tokens[j].text == "(":
+                self._column_list(j)
+                j = self.match[j] + 1
+            if j >= len(tokens) or not tokens[j].is_word("as"):
+                return
+            self._consumed.add(j)
+            j += 1
+            while j < len(tokens) and tokens[j].is_word("not", "materialized"):
+                j += 1
+            if j >= len(tokens) or tokens[j].text != "(":
+                return
+            j = self.match[j] + 1
+            if j >= len(tokens) or tokens[j].text != ",":
+                return
+            j += 1
+
+    def _collect_source(self, j: int) -> int:
+        """Record the table or subquery starting at ``j``; returns the index after it."""
+        tokens = self.tokens
+        while j < len(tokens) and tokens[j].is_word("lateral", "only"):
+            j += 1
+        if j >= len(tokens):
+            return j
+
+        if tokens[j].text == "(":
+            self.subqueries += 1
+            j = self.match[j] + 1
+            alias, j = self._source_alias(j)
+            if alias:
+                self.derived.add(alias)
+            return j
+
+        if not (tokens[j].kind == "quoted" or tokens[j].kind == "word"):
+            return j
+        start = j
+        parts = [tokens[j].text]
+        self._consumed.add(j)
+        j += 1
+        while j + 1 < len(tokens) and tokens[j].text == "." and tokens[j + 1].kind in ("word", "quoted"):
+            parts.append(tokens[j + 1].text)
+            self._consumed.update((j, j + 1))
+            j += 2
+        if j < len(tokens) and tokens[j].text == "(":
+            # A table function: its columns are unknown.
+            self.opaque = True
+            j = self.match[j] + 1
+            alias, j = self._source_alias(j)
+            if alias:
+                self.derived.add(alias)
+            return j
+        alias, j = self._source_alias(j)
+        self.tables.append(_TableRef(parts, alias, self.depth[start]))
+        return j
+
+    def _source_alias(self, j: int) -> tuple[Optional[str], int]:
+        tokens = self.tokens
+        if j < len(tokens) and tokens[j].is_word("as"):
+            self._consumed.add(j)
+            j += 1
+        if j < len(tokens) and tokens[j].is_name:
+            self._consumed.add(j)
+            alias = tokens[j].text.lower()
+            j += 1
+            if j < len(tokens) and tokens[j].text == "(":
+                self._column_list(j)
+                j = self.match[j] + 1
+            return alias, j
+        return None, j
+
+    def _column_list(self, open_index: int) -> None:
+        for k in range(open_index + 1, self.match[open_index]):
+            if self.tokens[k].is_name:
+                self.aliases.add(self.tokens[k].text.lower())
+            self._consumed.add(k)
+
+    def resolve(self, catalog: dict[str, list[str]]) -> list[str]:
+        """Problems with the tables and column references of the query."""
+        problems = []
+        # Table (None for subqueries and CTEs) behind each name a column can be qualified with.
+        qualifiers: dict[str, Optional[str]] = {name: None for name in self.derived}
+        for ref in self.tables:
+            name = ref.parts[-1].lower()
+            if name in catalog and not (name in self.derived and len(ref.parts) == 1):
+                ref.table = name
+            elif name not in self.derived:
+                problems.append(f"table '{'.'.join(ref.parts)}' not found in the catalog")
+                self.opaque = True
+            qualifiers[name] = ref.table
+            if ref.alias:
+                qualifiers[ref.alias] = ref.table
+
+        known = set(self.aliases) | set(qualifiers)
+        for ref in self.tables:
+            if ref.table is not None:
+                known.update(col.lower() for col in catalog[ref.table])
+
+        tokens = self.tokens
+        skip: set[int] = set()
+        for i, token in enumerate(tokens):
+            if i in self._consumed or i in skip or token.kind not in ("word", "quoted"):
+                continue
+            following = tokens[i + 1] if i + 1 < len(tokens) else None
+            previous = tokens[i - 1] if i > 0 else None
+            if following is not None and following.text == "(":
+                continue  # a function call
+            if previous is not None and previous.text in ("::", "."):
+                continue  # a type cast, or a name handled with its qualifier
+            if token.kind == "word" and token.text.lower() in KEYWORDS:
+                continue
+            if previous is not None and previous.is_word("collate", "separator", "interval"):
+                continue
+
+            if following is not None and following.text == "." and i + 2 < len(tokens):
+                # [db.]qualifier.column: the qualifier is the name right before the column.
+                k = i
+                while k + 2 < len(tokens) and tokens[k + 1].text == "." and tokens[k + 2].kind in ("word", "quoted", "op"):
+                    k += 2
+                skip.update(range(i, k + 1))
+                column, qualifier = tokens[k], tokens[k - 2]
+                if k + 1 < len(tokens) and tokens[k + 1].text == "(":
+                    continue  # schema.function(...)
+                name = qualifier.text.lower()
+                if name not in qualifiers:
+                    problems.append(f"'{qualifier.text}' in '{qualifier.text}.{column.text}' is not a table or alias of the query")
+                    continue
+                table = qualifiers[name]
+                if table is not None and column.text != "*" and column.text.lower() not in {c.lower() for c in catalog[table]}:
+                    problems.append(f"column '{column.text}' not found in table '{table}'")
+                continue
+
+            if not self.opaque and token.text.lower() not in known:
+                tables = [ref.parts[-1] for ref in self.tables if ref.table]
+                problems.append(f"column '{token.text}' not found in {tables or 'the tables of the query'}")
+        return problems
+
+    def result_columns(self, dialect: str, catalog: Optional[dict[str, list[str]]]) -> _Columns:
+        """Columns of the top-level SELECT, named the way ``dialect`` names them."""
+        tokens = self.tokens
+        start = next(
+            (i for i, t in enumerate(tokens) if self.depth[i] == 0 and t.is_word("select")), None
+        )
+        if start is None:
+            return _Columns([], complete=False)
+
+        i = start + 1
+        while i < len(tokens) and tokens[i].is_word("distinct", "all", "distinctrow", "sql_calc_found_rows", "straight_join"):
+            i += 1
+        if i + 1 < len(tokens) and tokens[i].is_word("top"):
+            i += 2
+
+        items, current = [], []
+        while i < len(tokens):
+            token = tokens[i]
+            if self.depth[i] == 0 and (token.is_word(*_CLAUSE_ENDS) or token.is_word("from") or token.text == ";"):
+                break
+            if self.depth[i] == 0 and token.text == ",":
+                items.append(current)
+                current = []
+            else:
+                current.append(token)
+            i += 1
+        items.append(current)
+
+        columns = _Columns([])
+        for item in items:
+            names = self._item_names(item, dialect, catalog)
+            if names is None:
+                columns.complete = False
+            else:
+                columns.names.extend(names)
+        return columns
+
+    def _item_names(self, item: list[Token], dialect: str, catalog) -> Optional[list[str]]:
+        if not item:
+            return None
+        last = item[-1]
+        if last.text == "*":
+            if len(item) == 1:
+                if self.subqueries or self.opaque:
+                    return None
+                refs = [ref for ref in self.tables if ref.depth == 0]
+            elif len(item) == 3 and item[1].text == ".":
+                qualifier = item[0].text.lower()
+                refs = [ref for ref in self.tables if qualifier in (ref.alias, ref.parts[-1].lower())]
+            else:
+                return None
+            if catalog is None or not refs or any(ref.table is None for ref in refs):
+                return None
+            return [col for ref in refs for col in catalog[ref.table]]
+
+        if last.kind not in ("word", "quoted"):
+            return None
+        if len(item) >= 2 and item[-2].is_word("as"):
+            return [_result_name(last, dialect)]
+        if len(item) == 1 or (len(item) == 3 and item[1].text == "."):
+            spelling = self._spelling(last.text, item, catalog)
+            if not last.is_name and spelling is None:
+                return None  # CURRENT_DATE and the like
+            return [_result_name(last, dialect, spelling if dialect == "sqlite" else None)]
+        if last.is_name and _ends_expression(item[-2]):
+            return [_result_name(last, dialect)]
+        return None
+
+    def _spelling(self, name: str, item: list[Token], catalog) -> Optional[str]:
+        """Declared spelling of a bare column, which SQLite uses as its result name."""
+        if catalog is None:
+            return None
+        refs = self.tables
+        if len(item) == 3:
+            qualifier = item[0].text.lower()
+            refs = [ref for ref in refs if qualifier in (ref.alias, ref.parts[-1].lower())]
+        for ref in refs:
+            for col in catalog.get(ref.table or "", []):
+                if col.lower() == name.lower():
+                    return col
+        return None
+
+
+def _ends_expression(token: Token) -> bool:
+    """Whether a name after ``token`` can only be an alias ("COUNT(*) total", "price p")."""
+    return token.text == ")" or token.kind in ("string", "number", "quoted") or (
+        token.kind == "word" and token.text.lower() not in KEYWORDS
+    )
+
+
+def _result_name(token: Token, dialect: str, spelling: Optional[str] = None) -> str:
+    if token.kind == "quoted":
+        return token.text
+    if dialect in _FOLDS_TO_LOWER:
+        return token.text.lower()
+    return spelling or token.text
@@ -1,9 +1,20 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Iterator, Optional, Union
+
+import openai
 from openai import OpenAI
 from pydantic import BaseModel
 from dotenv import load_dotenv
 
 from src.models.execution_plan import ExecutionPlan
 from src.utils import extract_json
+from src.utils.rate_limit import TokenBucket, retry_with_backoff
+from src.utils.schema_digest import build_schema_digest, restore_database_url
+from src.utils.translation_cache import TranslationCache, translation_key
 
 
 load_dotenv()
@@ -129,6 +140,9 @@ def prompt_2(query: str, metadata: str) -> str:
         - join_info.on.current_step_column and dependency_step_column MUST reference output aliases
           (e.g., "s2__customer_id" and "s1__id"), not raw column names.
         - join_info.type must be one of: INNER, LEFT, RIGHT, FULL.
+        - For a composite key, "on" may be a list of {{"current_step_column", "dependency_step_column"}} pairs.
+        - A step that depends on several steps may give join_info as a list with one entry per
+          dependency, each naming it with "dependency_step": <id>, instead of adding extra steps.
       6) Final output contract:
         - final_output_columns must list ONLY aliases that exist after application-level joining.
         - If a column is needed in the final output, it must be present in some step output_columns.
@@ -197,24 +211,198 @@ class TranslationReturn(BaseModel):
     final_output_columns: list[str]
     final_aggregation: FinalAggregationModel
     
+PROMPTS: dict[str, Callable[[str, str], str]] = {
+    "prompt": prompt,
+    "prompt_2": prompt_2,
+}
+DEFAULT_MODEL = "gpt-5-mini"
+DEFAULT_CACHE_DIR = Path(os.getenv("MONK_TRANSLATION_CACHE", ".cache/translations"))
+
+
+@lru_cache(maxsize=1)
+def _get_client() -> OpenAI:
+    # Retries are done by translate_query so they share its rate limiter.
+    return OpenAI(max_retries=0)
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+@lru_cache(maxsize=32)
+def _read_metadata(path: str, mtime_ns: int, size: int) -> str:
+    with open(path, "rb") as f:
+        return f.read().decode("utf-8")
+
+
+def load_metadata(metadata_file_path: str) -> str:
+    """Read the metadata file, rereading it only when it changed on disk."""
+    stat = os.stat(metadata_file_path)
+    return _read_metadata(os.path.abspath(metadata_file_path), stat.st_mtime_ns, stat.st_size)
+
+
 def translate_query(
     metadata_file_path: str,
     query: str,
+    prompt_version: str = "prompt_2",
+    model: str = DEFAULT_MODEL,
+    cache_dir: Optional[Path] = DEFAULT_CACHE_DIR,
+    refresh_cache: bool = False,
+    rate_limiter: Optional[TokenBucket] = None,
+    max_retries: int = 3,
+    schema_budget: Optional[int] = None,
+    candidate: int = 0,
 ) -> TranslationReturn:
-    client = OpenAI()
-    metadata = ""
-    with open(metadata_file_path, "rb") as f:
-        metadata = f.read().decode("utf-8")
-
-    response = client.responses.create(
-        model="gpt-5-mini",
-        input=[
-            {
-                "role": "user",
-                "content": prompt_2(query, metadata),
-            }
-        ],
+    """Translate ``query`` into an execution plan.
+
+    Translations are cached under ``cache_dir`` (``None`` disables the cache);
+    ``refresh_cache`` ignores existing entries and overwrites them. Requests
+    that hit a rate limit (429), a server error (5xx) or a connection error
+    are retried up to ``max_retries`` times with exponential backoff; every
+    attempt first takes a token from ``rate_limiter`` when one is given.
+
+    With ``schema_budget`` (in tokens) the prompt gets a digest of the tables
+    most relevant to ``query`` instead of the whole metadata file.
+
+    ``candidate`` numbers independent translations of the same question: each
+    one is a separate request, cached under its own key.
+    """
+    if prompt_version not in PROMPTS:
+        raise ValueError(f"Unknown prompt version '{prompt_version}'. Available: {sorted(PROMPTS)}")
+
+    metadata = load_metadata(metadata_file_path)
+    catalog = json.loads(metadata) if schema_budget is not None else None
+    if catalog is not None:
+        prompt_text = PROMPTS[prompt_version](
+            query, build_schema_digest(catalog, query, token_budget=schema_budget).text
+        )
+    else:
+        prompt_text = PROMPTS[prompt_version](query, metadata)
+
+    cache = TranslationCache(cache_dir) if cache_dir is not None else None
+    key = translation_key(query, metadata, prompt_version, prompt_text, model, candidate)
+    if cache is not None and not refresh_cache:
+        data = cache.get(key)
+        if data is not None:
+            return _restore_database_urls(TranslationReturn(**data), catalog)
+
+    def request():
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        return _get_client().responses.create(
+            model=model,
+            input=[
+                {
+                    "role": "user",
+                    "content": prompt_text,
+                }
+            ],
+        )
+
+    response = retry_with_backoff(
+        request, _is_retryable, max_retries=max_retries, retry_after=_retry_after
     )
 
     data = extract_json(response.output_text)
-    return TranslationReturn(**data)
+    translation = TranslationReturn(**data)
+    if cache is not None:
+        cache.put(
+            key, data, question=query, prompt_version=prompt_version, model=model, candidate=candidate
+        )
+    return _restore_database_urls(translation, catalog)
+
+
+def _restore_database_urls(translation: TranslationReturn, catalog: Optional[list]) -> TranslationReturn:
+    """Put credentials back into the credential-free URLs of a schema digest."""
+    if catalog is not None:
+        for step in translation.execution_plan:
+            step.database = restore_database_url(step.database, catalog)
+    return translation
+
+
+def translate_queries(
+    metadata_file_path: str,
+    queries: list[str],
+    concurrency: int = 4,
+    requests_per_minute: Optional[float] = None,
+    **options,
+) -> Iterator[tuple[int, Union[TranslationReturn, Exception]]]:
+    """Translate ``queries`` concurrently, yielding ``(index, result)`` in input order.
+
+    A failed translation yields its exception instead of aborting the batch.
+    ``requests_per_minute`` caps the request rate across all workers; the
+    remaining ``options`` are passed to :func:`translate_query`.
+    """
+    jobs = [(query, 0) for query in queries]
+    yield from _translate_jobs(metadata_file_path, jobs, concurrency, requests_per_minute, options)
+
+
+def translate_candidates(
+    metadata_file_path: str,
+    queries: list[str],
+    candidates: int,
+    concurrency: int = 4,
+    requests_per_minute: Optional[float] = None,
+    **options,
+) -> Iterator[tuple[int, list[Union[TranslationReturn, Exception]]]]:
+    """Translate every query ``candidates`` times, yielding ``(index, results)`` in input order.
+
+    The candidates are independent samples of the same prompt, so they can
+    decompose the question differently; otherwise this behaves like
+    :func:`translate_queries`.
+    """
+    candidates = max(1, candidates)
+    jobs = [(query, candidate) for query in queries for candidate in range(candidates)]
+    results: list[Union[TranslationReturn, Exception]] = []
+    for job, result in _translate_jobs(
+        metadata_file_path, jobs, concurrency, requests_per_minute, options
+    ):
+        results.append(result)
+        if len(results) == candidates:
+            yield job // candidates, results
+            results = []
+
+
+def _translate_jobs(
+    metadata_file_path: str,
+    jobs: list[tuple[str, int]],
+    concurrency: int,
+    requests_per_minute: Optional[float],
+    options: dict,
+) -> Iterator[tuple[int, Union[TranslationReturn, Exception]]]:
+    rate_limiter = TokenBucket.per_minute(requests_per_minute) if requests_per_minute else None
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        futures = [
+            executor.submit(
+                translate_query,
+                metadata_file_path,
+                query,
+                rate_limiter=rate_limiter,
+                candidate=candidate,
+                **options,
+            )
+            for query, candidate in jobs
+        ]
+        try:
+            for index, future in enumerate(futures):
+                try:
+                    yield index, future.result()
+                except Exception as e:
+                    yield index, e
+        finally:
+            # Don't start pending requests if the caller stops iterating early.
+            for future in futures:
+                future.cancel()
@@ -0,0 +1,165 @@
+"""Compact dtypes for step results, from pyarrow or from the metadata catalog.
+
+``pd.read_sql`` gives object columns for strings and dates and float64 for
+integer columns with NULLs. Two opt-in backends avoid that:
+
+- ``pyarrow``: ``read_sql`` builds Arrow-backed columns directly.
+- ``schema``: the column types stored in ``metadata/*.json`` pick nullable
+  integers, booleans, datetimes, Arrow dates and categoricals up front.
+
+Schema conversions are value-preserving: a column whose values do not fit
+the catalog type (SQLite stores anything anywhere) is left as it was read.
+"""
+
+import json
+import re
+from pathlib import Path
+from typing import Any, Optional, Union
+
+import pandas as pd
+import pyarrow as pa
+from sqlalchemy.engine import make_url
+
+DTYPE_BACKENDS = ("numpy", "pyarrow", "schema")
+
+# Low-cardinality string columns become categoricals; tiny frames gain nothing.
+CATEGORY_MIN_ROWS = 64
+CATEGORY_MAX_RATIO = 0.5
+
+_TYPE_KINDS = [
+    ("integer", re.compile(r"^(TINY|SMALL|MEDIUM|BIG)?INT(EGER)?\b|^(SMALL|BIG)?SERIAL\b")),
+    ("boolean", re.compile(r"^(BOOL(EAN)?|BIT)\b")),
+    ("datetime", re.compile(r"^(DATETIME2?|SMALLDATETIME|TIMESTAMP(?!.*\bWITH TIME ZONE))\b")),
+    ("date", re.compile(r"^DATE$")),
+    ("string", re.compile(r"^(N?VARCHAR|N?CHAR(ACTER)?|CHARACTER VARYING|N?TEXT|CITEXT|ENUM|STRING)\b")),
+]
+_TABLE_RE = re.compile(r"\b(?:FROM|JOIN)\s+([\w.\"`\[\]]+)", re.IGNORECASE)
+_COLLATE_RE = re.compile(r"\s+COLLATE\s+\S+", re.IGNORECASE)
+
+
+class ColumnTypeCatalog:
+    """SQL types of every table column in a metadata file, per database."""
+
+    def __init__(self, metadata: list[dict[str, Any]]):
+        self._tables: dict[tuple, dict[str, dict[str, str]]] = {}
+        for db in metadata:
+            key = (db.get("dialect"), db.get("host"), db.get("port"), db.get("database"))
+            self._tables[key] = {
+                table.lower(): {col["name"].lower(): col.get("type") or "" for col in columns}
+                for table, columns in db.get("tables", {}).items()
+            }
+
+    @classmethod
+    def from_file(cls, path: Union[str, Path]) -> "ColumnTypeCatalog":
+        return cls(json.loads(Path(path).read_text(encoding="utf-8")))
+
+    def step_types(self, step) -> dict[str, str]:
+        """SQL type of each result column of ``step`` that can be traced to a table column.
+
+        Columns come from ``output_columns`` sources ("table.column"); plans
+        without them fall back to column names that have a single type among
+        the tables the query reads.
+        """
+        tables = self._database_tables(step.database)
+        if not tables:
+            return {}
+
+        types = {}
+        for column in step.output_columns:
+            alias, source = column.get("alias"), column.get("source") or ""
+            table, _, name = source.rpartition(".")
+            sql_type = tables.get(table.split(".")[-1].lower(), {}).get(name.lower())
+            if alias and sql_type:
+                types[alias] = sql_type
+        if step.output_columns:
+            return types
+
+        by_name: dict[str, set[str]] = {}
+        for ref in _TABLE_RE.findall(step.query):
+            table = re.sub(r"[\"`\[\]]", "", ref).split(".")[-1].lower()
+            for name, sql_type in tables.get(table, {}).items():
+                by_name.setdefault(name, set()).add(sql_type)
+        return {name: next(iter(kinds)) for name, kinds in by_name.items() if len(kinds) == 1}
+
+    def _database_tables(self, database: str) -> dict[str, dict[str, str]]:
+        try:
+            url = make_url(database)
+        except Exception:
+            return {}
+        return self._tables.get((url.get_backend_name(), url.host, url.port, url.database), {})
+
+
+def type_kind(sql_type: str) -> Optional[str]:
+    """Coarse kind of a catalog type: integer, boolean, datetime, date, string or ``None``."""
+    sql_type = _COLLATE_RE.sub("", sql_type or "").strip().upper()
+    for kind, pattern in _TYPE_KINDS:
+        if pattern.search(sql_type):
+            return kind
+    return None
+
+
+def read_sql_options(dtype_backend: str) -> dict:
+    """Extra ``pd.read_sql`` arguments for ``dtype_backend``."""
+    if dtype_backend not in DTYPE_BACKENDS:
+        raise ValueError(
+            f"Unknown dtype backend '{dtype_backend}'; expected one of {', '.join(DTYPE_BACKENDS)}"
+        )
+    return {"dtype_backend": "pyarrow"} if dtype_backend == "pyarrow" else {}
+
+
+def compact_frame(
+    df: pd.DataFrame,
+    dtype_backend: str,
+    step=None,
+    catalog: Optional[ColumnTypeCatalog] = None,
+) -> pd.DataFrame:
+    """Apply ``dtype_backend`` to a frame that may come from ``read_sql`` or a cache."""
+    if dtype_backend == "pyarrow":
+        if all(isinstance(dtype, pd.ArrowDtype) for dtype in df.dtypes):
+            return df
+        return df.convert_dtypes(dtype_backend="pyarrow")
+
+    if dtype_backend != "schema" or catalog is None or step is None:
+        return df
+
+    if not df.columns.is_unique:
+        return df
+
+    by_lower = {str(col).lower(): col for col in df.columns}
+    converted = {}
+    for name, sql_type in catalog.step_types(step).items():
+        col = name if name in df.columns else by_lower.get(name.lower())
+        if col is not None:
+            series = _convert(df[col], type_kind(sql_type))
+            if series is not None:
+                converted[col] = series
+    return df.assign(**converted) if converted else df
+
+
+def _convert(series: pd.Series, kind: Optional[str]) -> Optional[pd.Series]:
+    """``series`` in the compact dtype for ``kind``, or ``None`` to keep it as read."""
+    dtype = series.dtype
+    if kind is None or isinstance(dtype, (pd.ArrowDtype, pd.CategoricalDtype)):
+        return None
+
+    inferred = pd.api.types.infer_dtype(series, skipna=True) if dtype == object else None
+    try:
+        if kind == "integer":
+            if pd.api.types.is_float_dtype(dtype):
+                values = series.dropna()
+                if (values == values.round()).all():
+                    return series.astype("Int64")
+            elif inferred == "integer":
+                return series.astype("Int64")
+        elif kind == "boolean" and inferred == "boolean":
+            return series.astype("boolean")
+        elif kind == "datetime" and inferred in ("datetime", "datetime64"):
+            return pd.to_datetime(series)
+        elif kind == "date" and inferred == "date":
+            return series.astype(pd.ArrowDtype(pa.date32()))
+        elif kind == "string" and inferred == "string":
+            if len(series) >= CATEGORY_MIN_ROWS and series.nunique() <= CATEGORY_MAX_RATIO * len(series):
+                return series.astype("category")
+    except (TypeError, ValueError, OverflowError, pa.ArrowException):
+        pass
+    return None
@@ -0,0 +1,210 @@
+import asyncio
+import atexit
+import math
+import threading
+import time
+from typing import Dict, Optional
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import QueuePool
+
+from src.utils.metadata_extraction import add_async_url_driver, add_url_driver
+
+
+class EngineRegistry:
+    """Process-wide cache of SQLAlchemy engines keyed by normalized URL.
+
+    Engines are created lazily on first use and kept warm between plans.
+    Engines unused for longer than ``idle_timeout`` seconds are disposed the
+    next time the registry is accessed. With ``statement_timeout`` (seconds)
+    the databases cancel statements that run longer: PostgreSQL through
+    ``statement_timeout``, MySQL through ``max_execution_time`` (SELECTs
+    only) and SQLite through a progress handler.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = 5,
+        max_overflow: int = 10,
+        pool_pre_ping: bool = True,
+        pool_recycle: int = 1800,
+        idle_timeout: Optional[float] = 600.0,
+        statement_timeout: Optional[float] = None,
+    ):
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.pool_pre_ping = pool_pre_ping
+        self.pool_recycle = pool_recycle
+        self.idle_timeout = idle_timeout
+        self.statement_timeout = statement_timeout
+
+        self._engines: Dict[str, Engine] = {}
+        self._last_used: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def get(self, url: str) -> Engine:
+        url = add_url_driver(url)
+        now = time.monotonic()
+
+        with self._lock:
+            self._evict_idle(now, keep=url)
+
+            engine = self._engines.get(url)
+            if engine is None:
+                engine = self._create_engine(url)
+                self._engines[url] = engine
+            self._last_used[url] = now
+
+        return engine
+
+    def evict_idle(self) -> int:
+        with self._lock:
+            return self._evict_idle(time.monotonic())
+
+    def dispose(self, url: Optional[str] = None) -> None:
+        with self._lock:
+            urls = list(self._engines) if url is None else [add_url_driver(url)]
+            for key in urls:
+                engine = self._engines.pop(key, None)
+                self._last_used.pop(key, None)
+                if engine is not None:
+                    self._dispose_engine(engine)
+
+    def __contains__(self, url: str) -> bool:
+        return add_url_driver(url) in self._engines
+
+    def __len__(self) -> int:
+        return len(self._engines)
+
+    def _create_engine(self, url: str) -> Engine:
+        kwargs = self._engine_options(url)
+        if self.statement_timeout:
+            return _limit_statements(url, self.statement_timeout, kwargs)
+        return create_engine(url, **kwargs)
+
+    def _engine_options(self, url: str) -> dict:
+        kwargs = {"pool_pre_ping": self.pool_pre_ping}
+
+        # Dialects such as in-memory SQLite use a singleton/static pool that
+        # rejects the sizing arguments, so only pass them to queue pools.
+        db_url = make_url(url)
+        pool_cls = db_url.get_dialect().get_pool_class(db_url)
+        if issubclass(pool_cls, QueuePool):
+            kwargs.update(
+                pool_size=self.pool_size,
+                max_overflow=self.max_overflow,
+                pool_recycle=self.pool_recycle,
+            )
+        return kwargs
+
+    def _dispose_engine(self, engine: Engine) -> None:
+        engine.dispose()
+
+    def _evict_idle(self, now: float, keep: Optional[str] = None) -> int:
+        if self.idle_timeout is None:
+            return 0
+
+        expired = [
+            url
+            for url, last_used in self._last_used.items()
+            if url != keep and now - last_used > self.idle_timeout
+        ]
+        for url in expired:
+            self._dispose_engine(self._engines.pop(url))
+            del self._last_used[url]
+
+        return len(expired)
+
+
+def _limit_statements(url: str, seconds: float, kwargs: dict) -> Engine:
+    """Engine whose connections cancel statements running longer than ``seconds``."""
+    millis = max(1, int(seconds * 1000))
+    backend = make_url(url).get_backend_name()
+    if backend == "postgresql":
+        kwargs["connect_args"] = {"options": f"-c statement_timeout={millis}"}
+    elif backend in ("mysql", "mariadb"):
+        kwargs["connect_args"] = {"init_command": f"SET SESSION max_execution_time={millis}"}
+    engine = create_engine(url, **kwargs)
+    if backend != "sqlite":
+        return engine
+
+    @event.listens_for(engine, "connect")
+    def _install_deadline(dbapi_connection, connection_record):
+        info = connection_record.info
+        dbapi_connection.set_progress_handler(
+            lambda: time.monotonic() > info.get("monk_deadline", math.inf), 10000
+        )
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start_deadline(conn, cursor, statement, parameters, context, executemany):
+        conn.info["monk_deadline"] = time.monotonic() + seconds
+
+    return engine
+
+
+class AsyncEngineRegistry(EngineRegistry):
+    """``EngineRegistry`` of ``AsyncEngine``s, keyed by the same (sync) URLs.
+
+    Async connections belong to the event loop that opened them, so one
+    registry serves a single loop and must be closed with ``aclose`` from
+    that loop before it ends; there is no process-wide async registry.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._disposals: set[asyncio.Task] = set()
+
+    def get(self, url: str) -> AsyncEngine:
+        return super().get(url)
+
+    async def aclose(self) -> None:
+        with self._lock:
+            engines = list(self._engines.values())
+            self._engines.clear()
+            self._last_used.clear()
+        for engine in engines:
+            await engine.dispose()
+        if self._disposals:
+            await asyncio.gather(*self._disposals, return_exceptions=True)
+
+    def _create_engine(self, url: str) -> AsyncEngine:
+        async_url = add_async_url_driver(url)
+        return create_async_engine(async_url, **self._engine_options(async_url))
+
+    def _dispose_engine(self, engine: AsyncEngine) -> None:
+        # Idle engines are evicted from ``get``, which runs on the loop but
+        # cannot await, so their connections are closed by a task that
+        # ``aclose`` waits for. Without a running loop they cannot be closed
+        # at all and are only dropped from the pool.
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            engine.sync_engine.dispose(close=False)
+            return
+        task = loop.create_task(engine.dispose())
+        self._disposals.add(task)
+        task.add_done_callback(self._disposals.discard)
+
+
+_registry = EngineRegistry()
+
+
+def get_engine_registry() -> EngineRegistry:
+    return _registry
+
+
+def configure_engine_registry(**options) -> EngineRegistry:
+    """Replace the process-wide registry, disposing the engines of the old one."""
+    global _registry
+    _registry.dispose()
+    _registry = EngineRegistry(**options)
+    return _registry
+
+
+def dispose_engines() -> None:
+    _registry.dispose()
+
+
+atexit.register(dispose_engines)
@@ -0,0 +1,334 @@
+"""Per-step timings, sizes and row counts of plan execution, delivered to hooks.
+
+``execute_plan`` fills one ``StepMetrics`` per step and a ``PlanMetrics``
+for the whole plan, and hands them to ``ExecutionHooks`` as steps and plans
+finish. Hooks ship with the repo for ``logging``, JSONL files, in-memory
+collection and OpenTelemetry spans (when ``opentelemetry-api`` is
+installed). Progress lines go through ``say``, which ``quiet_output``
+silences for the current context (threads need ``contextvars.copy_context``).
+"""
+
+import contextvars
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Iterator, Optional, Sequence, Union
+
+import pandas as pd
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_quiet = contextvars.ContextVar("monk_quiet", default=False)
+
+# Key under Connection.info where the step being read collects statement timings.
+_METRICS_KEY = "monk_step_metrics"
+_STARTED_KEY = "monk_cursor_started"
+
+
+def say(*args, **kwargs) -> None:
+    """``print`` unless output is silenced by ``quiet_output``."""
+    if not _quiet.get():
+        print(*args, **kwargs)
+
+
+@contextmanager
+def quiet_output(quiet: bool = True):
+    """Silence ``say`` inside the block; an enclosing quiet block stays quiet."""
+    token = _quiet.set(_quiet.get() or quiet)
+    try:
+        yield
+    finally:
+        _quiet.reset(token)
+
+
+@dataclass
+class StepMetrics:
+    step_id: int
+    database: str
+    started_at: float = 0.0
+    ended_at: float = 0.0
+    queue_wait_s: float = 0.0
+    prepare_s: float = 0.0
+    connect_s: float = 0.0
+    execute_s: float = 0.0
+    fetch_s: float = 0.0
+    join_s: float = 0.0
+    statements: int = 0
+    placeholder_values: int = 0
+    query_rows: int = 0
+    rows: int = 0
+    bytes: int = 0
+    cache_hit: bool = False
+    streamed: bool = False
+    error: Optional[str] = None
+
+    @property
+    def duration_s(self) -> float:
+        return max(0.0, self.ended_at - self.started_at)
+
+    def observe(self, df: pd.DataFrame) -> None:
+        """Record the size of the step's result."""
+        self.rows = len(df)
+        self.bytes = estimate_bytes(df)
+
+
+@dataclass
+class PlanMetrics:
+    label: Optional[str] = None
+    started_at: float = 0.0
+    ended_at: float = 0.0
+    aggregation_s: float = 0.0
+    rows: int = 0
+    error: Optional[str] = None
+    steps: list[StepMetrics] = field(default_factory=list)
+
+    @property
+    def duration_s(self) -> float:
+        return max(0.0, self.ended_at - self.started_at)
+
+    def to_dict(self) -> dict:
+        payload = asdict(self)
+        payload["duration_s"] = self.duration_s
+        for step, step_payload in zip(self.steps, payload["steps"]):
+            step_payload["duration_s"] = step.duration_s
+        return payload
+
+
+class ExecutionHooks:
+    """Receives metrics as execution progresses; override the events of interest."""
+
+    def on_step_end(self, plan: PlanMetrics, step: StepMetrics) -> None:
+        pass
+
+    def on_plan_end(self, plan: PlanMetrics) -> None:
+        pass
+
+
+class LoggingHooks(ExecutionHooks):
+    def __init__(self, logger: Optional[logging.Logger] = None, level: int = logging.INFO):
+        self.logger = logger or logging.getLogger("monk.execution")
+        self.level = level
+
+    def on_step_end(self, plan: PlanMetrics, step: StepMetrics) -> None:
+        self.logger.log(
+            self.level,
+            "step %s on %s: %d rows, %d bytes, wait %.3fs, prepare %.3fs, connect %.3fs, "
+            "execute %.3fs, fetch %.3fs, join %.3fs%s",
+            step.step_id, step.database, step.rows, step.bytes, step.queue_wait_s,
+            step.prepare_s, step.connect_s, step.execute_s, step.fetch_s, step.join_s,
+            f", failed: {step.error}" if step.error else "",
+        )
+
+    def on_plan_end(self, plan: PlanMetrics) -> None:
+        self.logger.log(
+            self.level,
+            "plan %s: %d rows in %.3fs (aggregation %.3fs)%s",
+            plan.label or "", plan.rows, plan.duration_s, plan.aggregation_s,
+            f", failed: {plan.error}" if plan.error else "",
+        )
+
+
+class JsonlHooks(ExecutionHooks):
+    """Appends one JSON line per finished plan, with its steps nested."""
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    def on_plan_end(self, plan: PlanMetrics) -> None:
+        line = json.dumps(plan.to_dict(), ensure_ascii=False, default=str)
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self.path.open("a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+class CollectingHooks(ExecutionHooks):
+    """Keeps the metrics of every finished plan in ``plans``."""
+
+    def __init__(self):
+        self.plans: list[PlanMetrics] = []
+
+    def on_plan_end(self, plan: PlanMetrics) -> None:
+        self.plans.append(plan)
+
+
+class OpenTelemetryHooks(ExecutionHooks):
+    """Emits a span per plan with a child span per step, timed after the fact."""
+
+    def __init__(self, tracer=None):
+        try:
+            from opentelemetry import trace
+        except ImportError as e:
+            raise ImportError("OpenTelemetryHooks needs the 'opentelemetry-api' package") from e
+        self._trace = trace
+        self.tracer = tracer or trace.get_tracer("monk.execution")
+
+    def on_plan_end(self, plan: PlanMetrics) -> None:
+        plan_span = self.tracer.start_span(
+            f"plan {plan.label}" if plan.label else "plan",
+            start_time=_ns(plan.started_at),
+            attributes={
+                "monk.plan.rows": plan.rows,
+                "monk.plan.aggregation_s": plan.aggregation_s,
+            },
+        )
+        context = self._trace.set_span_in_context(plan_span)
+        for step in plan.steps:
+            attributes = {
+                f"monk.step.{name}": value
+                for name, value in asdict(step).items()
+                if name not in ("started_at", "ended_at", "error") and value is not None
+            }
+            step_span = self.tracer.start_span(
+                f"step {step.step_id}",
+                context=context,
+                start_time=_ns(step.started_at),
+                attributes=attributes,
+            )
+            if step.error:
+                step_span.set_status(self._trace.Status(self._trace.StatusCode.ERROR, step.error))
+            step_span.end(end_time=_ns(step.ended_at))
+        if plan.error:
+            plan_span.set_status(self._trace.Status(self._trace.StatusCode.ERROR, plan.error))
+        plan_span.end(end_time=_ns(plan.ended_at))
+
+
+class PlanRecorder:
+    """Builds the metrics of one plan execution and forwards them to its hooks."""
+
+    def __init__(
+        self,
+        hooks: Union[ExecutionHooks, Sequence[ExecutionHooks], None] = None,
+        label: Optional[str] = None,
+    ):
+        if hooks is None:
+            hooks = []
+        elif isinstance(hooks, ExecutionHooks):
+            hooks = [hooks]
+        self.hooks = list(hooks)
+        self.plan = PlanMetrics(label=label, started_at=time.time())
+        self._ready_at: dict[int, float] = {}
+        self._lock = threading.Lock()
+
+    def mark_ready(self, step_id: int) -> None:
+        """Record that every dependency of ``step_id`` has finished."""
+        with self._lock:
+            self._ready_at.setdefault(step_id, time.time())
+
+    @contextmanager
+    def step(self, step, streamed: bool = False) -> Iterator[StepMetrics]:
+        """Time one step; call ``observe`` on the yielded metrics with its result."""
+        now = time.time()
+        with self._lock:
+            ready_at = self._ready_at.get(step.id, now)
+        metrics = StepMetrics(
+            step_id=step.id,
+            database=_safe_url(step.database),
+            started_at=now,
+            queue_wait_s=max(0.0, now - ready_at),
+            streamed=streamed,
+        )
+        try:
+            yield metrics
+        except BaseException as e:
+            metrics.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            metrics.ended_at = time.time()
+            with self._lock:
+                self.plan.steps.append(metrics)
+            self._notify("on_step_end", self.plan, metrics)
+
+    def end_plan(self, df: Optional[pd.DataFrame] = None, error: Optional[BaseException] = None) -> PlanMetrics:
+        self.plan.ended_at = time.time()
+        if df is not None:
+            self.plan.rows = len(df)
+        if error is not None:
+            self.plan.error = f"{type(error).__name__}: {error}"
+        self.plan.steps.sort(key=lambda step: step.started_at)
+        self._notify("on_plan_end", self.plan)
+        return self.plan
+
+    def _notify(self, event_name: str, *args) -> None:
+        for hook in self.hooks:
+            try:
+                getattr(hook, event_name)(*args)
+            except Exception as e:
+                # Metrics are a side channel; a broken hook must not fail the plan.
+                say(f"⚠️ Execution hook {type(hook).__name__}.{event_name} failed: {e}")
+
+
+def estimate_bytes(df: pd.DataFrame) -> int:
+    """Shallow ``memory_usage``: exact for numeric columns, pointers only for objects."""
+    return int(df.memory_usage(index=False, deep=False).sum())
+
+
+@contextmanager
+def timer(metrics, attribute: str) -> Iterator[None]:
+    """Add the wall time of the block to ``metrics.<attribute>``; a no-op without metrics."""
+    if metrics is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        setattr(metrics, attribute, getattr(metrics, attribute) + time.perf_counter() - started)
+
+
+@contextmanager
+def timed_read(conn, metrics: Optional[StepMetrics], attribute: str = "fetch_s") -> Iterator[None]:
+    """Split the time of reads on ``conn`` into statement execution and ``attribute``.
+
+    Cursor execution is timed by SQLAlchemy events on every ``Engine``; the
+    rest of the block (fetching rows and building frames, or rendering
+    statements for ``prepare_s``) goes to ``attribute``.
+    """
+    if metrics is None:
+        yield
+        return
+    conn.info[_METRICS_KEY] = metrics
+    executed = metrics.execute_s
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        conn.info.pop(_METRICS_KEY, None)
+        conn.info.pop(_STARTED_KEY, None)
+        elapsed = time.perf_counter() - started
+        spent = max(0.0, elapsed - (metrics.execute_s - executed))
+        setattr(metrics, attribute, getattr(metrics, attribute) + spent)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _METRICS_KEY in conn.info:
+        conn.info.setdefault(_STARTED_KEY, []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    metrics = conn.info.get(_METRICS_KEY)
+    started = conn.info.get(_STARTED_KEY)
+    if metrics is None or not started:
+        return
+    metrics.execute_s += time.perf_counter() - started.pop()
+    metrics.statements += 1
+
+
+def _safe_url(url: str) -> str:
+    try:
+        from sqlalchemy.engine import make_url
+
+        return make_url(url).render_as_string(hide_password=True)
+    except Exception:
+        return url
+
+
+def _ns(seconds: float) -> int:
+    return int(seconds * 1_000_000_000)
@@ -0,0 +1,118 @@
+"""Application-side equi-joins that pick an algorithm from the frames' shapes.
+
+Every strategy returns the same rows and columns as ``pd.merge`` with
+``left_on``/``right_on``; only the work done to get there differs:
+
+- ``broadcast``: one side is tiny, so the other side is first reduced to the
+  rows whose key occurs in it (only on sides the join does not preserve).
+- ``sort_merge``: both single-column keys are already sorted, so the
+  indexers come from a linear merge of the two key indexes.
+- ``hash``: ``pd.merge``, which factorizes both key columns into a hash table.
+"""
+
+from typing import Sequence
+
+import numpy as np
+import pandas as pd
+
+BROADCAST_MAX_ROWS = 1024
+BROADCAST_MIN_RATIO = 16
+
+
+def choose_join_strategy(
+    left: pd.DataFrame,
+    right: pd.DataFrame,
+    left_on: Sequence[str],
+    right_on: Sequence[str],
+    how: str,
+) -> str:
+    small, large = sorted((len(left), len(right)))
+    reducible = _reducible_sides(how)
+    smaller_side = "left" if len(left) <= len(right) else "right"
+    larger_side = "right" if smaller_side == "left" else "left"
+    if (
+        larger_side in reducible
+        and small <= BROADCAST_MAX_ROWS
+        and large >= BROADCAST_MIN_RATIO * max(small, 1)
+    ):
+        return "broadcast"
+
+    if len(left_on) == 1 and _sorted_keys(left[left_on[0]], right[right_on[0]]):
+        return "sort_merge"
+
+    return "hash"
+
+
+def join_frames(
+    left: pd.DataFrame,
+    right: pd.DataFrame,
+    left_on: Sequence[str],
+    right_on: Sequence[str],
+    how: str,
+) -> tuple[pd.DataFrame, str]:
+    """Join ``left`` and ``right``; returns the result and the strategy used."""
+    left_on, right_on = list(left_on), list(right_on)
+    strategy = choose_join_strategy(left, right, left_on, right_on, how)
+
+    if strategy == "broadcast":
+        if len(left) <= len(right):
+            right = right[key_isin(right, right_on, left, left_on)]
+        else:
+            left = left[key_isin(left, left_on, right, right_on)]
+    elif strategy == "sort_merge":
+        joined = _sort_merge(left, right, left_on[0], right_on[0], how)
+        if joined is not None:
+            return joined, strategy
+        strategy = "hash"
+
+    merged = pd.merge(left=left, right=right, how=how, left_on=left_on, right_on=right_on)
+    return merged, strategy
+
+
+def _reducible_sides(how: str) -> set[str]:
+    """Sides whose unmatched rows the join drops, so they may be pre-reduced."""
+    return {"inner": {"left", "right"}, "left": {"right"}, "right": {"left"}}.get(how, set())
+
+
+def _sorted_keys(left_key: pd.Series, right_key: pd.Series) -> bool:
+    if left_key.dtype != right_key.dtype or left_key.dtype == object:
+        return False
+    if left_key.hasnans or right_key.hasnans:
+        return False
+    return left_key.is_monotonic_increasing and right_key.is_monotonic_increasing
+
+
+def key_isin(
+    frame: pd.DataFrame, frame_on: list[str], other: pd.DataFrame, other_on: list[str]
+) -> np.ndarray:
+    """Mask of the rows of ``frame`` whose (composite) key occurs in ``other``."""
+    if len(frame_on) == 1:
+        return frame[frame_on[0]].isin(other[other_on[0]]).to_numpy()
+    keys = pd.MultiIndex.from_frame(other[other_on], names=frame_on)
+    return pd.MultiIndex.from_frame(frame[frame_on]).isin(keys)
+
+
+def _sort_merge(
+    left: pd.DataFrame, right: pd.DataFrame, left_key: str, right_key: str, how: str
+):
+    overlapping = set(left.columns) & set(right.columns)
+    if overlapping:
+        # pd.merge adds _x/_y suffixes here; let it handle the naming.
+        return None
+
+    _, left_idx, right_idx = pd.Index(left[left_key]).join(
+        pd.Index(right[right_key]), how=how, return_indexers=True
+    )
+    left_part = _take(left, left_idx)
+    right_part = _take(right, right_idx)
+    return pd.concat([left_part, right_part], axis=1)
+
+
+def _take(frame: pd.DataFrame, indexer) -> pd.DataFrame:
+    frame = frame.reset_index(drop=True)
+    if indexer is None:
+        return frame
+    if (indexer >= 0).all():
+        return frame.take(indexer).reset_index(drop=True)
+    # -1 marks rows without a partner; reindexing fills them with NaN like pd.merge.
+    return frame.reindex(indexer).reset_index(drop=True)
@@ -1,19 +1,112 @@
-from sqlalchemy import create_engine, inspect
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional, Union
+
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.engine import make_url
 
 from src.utils.column_serialization import serialize_column
+from src.utils.instrumentation import say
+
+# One query per catalog view, returning (table, ...) rows whose hash changes
+# whenever a table's columns or key constraints change.
+_CATALOG_QUERIES = {
+    "sqlite": [
+        "SELECT name, sql FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'",
+    ],
+    "postgresql": [
+        "SELECT c.relname, a.attnum, a.attname, format_type(a.atttypid, a.atttypmod), "
+        "a.attnotnull, pg_get_expr(d.adbin, d.adrelid), col_description(c.oid, a.attnum) "
+        "FROM pg_catalog.pg_attribute a "
+        "JOIN pg_catalog.pg_class c ON c.oid = a.attrelid "
+        "LEFT JOIN pg_catalog.pg_attrdef d ON d.adrelid = a.attrelid AND d.adnum = a.attnum "
+        "WHERE c.relnamespace = current_schema()::regnamespace AND c.relkind IN ('r', 'p') "
+        "AND a.attnum > 0 AND NOT a.attisdropped",
+        "SELECT c.relname, con.conname, pg_get_constraintdef(con.oid) "
+        "FROM pg_catalog.pg_constraint con "
+        "JOIN pg_catalog.pg_class c ON c.oid = con.conrelid "
+        "WHERE c.relnamespace = current_schema()::regnamespace AND con.contype IN ('p', 'f')",
+    ],
+    "mysql": [
+        "SELECT TABLE_NAME, ORDINAL_POSITION, COLUMN_NAME, COLUMN_TYPE, IS_NULLABLE, "
+        "COLUMN_DEFAULT, EXTRA, COLUMN_COMMENT, COLLATION_NAME "
+        "FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE()",
+        "SELECT TABLE_NAME, CONSTRAINT_NAME, ORDINAL_POSITION, COLUMN_NAME, "
+        "REFERENCED_TABLE_NAME, REFERENCED_COLUMN_NAME "
+        "FROM information_schema.KEY_COLUMN_USAGE WHERE TABLE_SCHEMA = DATABASE()",
+    ],
+    "mssql": [
+        "SELECT TABLE_NAME, ORDINAL_POSITION, COLUMN_NAME, DATA_TYPE, IS_NULLABLE, "
+        "COLUMN_DEFAULT, CHARACTER_MAXIMUM_LENGTH, NUMERIC_PRECISION, NUMERIC_SCALE "
+        "FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_SCHEMA = SCHEMA_NAME()",
+        "SELECT TABLE_NAME, CONSTRAINT_NAME, ORDINAL_POSITION, COLUMN_NAME "
+        "FROM INFORMATION_SCHEMA.KEY_COLUMN_USAGE WHERE TABLE_SCHEMA = SCHEMA_NAME()",
+    ],
+}
+
+
+def extract_db_info(urls: list[str], max_workers: int = 8) -> list:
+    """Extract the metadata of every database concurrently, in the order of ``urls``."""
+    infos, _ = _extract_all(urls, max_workers, previous={}, fingerprints={})
+    return infos
+
 
+def refresh_metadata(
+    urls: list[str],
+    output_path: Union[str, Path],
+    incremental: bool = True,
+    max_workers: int = 8,
+) -> list:
+    """Extract metadata into ``output_path``, reusing unchanged tables from the last run.
 
-def extract_db_info(urls: str) -> dict:
-    infos = []
-    for url in urls:
-        url = add_url_driver(url)
+    Per-table DDL fingerprints are kept next to the metadata file in
+    ``<name>.ddl.json``; with ``incremental`` only tables whose fingerprint
+    changed (or that have none) are reflected again.
+    """
+    output_path = Path(output_path)
+    fingerprints_path = output_path.with_suffix(".ddl.json")
+
+    previous, fingerprints = {}, {}
+    if incremental and output_path.exists() and fingerprints_path.exists():
+        previous = {
+            _database_key(payload): payload
+            for payload in json.loads(output_path.read_text(encoding="utf-8"))
+        }
+        fingerprints = json.loads(fingerprints_path.read_text(encoding="utf-8"))
+
+    infos, fingerprints = _extract_all(urls, max_workers, previous, fingerprints)
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    _write_json_atomic(output_path, infos)
+    _write_json_atomic(fingerprints_path, fingerprints)
+    return infos
 
-        engine = create_engine(url)
 
+def _extract_all(
+    urls: list[str], max_workers: int, previous: dict, fingerprints: dict
+) -> tuple[list, dict]:
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(urls) or 1))) as executor:
+        futures = [
+            executor.submit(_extract_database, url, previous, fingerprints) for url in urls
+        ]
+        results = [future.result() for future in futures]
+
+    infos = [payload for payload, _ in results]
+    new_fingerprints = {
+        _database_key(payload): tables for payload, tables in results if tables is not None
+    }
+    return infos, new_fingerprints
+
+
+def _extract_database(url: str, previous: dict, fingerprints: dict) -> tuple[dict, Optional[dict]]:
+    url = add_url_driver(url)
+    engine = create_engine(url)
+    try:
         db = make_url(url)
         dialect = engine.dialect
-        insp = inspect(engine)
 
         payload = {
             "dialect": db.get_backend_name(),
@@ -27,42 +120,111 @@ def extract_db_info(urls: str) -> dict:
             "database": db.database,
             "tables": {},
         }
+        key = _database_key(payload)
 
-        for table in insp.get_table_names():
-            pk_constraint = insp.get_pk_constraint(table) or {}
-            pk_columns = pk_constraint.get("constrained_columns") or []
-
-            fk_constraints = insp.get_foreign_keys(table)
-            fk_map = {}
-            for fk in fk_constraints:
-                constrained_columns = fk.get("constrained_columns") or []
-                referred_table = fk.get("referred_table")
-                referred_schema = fk.get("referred_schema")
-                referred_columns = fk.get("referred_columns") or []
-
-                for idx, col_name in enumerate(constrained_columns):
-                    reference = {
-                        "table": referred_table,
-                        "column": referred_columns[idx]
-                        if idx < len(referred_columns)
-                        else None,
-                    }
-
-                    if referred_schema:
-                        reference["schema"] = referred_schema
-
-                    fk_map.setdefault(col_name, []).append(reference)
-
-            cols = [
-                serialize_column(col, dialect, pk_columns=pk_columns, fk_map=fk_map)
-                for col in insp.get_columns(table)
+        with engine.connect() as conn:
+            insp = inspect(conn)
+            table_names = insp.get_table_names()
+            current = _table_fingerprints(conn, payload["dialect"])
+
+            old_tables = previous.get(key, {}).get("tables", {})
+            old_fingerprints = fingerprints.get(key, {})
+            stale = [
+                table
+                for table in table_names
+                if current is None
+                or table not in old_tables
+                or current.get(table) is None
+                or old_fingerprints.get(table) != current.get(table)
             ]
 
-            payload["tables"][table] = cols
+            reflected = _reflect_tables(insp, dialect, stale) if stale else {}
 
-        infos.append(payload)
+        for table in table_names:
+            payload["tables"][table] = reflected[table] if table in reflected else old_tables[table]
 
-    return infos
+        reused = len(table_names) - len(stale)
+        if reused:
+            say(f"♻️ {payload['database']}: reused {reused} table(s), refreshed {len(stale)}")
+
+        return payload, current
+    finally:
+        engine.dispose()
+
+
+def _reflect_tables(insp, dialect, tables: list[str]) -> dict:
+    """Reflect ``tables`` with the inspector's bulk ``get_multi_*`` calls.
+
+    Dialects with batched reflection (PostgreSQL, Oracle) answer each call
+    with one catalog query; the others fall back to per-table queries.
+    """
+    columns = insp.get_multi_columns(filter_names=tables)
+    pk_constraints = insp.get_multi_pk_constraint(filter_names=tables)
+    fk_constraints = insp.get_multi_foreign_keys(filter_names=tables)
+
+    reflected = {}
+    for (_, table), table_columns in columns.items():
+        pk_constraint = pk_constraints.get((None, table)) or {}
+        pk_columns = pk_constraint.get("constrained_columns") or []
+
+        fk_map = {}
+        for fk in fk_constraints.get((None, table)) or []:
+            constrained_columns = fk.get("constrained_columns") or []
+            referred_table = fk.get("referred_table")
+            referred_schema = fk.get("referred_schema")
+            referred_columns = fk.get("referred_columns") or []
+
+            for idx, col_name in enumerate(constrained_columns):
+                reference = {
+                    "table": referred_table,
+                    "column": referred_columns[idx]
+                    if idx < len(referred_columns)
+                    else None,
+                }
+
+                if referred_schema:
+                    reference["schema"] = referred_schema
+
+                fk_map.setdefault(col_name, []).append(reference)
+
+        reflected[table] = [
+            serialize_column(col, dialect, pk_columns=pk_columns, fk_map=fk_map)
+            for col in table_columns
+        ]
+
+    return reflected
+
+
+def _table_fingerprints(conn, dialect_name: str) -> Optional[dict]:
+    """Hash of each table's catalog rows, or ``None`` when the dialect has no catalog query."""
+    queries = _CATALOG_QUERIES.get(dialect_name)
+    if queries is None:
+        return None
+
+    rows_by_table: dict[str, list[str]] = {}
+    try:
+        for query in queries:
+            for row in conn.execute(text(query)):
+                rows_by_table.setdefault(row[0], []).append(repr(tuple(row[1:])))
+    except Exception as e:
+        say(f"⚠️ Could not read the catalog ({e}); reflecting every table")
+        conn.rollback()
+        return None
+
+    return {
+        table: hashlib.sha256("\n".join(sorted(rows)).encode("utf-8")).hexdigest()
+        for table, rows in rows_by_table.items()
+    }
+
+
+def _database_key(payload: dict) -> str:
+    return f"{payload['dialect']}://{payload['host'] or ''}:{payload['port'] or ''}/{payload['database']}"
+
+
+def _write_json_atomic(path: Path, data) -> None:
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_text(json.dumps(data, indent=4, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp_path, path)
 
 
 def add_url_driver(url: str) -> str:
@@ -80,4 +242,27 @@ def add_url_driver(url: str) -> str:
             return url.replace(dialect, "mysql+pymysql")
         case "mssql":
             return url.replace(dialect, "mssql+pyodbc")
-        
\ No newline at end of file
+        case _:
+            return url
+
+
+# asyncio drivers for the dialects of add_url_driver, for create_async_engine.
+_ASYNC_DRIVERS = {
+    "postgresql": "asyncpg",
+    "oracle": "oracledb_async",
+    "mysql": "aiomysql",
+    "mssql": "aioodbc",
+    "sqlite": "aiosqlite",
+}
+_ASYNC_CAPABLE = {"asyncpg", "psycopg_async", "oracledb_async", "aiomysql", "asyncmy", "aioodbc", "aiosqlite"}
+
+
+def add_async_url_driver(url: str) -> str:
+    """``url`` with the asyncio driver of its dialect, replacing a sync driver if needed."""
+    url = add_url_driver(url)
+    dialect, sep, rest = url.partition("://")
+    backend, _, driver = dialect.partition("+")
+
+    if driver in _ASYNC_CAPABLE or backend not in _ASYNC_DRIVERS:
+        return url
+    return f"{backend}+{_ASYNC_DRIVERS[backend]}{sep}{rest}"
@@ -0,0 +1,105 @@
+"""Step queries compiled once into literal segments and ``$stepN.column`` slots."""
+
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable
+
+_PLACEHOLDER = r"\$step(?P<{p}step_id>\d+)\.(?P<{p}column>\w+)"
+
+# A placeholder that is the sole operand of an IN list is captured together
+# with the surrounding "IN (" / ")" so transports can replace the whole list.
+_SLOT_RE = re.compile(
+    r"(?P<prefix>(?i:\b(?P<negated>NOT\s+)?IN\s*\(\s*))"
+    + _PLACEHOLDER.format(p="in_")
+    + r"(?P<suffix>\s*\))"
+    + "|"
+    + _PLACEHOLDER.format(p="")
+)
+_STRAY_STEP_RE = re.compile(r"\$step\w*")
+
+
+@dataclass(frozen=True)
+class Slot:
+    step_id: int
+    column: str
+    in_list: bool = False
+    negated: bool = False
+    prefix: str = ""
+    suffix: str = ""
+
+    @property
+    def token(self) -> str:
+        return f"$step{self.step_id}.{self.column}"
+
+
+@dataclass(frozen=True)
+class QueryTemplate:
+    source: str
+    segments: tuple[str, ...]
+    slots: tuple[Slot, ...]
+
+    @property
+    def tokens(self) -> list[str]:
+        """Distinct placeholder tokens, in order of first appearance."""
+        return list(dict.fromkeys(slot.token for slot in self.slots))
+
+    @property
+    def step_ids(self) -> set[int]:
+        return {slot.step_id for slot in self.slots}
+
+    @property
+    def static_sql(self) -> str:
+        """The query text with every slot removed."""
+        return " ".join(self.segments)
+
+    def wrap(self, prefix: str, suffix: str) -> "QueryTemplate":
+        """Embed the query between ``prefix`` and ``suffix``, e.g. as a derived table."""
+        segments = list(self.segments)
+        segments[-1] = segments[-1].rstrip().rstrip(";")
+        segments[0] = prefix + segments[0]
+        segments[-1] = segments[-1] + suffix
+        source = prefix + self.source.rstrip().rstrip(";") + suffix
+        return QueryTemplate(source=source, segments=tuple(segments), slots=self.slots)
+
+    def render(self, fragment: Callable[[Slot], str]) -> str:
+        parts = [self.segments[0]]
+        for slot, segment in zip(self.slots, self.segments[1:]):
+            parts.append(fragment(slot))
+            parts.append(segment)
+        return "".join(parts)
+
+
+@lru_cache(maxsize=1024)
+def compile_query(query: str) -> QueryTemplate:
+    segments: list[str] = []
+    slots: list[Slot] = []
+    position = 0
+
+    for match in _SLOT_RE.finditer(query):
+        segments.append(query[position : match.start()])
+        if match.group("in_step_id") is not None:
+            slots.append(
+                Slot(
+                    step_id=int(match.group("in_step_id")),
+                    column=match.group("in_column"),
+                    in_list=True,
+                    negated=bool(match.group("negated")),
+                    prefix=match.group("prefix"),
+                    suffix=match.group("suffix"),
+                )
+            )
+        else:
+            slots.append(Slot(step_id=int(match.group("step_id")), column=match.group("column")))
+        position = match.end()
+
+    segments.append(query[position:])
+
+    for segment in segments:
+        stray = _STRAY_STEP_RE.search(segment)
+        if stray:
+            raise ValueError(
+                f"Malformed placeholder '{stray.group(0)}' in query; expected $step<id>.<column>"
+            )
+
+    return QueryTemplate(source=query, segments=tuple(segments), slots=tuple(slots))
@@ -0,0 +1,243 @@
+"""Opt-in cache of step results keyed by database URL and fully substituted SQL."""
+
+import hashlib
+import os
+import shutil
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Union
+
+import pandas as pd
+
+from src.utils.instrumentation import say
+from src.utils.metadata_extraction import add_url_driver
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    stores: int = 0
+    evictions: int = 0
+
+    def __str__(self) -> str:
+        lookups = self.hits + self.misses
+        ratio = f"{self.hits / lookups:.0%}" if lookups else "n/a"
+        return (
+            f"hits={self.hits} misses={self.misses} hit_ratio={ratio} "
+            f"stores={self.stores} evictions={self.evictions}"
+        )
+
+
+class StepCache(ABC):
+    """What the executors need of a step cache: lookups, stores and invalidation."""
+
+    stats: CacheStats
+
+    @abstractmethod
+    def get(self, db_url: str, sql: str) -> Optional[pd.DataFrame]:
+        """The result of ``sql`` on ``db_url``, or ``None`` on a miss."""
+
+    @abstractmethod
+    def put(self, db_url: str, sql: str, df: pd.DataFrame) -> None:
+        """Remember ``df`` as the result of ``sql`` on ``db_url``."""
+
+    @abstractmethod
+    def invalidate(self, db_url: Optional[str] = None) -> None:
+        """Drop every entry, or only those of one database."""
+
+
+class StepResultCache(StepCache):
+    """Size-bounded LRU cache with an optional TTL.
+
+    Subclasses decide where frames live by implementing ``_load``,
+    ``_store``, ``_evict`` and ``_drop``; this class owns keys, expiry and
+    the hit/miss counters.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, ttl_seconds: Optional[float] = None):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+
+    def get(self, db_url: str, sql: str) -> Optional[pd.DataFrame]:
+        db_key, sql_key = self._keys(db_url, sql)
+        with self._lock:
+            df = self._load(db_key, sql_key)
+            if df is None:
+                self.stats.misses += 1
+            else:
+                self.stats.hits += 1
+            return df
+
+    def put(self, db_url: str, sql: str, df: pd.DataFrame) -> None:
+        db_key, sql_key = self._keys(db_url, sql)
+        with self._lock:
+            if self._store(db_key, sql_key, df):
+                self.stats.stores += 1
+                self.stats.evictions += self._evict()
+
+    def invalidate(self, db_url: Optional[str] = None) -> None:
+        """Drop every entry, or only those of one database."""
+        with self._lock:
+            self._drop(None if db_url is None else self._db_key(db_url))
+
+    def _expired(self, created: float) -> bool:
+        return self.ttl_seconds is not None and time.time() - created > self.ttl_seconds
+
+    def _keys(self, db_url: str, sql: str) -> tuple[str, str]:
+        return self._db_key(db_url), hashlib.sha256(sql.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _db_key(db_url: str) -> str:
+        return hashlib.sha256(add_url_driver(db_url).encode("utf-8")).hexdigest()[:16]
+
+    @abstractmethod
+    def _load(self, db_key: str, sql_key: str) -> Optional[pd.DataFrame]:
+        """The stored frame, or ``None`` when it is missing or expired."""
+
+    @abstractmethod
+    def _store(self, db_key: str, sql_key: str, df: pd.DataFrame) -> bool:
+        """Store ``df``; ``False`` when it is not kept (e.g. too large)."""
+
+    @abstractmethod
+    def _evict(self) -> int:
+        """Evict entries until the cache fits ``max_bytes``; the number evicted."""
+
+    @abstractmethod
+    def _drop(self, db_key: Optional[str]) -> None:
+        """Remove every entry, or only those of one database."""
+
+
+class MemoryResultCache(StepResultCache):
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, ttl_seconds: Optional[float] = None):
+        super().__init__(max_bytes=max_bytes, ttl_seconds=ttl_seconds)
+        self._entries: OrderedDict[tuple[str, str], tuple[float, int, pd.DataFrame]] = OrderedDict()
+        self._size = 0
+
+    def _load(self, db_key, sql_key):
+        key = (db_key, sql_key)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        created, _, df = entry
+        if self._expired(created):
+            self._remove(key)
+            return None
+
+        self._entries.move_to_end(key)
+        return df.copy(deep=False)
+
+    def _store(self, db_key, sql_key, df):
+        key = (db_key, sql_key)
+        if key in self._entries:
+            self._remove(key)
+
+        nbytes = int(df.memory_usage(index=True, deep=True).sum())
+        if nbytes > self.max_bytes:
+            return False
+
+        self._entries[key] = (time.time(), nbytes, df.copy(deep=False))
+        self._size += nbytes
+        return True
+
+    def _evict(self):
+        evicted = 0
+        while self._size > self.max_bytes and self._entries:
+            self._remove(next(iter(self._entries)))
+            evicted += 1
+        return evicted
+
+    def _drop(self, db_key):
+        for key in [k for k in self._entries if db_key is None or k[0] == db_key]:
+            self._remove(key)
+
+    def _remove(self, key):
+        _, nbytes, _ = self._entries.pop(key)
+        self._size -= nbytes
+
+
+class DiskResultCache(StepResultCache):
+    """Parquet files under ``<directory>/<db hash>/<sql hash>.parquet``.
+
+    The file mtime records when an entry was written (for the TTL) and the
+    atime is bumped on every hit (for LRU eviction).
+    """
+
+    def __init__(
+        self,
+        directory: Union[str, Path],
+        max_bytes: int = 1024 * 1024 * 1024,
+        ttl_seconds: Optional[float] = None,
+    ):
+        super().__init__(max_bytes=max_bytes, ttl_seconds=ttl_seconds)
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, db_key: str, sql_key: str) -> Path:
+        return self.directory / db_key / f"{sql_key}.parquet"
+
+    def _load(self, db_key, sql_key):
+        path = self._path(db_key, sql_key)
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+
+        if self._expired(stat.st_mtime):
+            path.unlink(missing_ok=True)
+            return None
+
+        try:
+            df = pd.read_parquet(path)
+        except Exception:
+            path.unlink(missing_ok=True)
+            return None
+
+        os.utime(path, (time.time(), stat.st_mtime))
+        return df
+
+    def _store(self, db_key, sql_key, df):
+        path = self._path(db_key, sql_key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            df.to_parquet(tmp_path, index=False)
+        except Exception as e:
+            # Frames with mixed-type object columns have no Parquet schema.
+            tmp_path.unlink(missing_ok=True)
+            say(f"ℹ️ Step result not cached: {e}")
+            return False
+
+        os.replace(tmp_path, path)
+        return True
+
+    def _evict(self):
+        entries = []
+        total = 0
+        for path in self.directory.glob("*/*.parquet"):
+            stat = path.stat()
+            entries.append((stat.st_atime, stat.st_size, path))
+            total += stat.st_size
+
+        evicted = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            evicted += 1
+        return evicted
+
+    def _drop(self, db_key):
+        if db_key is None:
+            for child in self.directory.iterdir():
+                shutil.rmtree(child, ignore_errors=True)
+        else:
+            shutil.rmtree(self.directory / db_key, ignore_errors=True)
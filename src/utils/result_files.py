@@ -0,0 +1,90 @@
+"""Final plan results on disk as CSV, Parquet or Arrow IPC files.
+
+CSV loses dtypes: reading it back re-infers them, so dates come back as
+strings and nullable integers as floats. ``write_result`` can store a frame
+as Parquet or uncompressed Arrow IPC instead, converting and writing it in
+slices of ``batch_rows`` rows so a large frame never has a full Arrow copy
+in memory. Frames without an Arrow form (mixed-type object columns) fall
+back to CSV. ``read_result`` memory-maps columnar files.
+"""
+
+import os
+from pathlib import Path
+from typing import Union
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.utils.instrumentation import say
+
+RESULT_FORMATS = {"csv": ".csv", "parquet": ".parquet", "arrow": ".arrow"}
+COLUMNAR_SUFFIXES = (".parquet", ".arrow")
+
+
+def write_result(
+    df: pd.DataFrame,
+    directory: Union[str, Path],
+    stem: str,
+    result_format: str = "csv",
+    batch_rows: int = 65536,
+) -> Path:
+    """Save ``df`` as ``<directory>/<stem>.<format>`` and return the written path.
+
+    Results of the same stem in the other formats are removed, so readers
+    never pick up a stale file.
+    """
+    if result_format not in RESULT_FORMATS:
+        raise ValueError(f"Unknown result format: {result_format}")
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    path = directory / f"{stem}{RESULT_FORMATS[result_format]}"
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        if result_format == "csv":
+            df.to_csv(tmp_path, index=False)
+        else:
+            try:
+                _write_columnar(df, tmp_path, result_format, batch_rows)
+            except (pa.ArrowException, ValueError, TypeError) as e:
+                say(f"⚠️ Result has no {result_format} form, saving it as CSV: {e}")
+                tmp_path.unlink(missing_ok=True)
+                return write_result(df, directory, stem, "csv")
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+    for suffix in RESULT_FORMATS.values():
+        if suffix != path.suffix:
+            (directory / f"{stem}{suffix}").unlink(missing_ok=True)
+    return path
+
+
+def read_result(path: Union[str, Path]) -> pd.DataFrame:
+    path = Path(path)
+    if path.suffix == ".parquet":
+        return pq.read_table(path, memory_map=True).to_pandas()
+    if path.suffix == ".arrow":
+        with pa.memory_map(str(path)) as source:
+            return pa.ipc.open_file(source).read_all().to_pandas()
+    return pd.read_csv(path)
+
+
+def _write_columnar(df: pd.DataFrame, path: Path, result_format: str, batch_rows: int) -> None:
+    # The schema comes from the whole frame, so a slice of nulls cannot narrow a column's type.
+    schema = pa.Schema.from_pandas(df, preserve_index=False)
+    slices = (
+        pa.Table.from_pandas(df.iloc[start:start + batch_rows], schema=schema, preserve_index=False)
+        for start in range(0, len(df), max(1, batch_rows))
+    )
+    if result_format == "parquet":
+        with pq.ParquetWriter(str(path), schema) as writer:
+            for table in slices:
+                writer.write_table(table)
+        return
+    with pa.OSFile(str(path), "wb") as sink:
+        with pa.ipc.new_file(sink, schema) as writer:
+            for table in slices:
+                writer.write_table(table)
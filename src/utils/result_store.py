@@ -0,0 +1,170 @@
+"""Step results of one plan, released after their last consumer and spilled past a budget.
+
+``ResultStore`` is the ``partial_results`` mapping of ``execute_plan``. Each
+step declares the steps it reads (``depends_on``, joins and ``$stepN``
+placeholders); once every reader has stored its own result, the step's
+frame is dropped. With ``spill_threshold_mb`` set, the largest in-memory
+frames are written to uncompressed Arrow IPC files whenever the held
+frames exceed the threshold, and are read back through a memory map.
+"""
+
+import shutil
+import tempfile
+import threading
+from collections.abc import MutableMapping
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional, Union
+
+import pandas as pd
+import pyarrow as pa
+
+from src.utils.instrumentation import say
+
+
+class ResultStore(MutableMapping):
+    def __init__(
+        self,
+        dependencies: Optional[Dict[int, Iterable[int]]] = None,
+        keep: Iterable[int] = (),
+        spill_threshold_mb: Optional[float] = None,
+        spill_dir: Optional[Union[str, Path]] = None,
+    ):
+        """``dependencies`` maps each step to the steps whose results it reads.
+
+        Results of steps in ``keep`` (the last step) are never released.
+        """
+        dependencies = dependencies or {}
+        self._dependencies = {step_id: set(deps) for step_id, deps in dependencies.items()}
+        self._readers: Dict[int, set[int]] = {}
+        for step_id, deps in self._dependencies.items():
+            for dep in deps:
+                self._readers.setdefault(dep, set()).add(step_id)
+        self._keep = set(keep)
+
+        self._threshold = (
+            int(spill_threshold_mb * 1024 * 1024) if spill_threshold_mb is not None else None
+        )
+        self._spill_root = spill_dir
+        self._spill_dir: Optional[Path] = None
+
+        self._frames: Dict[int, pd.DataFrame] = {}
+        self._sizes: Dict[int, int] = {}
+        self._spilled: Dict[int, tuple[Path, bool]] = {}
+        self._unspillable: set[int] = set()
+        self._lock = threading.RLock()
+        self.peak_bytes = 0
+
+    def __enter__(self) -> "ResultStore":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __getitem__(self, step_id: int) -> pd.DataFrame:
+        with self._lock:
+            if step_id in self._frames:
+                return self._frames[step_id]
+            spilled = self._spilled.get(step_id)
+        if spilled is None:
+            raise KeyError(step_id)
+        path, arrow_backed = spilled
+        with pa.memory_map(str(path)) as source:
+            table = pa.ipc.open_file(source).read_all()
+        return table.to_pandas(types_mapper=pd.ArrowDtype if arrow_backed else None)
+
+    def __setitem__(self, step_id: int, df: pd.DataFrame) -> None:
+        with self._lock:
+            self._discard(step_id)
+            self._frames[step_id] = df
+            if self._threshold is not None:
+                self._sizes[step_id] = int(df.memory_usage(index=True, deep=True).sum())
+
+            for dep in self._dependencies.get(step_id, ()):
+                readers = self._readers.get(dep)
+                if readers is None:
+                    continue
+                readers.discard(step_id)
+                if not readers and dep not in self._keep:
+                    self._discard(dep)
+            if not self._readers.get(step_id) and step_id not in self._keep:
+                # Nothing reads this step; its result is not needed past this point.
+                self._discard(step_id)
+
+            if self._threshold is not None:
+                self._spill_over_threshold()
+                self.peak_bytes = max(self.peak_bytes, self.memory_bytes)
+
+    def __delitem__(self, step_id: int) -> None:
+        with self._lock:
+            if step_id not in self:
+                raise KeyError(step_id)
+            self._discard(step_id)
+
+    def __contains__(self, step_id) -> bool:
+        with self._lock:
+            return step_id in self._frames or step_id in self._spilled
+
+    def __iter__(self) -> Iterator[int]:
+        with self._lock:
+            return iter([*self._frames, *self._spilled])
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._frames) + len(self._spilled)
+
+    @property
+    def memory_bytes(self) -> int:
+        """Bytes held by in-memory frames (tracked only when spilling is enabled)."""
+        return sum(self._sizes.get(step_id, 0) for step_id in self._frames)
+
+    def close(self) -> None:
+        with self._lock:
+            self._frames.clear()
+            self._sizes.clear()
+            self._spilled.clear()
+            self._unspillable.clear()
+            if self._spill_dir is not None:
+                shutil.rmtree(self._spill_dir, ignore_errors=True)
+                self._spill_dir = None
+
+    def _discard(self, step_id: int) -> None:
+        self._frames.pop(step_id, None)
+        self._sizes.pop(step_id, None)
+        self._unspillable.discard(step_id)
+        spilled = self._spilled.pop(step_id, None)
+        if spilled is not None:
+            spilled[0].unlink(missing_ok=True)
+
+    def _spill_over_threshold(self) -> None:
+        candidates = sorted(
+            (step_id for step_id in self._frames if step_id not in self._unspillable),
+            key=lambda step_id: -self._sizes.get(step_id, 0),
+        )
+        for step_id in candidates:
+            if self.memory_bytes <= self._threshold:
+                return
+            self._spill(step_id)
+
+    def _spill(self, step_id: int) -> None:
+        df = self._frames[step_id]
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+        except (pa.ArrowException, ValueError, TypeError) as e:
+            # Mixed-type object columns and duplicate names have no Arrow form.
+            say(f"⚠️ Could not spill step {step_id}, keeping it in memory: {e}")
+            self._unspillable.add(step_id)
+            return
+
+        if self._spill_dir is None:
+            self._spill_dir = Path(tempfile.mkdtemp(prefix="monk-spill-", dir=self._spill_root))
+        path = self._spill_dir / f"step_{step_id}.arrow"
+        with pa.OSFile(str(path), "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+
+        size = self._sizes.get(step_id, 0)
+        del self._frames[step_id]
+        self._sizes.pop(step_id, None)
+        arrow_backed = all(isinstance(dtype, pd.ArrowDtype) for dtype in df.dtypes)
+        self._spilled[step_id] = (path, arrow_backed)
+        say(f"ℹ️ Spilled step {step_id} result ({size / 1024 / 1024:.1f} MB) to {path}")
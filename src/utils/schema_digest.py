@@ -0,0 +1,217 @@
+"""Question-specific, token-bounded digests of the metadata catalog.
+
+Tables are ranked with BM25 over their table and column names, boosted by
+foreign-key neighbours of relevant tables, and emitted as one compact line
+per table until the token budget is spent. Credentials, defaults and comments
+never reach the prompt; databases are named by credential-free URLs that
+``restore_database_url`` maps back after translation.
+"""
+
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any
+
+from sqlalchemy.engine import URL, make_url
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_CAMEL_RE = re.compile(r"(?<=[a-z0-9])(?=[A-Z])")
+_COLLATE_RE = re.compile(r"\s+COLLATE\s+\S+", re.IGNORECASE)
+_STOPWORDS = frozenset(
+    "a an and are as at be by did do does each for from has have how in is it "
+    "its list many more most much of on or per show than that the their them "
+    "there these they this those to was were what when where which who whose "
+    "with all any both".split()
+)
+
+
+@dataclass
+class _Table:
+    database: int
+    name: str
+    columns: list[dict[str, Any]]
+    terms: list[str] = field(default_factory=list)
+    score: float = 0.0
+
+
+@dataclass(frozen=True)
+class SchemaDigest:
+    text: str
+    tokens: int
+    tables: tuple[str, ...]
+    omitted_tables: int
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) that needs no tokenizer."""
+    return math.ceil(len(text) / 4)
+
+
+def build_schema_digest(
+    metadata: list[dict[str, Any]],
+    question: str,
+    token_budget: int = 2000,
+    neighbor_weight: float = 0.5,
+) -> SchemaDigest:
+    tables = [
+        _Table(database=i, name=name, columns=columns)
+        for i, db in enumerate(metadata)
+        for name, columns in db.get("tables", {}).items()
+    ]
+    for table in tables:
+        table.terms = _terms(table.name) * 2 + [
+            term for column in table.columns for term in _terms(column["name"])
+        ]
+
+    query_terms = [t for t in _terms(question) if t not in _STOPWORDS]
+    lexical = _bm25([t.terms for t in tables], query_terms)
+    lexical_by_key = {(t.database, t.name.lower()): score for t, score in zip(tables, lexical)}
+    for table, score in zip(tables, lexical):
+        # FK adjacency is symmetric: a table inherits relevance from the tables it
+        # references and from the tables that reference it.
+        neighbors = {(table.database, ref.lower()) for ref in _references(table)}
+        neighbors |= {
+            (other.database, other.name.lower())
+            for other in tables
+            if other.database == table.database and table.name.lower() in _references(other)
+        }
+        boost = max((lexical_by_key.get(key, 0.0) for key in neighbors), default=0.0)
+        table.score = score + neighbor_weight * boost
+
+    # Stable sort: unranked tables keep catalog order, so the digest is deterministic.
+    ranked = sorted(tables, key=lambda t: -t.score)
+    query_set = set(query_terms)
+
+    selected: list[tuple[_Table, str]] = []
+    used = sum(estimate_tokens(_database_line(db)) for db in metadata)
+    for table in ranked:
+        line = _table_line(table, query_set)
+        cost = estimate_tokens(line)
+        if used + cost > token_budget:
+            # Fall back to keys and matching columns only before giving up on the table.
+            line = _table_line(table, query_set, keys_only=True)
+            cost = estimate_tokens(line)
+            if used + cost > token_budget:
+                continue
+        selected.append((table, line))
+        used += cost
+
+    lines = []
+    for i, db in enumerate(metadata):
+        table_lines = [line for table, line in selected if table.database == i]
+        if table_lines:
+            lines.append(_database_line(db))
+            lines.extend(table_lines)
+
+    text = "\n".join(lines)
+    return SchemaDigest(
+        text=text,
+        tokens=estimate_tokens(text),
+        tables=tuple(table.name for table, _ in selected),
+        omitted_tables=len(tables) - len(selected),
+    )
+
+
+def database_url(db: dict[str, Any], with_credentials: bool = False) -> str:
+    url = URL.create(
+        drivername=_drivername(db),
+        username=db.get("username") if with_credentials else None,
+        password=db.get("password") if with_credentials else None,
+        host=db.get("host"),
+        port=db.get("port"),
+        database=db.get("database"),
+    )
+    return url.render_as_string(hide_password=False)
+
+
+def restore_database_url(url: str, metadata: list[dict[str, Any]]) -> str:
+    """Map a (possibly credential-free) URL back to the catalog's full URL."""
+    try:
+        parsed = make_url(url)
+    except Exception:
+        return url
+
+    for db in metadata:
+        same_backend = parsed.get_backend_name() == db.get("dialect")
+        if same_backend and (parsed.host, parsed.port, parsed.database) == (
+            db.get("host"),
+            db.get("port"),
+            db.get("database"),
+        ):
+            return database_url(db, with_credentials=True)
+    return url
+
+
+def _drivername(db: dict[str, Any]) -> str:
+    dialect, driver = db.get("dialect"), db.get("drivername")
+    return dialect if not driver or driver == dialect else f"{dialect}+{driver}"
+
+
+def _database_line(db: dict[str, Any]) -> str:
+    return f"database {database_url(db)} ({db.get('dialect')}):"
+
+
+def _table_line(table: _Table, query_terms: set[str], keys_only: bool = False) -> str:
+    parts = []
+    for column in table.columns:
+        is_key = column.get("is_primary_key") or column.get("is_foreign_key")
+        if keys_only and not is_key and not query_terms.intersection(_terms(column["name"])):
+            continue
+
+        column_type = _COLLATE_RE.sub("", column.get("type") or "")
+        part = f"{column['name']} {column_type}".rstrip()
+        if column.get("is_primary_key"):
+            part += " PK"
+        for ref in column.get("foreign_key_references") or []:
+            part += f" FK->{ref.get('table')}.{ref.get('column')}"
+        parts.append(part)
+
+    suffix = ", ..." if keys_only and len(parts) < len(table.columns) else ""
+    return f"  {table.name}({', '.join(parts)}{suffix})"
+
+
+def _references(table: _Table) -> set[str]:
+    return {
+        ref["table"].lower()
+        for column in table.columns
+        for ref in column.get("foreign_key_references") or []
+        if ref.get("table")
+    }
+
+
+def _terms(text: str) -> list[str]:
+    words = _WORD_RE.findall(_CAMEL_RE.sub(" ", text).lower())
+    return [_stem(word) for word in words]
+
+
+def _stem(word: str) -> str:
+    # Enough to match "orders" with "order" and "categories" with "category".
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def _bm25(documents: list[list[str]], query: list[str], k1: float = 1.2, b: float = 0.75) -> list[float]:
+    if not documents or not query:
+        return [0.0] * len(documents)
+
+    n = len(documents)
+    avg_len = sum(len(d) for d in documents) / n or 1.0
+    doc_freq = Counter(term for d in documents for term in set(d))
+    counts = [Counter(d) for d in documents]
+
+    scores = []
+    for document, tf in zip(documents, counts):
+        score = 0.0
+        for term in set(query):
+            if term not in tf:
+                continue
+            idf = math.log(1 + (n - doc_freq[term] + 0.5) / (doc_freq[term] + 0.5))
+            freq = tf[term]
+            score += idf * freq * (k1 + 1) / (freq + k1 * (1 - b + b * len(document) / avg_len))
+        scores.append(score)
+    return scores
+
@@ -0,0 +1,118 @@
+"""Compact summaries of join keys, pushed into dependent steps as prefilters.
+
+A summary only ever describes a superset of the dependency's keys, so the
+exact join is still done by the executor; the prefilter just keeps rows that
+cannot match from leaving the remote database.
+"""
+
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+import numpy as np
+import pandas as pd
+
+
+@dataclass
+class KeySummary:
+    ranges: list[tuple[str, str]] = field(default_factory=list)
+    modulus: Optional[int] = None
+    residues: list[int] = field(default_factory=list)
+    has_nulls: bool = False
+    empty: bool = False
+
+    def describe(self) -> str:
+        if self.empty:
+            return "no keys"
+        parts = [f"{len(self.ranges)} range(s)"]
+        if self.modulus:
+            parts.append(f"{len(self.residues)}/{self.modulus} hash buckets")
+        return ", ".join(parts)
+
+    def predicate(self, column: str) -> str:
+        if self.empty:
+            condition = "1 = 0"
+        else:
+            condition = " OR ".join(f"{column} BETWEEN {lo} AND {hi}" for lo, hi in self.ranges)
+            if len(self.ranges) > 1:
+                condition = f"({condition})"
+            if self.modulus:
+                residues = ", ".join(str(r) for r in self.residues)
+                condition = f"{condition} AND ({column} % {self.modulus}) IN ({residues})"
+
+        if self.has_nulls:
+            # pandas joins NaN keys with each other, so NULL rows must survive.
+            condition = f"({condition}) OR {column} IS NULL"
+        return condition
+
+
+def summarize_keys(
+    series: pd.Series,
+    max_ranges: int = 8,
+    modulus: int = 64,
+    max_bucket_fill: float = 0.5,
+) -> Optional[KeySummary]:
+    """Summarize numeric or datetime keys; ``None`` when no portable summary exists."""
+    dtype = series.dtype
+    is_number = pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype)
+    is_datetime = pd.api.types.is_datetime64_any_dtype(dtype)
+    if not (is_number or is_datetime):
+        return None
+
+    has_nulls = bool(series.isna().any())
+    values = series.dropna().unique()
+    if len(values) == 0:
+        return KeySummary(has_nulls=has_nulls, empty=True)
+
+    if is_datetime:
+        values = pd.Series(values).sort_values()
+        return KeySummary(
+            ranges=[(_datetime_literal(values.iloc[0]), _datetime_literal(values.iloc[-1]))],
+            has_nulls=has_nulls,
+        )
+
+    values = np.sort(values.astype("float64" if pd.api.types.is_float_dtype(dtype) else "int64"))
+    if not np.isfinite(values).all():
+        return None
+
+    is_integer = pd.api.types.is_integer_dtype(dtype)
+    to_literal: Callable = (lambda v: str(int(v))) if is_integer else (lambda v: repr(float(v)))
+    summary = KeySummary(
+        ranges=[(to_literal(lo), to_literal(hi)) for lo, hi in _key_runs(values, max_ranges, is_integer)],
+        has_nulls=has_nulls,
+    )
+
+    if is_integer:
+        # SQL '%' truncates towards zero like np.fmod, unlike Python's '%'.
+        residues = np.unique(np.fmod(values, modulus))
+        if len(residues) <= modulus * max_bucket_fill:
+            summary.modulus = modulus
+            summary.residues = [int(r) for r in residues]
+
+    return summary
+
+
+def _key_runs(values: np.ndarray, max_ranges: int, is_integer: bool) -> list[tuple]:
+    """Split sorted keys into at most ``max_ranges`` runs at the widest gaps."""
+    if len(values) == 1 or max_ranges <= 1:
+        return [(values[0], values[-1])]
+
+    gaps = np.diff(values)
+    min_gap = 1 if is_integer else 0
+    candidates = np.flatnonzero(gaps > min_gap)
+    if len(candidates) == 0:
+        return [(values[0], values[-1])]
+
+    widest = candidates[np.argsort(gaps[candidates])[::-1][: max_ranges - 1]]
+    cuts = np.sort(widest)
+
+    runs = []
+    start = 0
+    for cut in cuts:
+        runs.append((values[start], values[cut]))
+        start = cut + 1
+    runs.append((values[start], values[-1]))
+    return runs
+
+
+def _datetime_literal(value) -> str:
+    return "'" + pd.Timestamp(value).isoformat(sep=" ") + "'"
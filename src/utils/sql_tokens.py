@@ -0,0 +1,132 @@
+"""SQL split into tokens with the quoting and comment rules of each dialect.
+
+``tokenize`` is a lexer, not a parser: it tells words from quoted
+identifiers, strings, numbers, bind parameters and ``$stepN.column``
+placeholders, drops comments and keeps each token's offsets in the source,
+so callers can reason about a statement's structure and still cut the
+original text. The plan validator and the batch executor both read SQL
+through it.
+"""
+
+import re
+from dataclasses import dataclass
+
+_PLACEHOLDER_RE = re.compile(r"\$step(\d+)\.(\w+)")
+_NUMBER_RE = re.compile(r"(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?")
+_WORD_RE = re.compile(r"[^\W\d]\w*")
+_PARAM_RE = re.compile(r"\?|%\(\w+\)s|%s|:(?!:)\w+|\$\w+")
+_OPS = ("::", "<=", ">=", "<>", "!=", "||", "->>", "->", "<<", ">>")
+
+_IDENTIFIER_QUOTES = {
+    "mysql": {"`": "`"},
+    "mariadb": {"`": "`"},
+    "sqlite": {'"': '"', "`": "`", "[": "]"},
+    "mssql": {'"': '"', "[": "]"},
+}
+_STRING_QUOTES = {"mysql": ("'", '"'), "mariadb": ("'", '"')}
+
+# Reserved and common non-reserved words across the supported dialects;
+# a word token outside this set is taken for an identifier.
+KEYWORDS = frozenset(
+    """
+    all and any array as asc at between binary both by case cast collate cross cube current
+    current_date current_time current_timestamp current_user date day days decimal default
+    desc distinct distinctrow div double else end escape except exists extract false fetch
+    filter first following for from full last group grouping having hour hours ilike in inner
+    int integer intersect interval into is join lateral leading left like limit local
+    localtime localtimestamp materialized minus minute minutes mod month months natural next
+    not null nulls numeric of offset on only or order outer over partition percent position
+    preceding precision quarter range real recursive regexp right rlike rollup row rows
+    second seconds select separator session_user sets signed similar some straight_join
+    substring sysdate then ties time timestamp to top trailing trim true unbounded union
+    unknown unsigned user using values varchar when where window with within week year
+    year_month day_hour day_minute day_second hour_minute hour_second minute_second
+    microsecond millisecond dow doy epoch isodow isoyear zone char character text bigint
+    smallint tinyint float boolean bool datetime varying epoch sql_calc_found_rows
+    high_priority sql_no_cache sql_cache char_length
+    """.split()
+)
+
+
+@dataclass(frozen=True)
+class Token:
+    """One token of a statement; ``start`` and ``end`` are its offsets in the source."""
+
+    kind: str  # word, quoted, string, number, placeholder, param or op
+    text: str
+    start: int
+    end: int
+
+    def is_word(self, *words: str) -> bool:
+        return self.kind == "word" and self.text.lower() in words
+
+    @property
+    def is_name(self) -> bool:
+        """An identifier rather than a keyword."""
+        return self.kind == "quoted" or (self.kind == "word" and self.text.lower() not in KEYWORDS)
+
+
+def tokenize(sql: str, dialect: str) -> list[Token]:
+    """Tokens of ``sql`` under ``dialect``'s quoting rules; raises ``ValueError`` on unterminated quotes."""
+    identifier_quotes = _IDENTIFIER_QUOTES.get(dialect, {'"': '"'})
+    string_quotes = _STRING_QUOTES.get(dialect, ("'",))
+    tokens: list[Token] = []
+    i, n = 0, len(sql)
+    while i < n:
+        ch = sql[i]
+        if ch.isspace():
+            i += 1
+        elif sql.startswith("--", i) or (ch == "#" and dialect in ("mysql", "mariadb")):
+            end = sql.find("\n", i)
+            i = n if end == -1 else end + 1
+        elif sql.startswith("/*", i):
+            end = sql.find("*/", i + 2)
+            if end == -1:
+                raise ValueError("unterminated comment")
+            i = end + 2
+        elif ch in string_quotes or ch in identifier_quotes:
+            quoted = ch in identifier_quotes and ch not in string_quotes
+            close = identifier_quotes[ch] if quoted else ch
+            end, text = _scan_quoted(sql, i, close, backslash=not quoted and dialect in ("mysql", "mariadb"))
+            # E'..', N'..', B'..' and X'..' prefixes belong to the string.
+            if not quoted and tokens and tokens[-1].end == i and tokens[-1].text.upper() in ("E", "N", "B", "X"):
+                tokens.pop()
+            tokens.append(Token("quoted" if quoted else "string", text, i, end))
+            i = end
+        elif m := _PLACEHOLDER_RE.match(sql, i):
+            tokens.append(Token("placeholder", m.group(0), i, m.end()))
+            i = m.end()
+        elif m := _NUMBER_RE.match(sql, i):
+            tokens.append(Token("number", m.group(0), i, m.end()))
+            i = m.end()
+        elif m := _WORD_RE.match(sql, i):
+            tokens.append(Token("word", m.group(0), i, m.end()))
+            i = m.end()
+        elif m := _PARAM_RE.match(sql, i):
+            tokens.append(Token("param", m.group(0), i, m.end()))
+            i = m.end()
+        else:
+            op = next((op for op in _OPS if sql.startswith(op, i)), ch)
+            tokens.append(Token("op", op, i, i + len(op)))
+            i += len(op)
+    return tokens
+
+
+def _scan_quoted(sql: str, start: int, close: str, backslash: bool) -> tuple[int, str]:
+    """End of the quoted token at ``start`` and its unquoted text."""
+    i, parts = start + 1, []
+    while i < len(sql):
+        ch = sql[i]
+        if backslash and ch == "\\" and i + 1 < len(sql):
+            parts.append(sql[i + 1])
+            i += 2
+        elif ch == close:
+            if sql.startswith(close * 2, i):
+                parts.append(close)
+                i += 2
+            else:
+                return i + 1, "".join(parts)
+        else:
+            parts.append(ch)
+            i += 1
+    raise ValueError("unterminated quoted string or identifier")
@@ -0,0 +1,177 @@
+"""Local SQLite copies of the test databases, scaled up with synthetic rows.
+
+Suites that ship a ``test/schemas/<suite>/sqlite`` database hold every table
+of their source databases in that one file, so a plan runs locally once
+each step's ``database`` points at it. ``build_standin`` copies the file,
+renames columns to their spelling in the metadata catalog (PostgreSQL folds
+unquoted names to lower case, so plans ask for ``id`` where SQLite has
+``Id``) and, for a scale factor ``n``, appends ``n - 1`` copies of every
+table's rows. In each copy, primary and foreign key values are shifted by the same
+amount (integers by a power of ten above every key, text by a suffix), so
+joins keep their fan-out and results grow linearly with the scale factor.
+"""
+
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+from contextlib import closing
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+from src.query_translation import TranslationReturn
+
+SCHEMAS_DIR = Path("test/schemas")
+_SQLITE_SUFFIXES = (".sqlite", ".db", ".sqlite3")
+
+
+def find_standins(schemas_dir: Union[str, Path] = SCHEMAS_DIR) -> Dict[str, Path]:
+    """SQLite database of every suite that ships one, by suite name."""
+    standins = {}
+    for suite_dir in sorted(Path(schemas_dir).iterdir()):
+        files = sorted(
+            p for p in (suite_dir / "sqlite").glob("*") if p.suffix in _SQLITE_SUFFIXES
+        )
+        if files:
+            standins[suite_dir.name] = files[0]
+    return standins
+
+
+def build_standin(
+    source: Union[str, Path],
+    scale: int,
+    work_dir: Union[str, Path],
+    metadata_path: Optional[Union[str, Path]] = None,
+) -> Path:
+    """Copy of ``source`` with every table holding ``scale`` times its rows.
+
+    Column names follow ``metadata_path`` when given. The copy is reused
+    while it is newer than its inputs.
+    """
+    if scale < 1:
+        raise ValueError("scale must be at least 1")
+    source = Path(source)
+    work_dir = Path(work_dir)
+    target = work_dir / f"{source.stem}_x{scale}{source.suffix}"
+    inputs = [source] + ([Path(metadata_path)] if metadata_path else [])
+    if target.exists() and all(target.stat().st_mtime >= p.stat().st_mtime for p in inputs):
+        return target
+
+    work_dir.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(prefix=f".{target.name}.", dir=work_dir)
+    os.close(fd)
+    try:
+        shutil.copyfile(source, tmp_name)
+        with closing(sqlite3.connect(tmp_name)) as conn, conn:
+            if metadata_path:
+                _respell_columns(conn, _catalog_spellings(metadata_path))
+            if scale > 1:
+                _scale_tables(conn, scale)
+                conn.execute("ANALYZE")
+        os.replace(tmp_name, target)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+    return target
+
+
+def localize_plan(plan: TranslationReturn, database: Union[str, Path]) -> TranslationReturn:
+    """Copy of ``plan`` with every step reading the SQLite file ``database``."""
+    url = f"sqlite:///{Path(database).resolve()}"
+    local = plan.model_copy(deep=True)
+    for step in local.execution_plan:
+        step.database = url
+    return local
+
+
+def _catalog_spellings(metadata_path: Union[str, Path]) -> Dict[str, Dict[str, str]]:
+    """Column spelling of every table in a metadata file, keyed by lower-cased names."""
+    spellings: Dict[str, Dict[str, str]] = {}
+    for db in json.loads(Path(metadata_path).read_text(encoding="utf-8")):
+        for table, columns in db.get("tables", {}).items():
+            names = spellings.setdefault(table.lower(), {})
+            for col in columns:
+                names.setdefault(col["name"].lower(), col["name"])
+    return spellings
+
+
+def _respell_columns(conn: sqlite3.Connection, spellings: Dict[str, Dict[str, str]]) -> None:
+    tables = [
+        name
+        for (name,) in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+        )
+    ]
+    for table in tables:
+        names = spellings.get(table.lower(), {})
+        for row in conn.execute(f"PRAGMA table_info({_quote(table)})").fetchall():
+            spelled = names.get(row[1].lower())
+            if spelled and spelled != row[1]:
+                conn.execute(
+                    f"ALTER TABLE {_quote(table)} RENAME COLUMN {_quote(row[1])} TO {_quote(spelled)}"
+                )
+
+
+def _scale_tables(conn: sqlite3.Connection, scale: int) -> None:
+    tables = [
+        name
+        for (name,) in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+        )
+    ]
+    key_columns = {table: _key_columns(conn, table, tables) for table in tables}
+    stride = _stride(conn, key_columns)
+
+    for table in tables:
+        columns = [row[1] for row in conn.execute(f"PRAGMA table_info({_quote(table)})")]
+        conn.execute(f"CREATE TEMP TABLE monk_original AS SELECT * FROM {_quote(table)}")
+        column_list = ", ".join(_quote(col) for col in columns)
+        for copy in range(1, scale):
+            values = ", ".join(
+                _shifted(col, copy * stride, copy) if col.lower() in key_columns[table] else _quote(col)
+                for col in columns
+            )
+            conn.execute(
+                f"INSERT INTO {_quote(table)} ({column_list}) SELECT {values} FROM monk_original"
+            )
+        conn.execute("DROP TABLE monk_original")
+
+
+def _key_columns(conn: sqlite3.Connection, table: str, tables: list[str]) -> set[str]:
+    """Lower-cased primary key, foreign key and referenced columns of ``table``."""
+    keys = {row[1].lower() for row in conn.execute(f"PRAGMA table_info({_quote(table)})") if row[5]}
+    keys |= {row[3].lower() for row in conn.execute(f"PRAGMA foreign_key_list({_quote(table)})")}
+    for other in tables:
+        for row in conn.execute(f"PRAGMA foreign_key_list({_quote(other)})"):
+            if row[2].lower() == table.lower() and row[4]:
+                keys.add(row[4].lower())
+    return keys
+
+
+def _stride(conn: sqlite3.Connection, key_columns: Dict[str, set[str]]) -> int:
+    """Power of ten above every integer key, so shifted copies never collide."""
+    largest = 0
+    for table, keys in key_columns.items():
+        for col in keys:
+            (value,) = conn.execute(
+                f"SELECT MAX(ABS({_quote(col)})) FROM {_quote(table)} "
+                f"WHERE typeof({_quote(col)}) = 'integer'"
+            ).fetchone()
+            largest = max(largest, value or 0)
+    stride = 10
+    while stride <= largest:
+        stride *= 10
+    return stride
+
+
+def _shifted(col: str, offset: int, copy: int) -> str:
+    quoted = _quote(col)
+    return (
+        f"CASE typeof({quoted}) WHEN 'integer' THEN {quoted} + {offset} "
+        f"WHEN 'text' THEN {quoted} || '#{copy}' ELSE {quoted} END"
+    )
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
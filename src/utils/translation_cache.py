@@ -0,0 +1,61 @@
+"""Content-addressed on-disk cache of LLM translations."""
+
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Optional, Union
+
+
+def translation_key(
+    question: str,
+    metadata: str,
+    prompt_version: str,
+    prompt_text: str,
+    model: str,
+    candidate: int = 0,
+) -> str:
+    """Hash of everything that can change the model's answer.
+
+    ``candidate`` numbers repeated translations of the same prompt; the
+    first one keeps the key it had before candidates existed.
+    """
+    payload = {
+        "question": question,
+        "metadata_sha256": hashlib.sha256(metadata.encode("utf-8")).hexdigest(),
+        "prompt_version": prompt_version,
+        "prompt_sha256": hashlib.sha256(prompt_text.encode("utf-8")).hexdigest(),
+        "model": model,
+    }
+    if candidate:
+        payload["candidate"] = candidate
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class TranslationCache:
+    """Entries live at ``<directory>/<key[:2]>/<key>.json`` and are written atomically."""
+
+    def __init__(self, directory: Union[str, Path]):
+        self.directory = Path(directory)
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[dict[str, Any]]:
+        path = self._path(key)
+        try:
+            entry = json.loads(path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        return entry.get("plan")
+
+    def put(self, key: str, plan: dict[str, Any], **info: Any) -> None:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp_path.write_text(
+            json.dumps({**info, "plan": plan}, indent=2, ensure_ascii=False), encoding="utf-8"
+        )
+        os.replace(tmp_path, path)
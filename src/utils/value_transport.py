@@ -0,0 +1,325 @@
+"""Strategies for shipping upstream ``$stepN.column`` values into a step query.
+
+Only slots that are the sole operand of an ``IN (...)`` list can be moved out
+of the SQL text; every other occurrence is always inlined as a literal list,
+exactly like the original executor did.
+"""
+
+import datetime
+import decimal
+import re
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from functools import cached_property
+from typing import Dict, Iterator, Type, Union
+
+import pandas as pd
+from sqlalchemy import Column, MetaData, Table, bindparam, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.sql.elements import TextClause
+from sqlalchemy.types import BigInteger, Boolean, Date, DateTime, Float, Numeric, String, Text
+
+from src.utils.instrumentation import say
+from src.utils.query_template import QueryTemplate, Slot
+
+_NON_BATCHABLE_RE = re.compile(
+    r"\b(GROUP\s+BY|DISTINCT|LIMIT|OFFSET|FETCH|ORDER\s+BY|UNION|INTERSECT|EXCEPT|"
+    r"COUNT|SUM|AVG|MIN|MAX)\b",
+    re.IGNORECASE,
+)
+
+# Conservative per-statement bind parameter limits; dialects missing here
+# fall back to the default.
+_MAX_BIND_PARAMS = {"mssql": 2000, "sqlite": 30000}
+_DEFAULT_MAX_BIND_PARAMS = 30000
+
+
+@dataclass
+class SlotValues:
+    """Distinct non-null values of one ``$stepN.column`` reference."""
+
+    values: list
+    quoted: bool
+
+    @classmethod
+    def from_series(cls, series: pd.Series) -> "SlotValues":
+        dtype = series.dtype
+        if isinstance(dtype, pd.CategoricalDtype):
+            dtype = dtype.categories.dtype
+        quoted = pd.api.types.is_string_dtype(dtype) or pd.api.types.is_datetime64_any_dtype(dtype)
+        return cls(values=pd.Series(series.dropna().unique()).tolist(), quoted=quoted)
+
+    @cached_property
+    def literal(self) -> str:
+        return format_literal_values(self.values, self.quoted)
+
+
+def format_literal_values(values: list, quoted: bool) -> str:
+    if len(values) == 0:
+        return "NULL"
+
+    if quoted:
+        return ", ".join("'" + str(v).replace("'", "''") + "'" for v in values)
+    return ", ".join(str(v) for v in values)
+
+
+def render_literal(template: QueryTemplate, slots: Dict[str, SlotValues]) -> str:
+    return template.render(lambda slot: _literal_fragment(slot, slots))
+
+
+def _literal_fragment(slot: Slot, slots: Dict[str, SlotValues]) -> str:
+    return slot.prefix + slots[slot.token].literal + slot.suffix
+
+
+def in_list_tokens(template: QueryTemplate) -> Dict[str, bool]:
+    """Placeholders used as a sole ``IN`` operand, mapped to whether any use is ``NOT IN``."""
+    tokens: Dict[str, bool] = {}
+    for slot in template.slots:
+        if slot.in_list:
+            tokens[slot.token] = tokens.get(slot.token, False) or slot.negated
+    return tokens
+
+
+def _param_name(token: str) -> str:
+    return "p_" + token.lstrip("$").replace(".", "_")
+
+
+class ValueTransport(ABC):
+    """Base class: yields the statement(s) whose results together answer a query."""
+
+    name = ""
+
+    def supports(
+        self, dialect: str, template: QueryTemplate, slots: Dict[str, SlotValues]
+    ) -> bool:
+        return True
+
+    @abstractmethod
+    def statements(
+        self, conn: Connection, template: QueryTemplate, slots: Dict[str, SlotValues]
+    ) -> Iterator[tuple[TextClause, dict]]:
+        """Statements and their parameters, run in order on ``conn``."""
+
+    def _render(
+        self,
+        template: QueryTemplate,
+        slots: Dict[str, SlotValues],
+        render_in_list,
+    ) -> tuple[str, dict, list]:
+        """Rewrite transportable ``IN`` lists with ``render_in_list`` and inline the rest."""
+        params: dict = {}
+        binds: dict = {}
+
+        def fragment(slot: Slot) -> str:
+            values = slots[slot.token]
+            if not (slot.in_list and values.values):
+                return _literal_fragment(slot, slots)
+            sql, slot_params, slot_binds = render_in_list(slot.token, values, slot.negated)
+            params.update(slot_params)
+            binds.update((b.key, b) for b in slot_binds)
+            return sql
+
+        return template.render(fragment), params, list(binds.values())
+
+
+class LiteralTransport(ValueTransport):
+    name = "literal"
+
+    def statements(self, conn, template, slots):
+        yield text(render_literal(template, slots)), {}
+
+
+class ExpandingTransport(ValueTransport):
+    """``IN :p`` with an expanding bind parameter per placeholder."""
+
+    name = "expanding"
+
+    def statements(self, conn, template, slots):
+        sql, params, binds = self._render(template, slots, self._render_in_list)
+        yield text(sql).bindparams(*binds), params
+
+    @staticmethod
+    def _render_in_list(token, slot, negated):
+        name = _param_name(token)
+        keyword = "NOT IN" if negated else "IN"
+        return f"{keyword} :{name}", {name: slot.values}, [bindparam(name, expanding=True)]
+
+
+class AnyArrayTransport(ValueTransport):
+    """PostgreSQL ``= ANY(:p)`` with the whole value set bound as one array."""
+
+    name = "any_array"
+
+    def supports(self, dialect, template, slots):
+        return dialect == "postgresql"
+
+    def statements(self, conn, template, slots):
+        sql, params, _ = self._render(template, slots, self._render_in_list)
+        yield text(sql), params
+
+    @staticmethod
+    def _render_in_list(token, slot, negated):
+        name = _param_name(token)
+        fragment = f"<> ALL(:{name})" if negated else f"= ANY(:{name})"
+        return fragment, {name: slot.values}, []
+
+
+class BatchedInListTransport(ValueTransport):
+    """Run the query once per batch of the largest value set and concatenate.
+
+    Only row-wise queries qualify: anything that aggregates, deduplicates,
+    orders or limits across rows would give a different answer per batch.
+    """
+
+    name = "batched"
+
+    def __init__(self, batch_size: int = 1000):
+        self.batch_size = batch_size
+
+    def supports(self, dialect, template, slots):
+        tokens = in_list_tokens(template)
+        if not tokens or any(tokens.values()) or _NON_BATCHABLE_RE.search(template.static_sql):
+            return False
+        token = self._largest_token(template, slots)
+        return sum(1 for slot in template.slots if slot.token == token) == 1
+
+    def statements(self, conn, template, slots):
+        token = self._largest_token(template, slots)
+        values = slots[token].values
+        for start in range(0, max(len(values), 1), self.batch_size):
+            batch = dict(slots)
+            batch[token] = SlotValues(values[start : start + self.batch_size], slots[token].quoted)
+            sql, params, binds = self._render(template, batch, ExpandingTransport._render_in_list)
+            yield text(sql).bindparams(*binds), params
+
+    @staticmethod
+    def _largest_token(template, slots):
+        return max(in_list_tokens(template), key=lambda token: len(slots[token].values))
+
+
+class TempTableTransport(ValueTransport):
+    """Bulk-load each value set into a session temp table and join server-side."""
+
+    name = "temp_table"
+
+    def statements(self, conn, template, slots):
+        metadata = MetaData()
+        tables: Dict[str, Table] = {}
+        try:
+            for token in in_list_tokens(template):
+                if not slots[token].values:
+                    continue
+                table = Table(
+                    f"monk_tmp_{uuid.uuid4().hex[:12]}",
+                    metadata,
+                    Column("value", _column_type(slots[token].values)),
+                    prefixes=["TEMPORARY"],
+                )
+                table.create(conn)
+                conn.execute(table.insert(), [{"value": v} for v in slots[token].values])
+                tables[token] = table
+
+            def render_in_list(token, slot, negated):
+                keyword = "NOT IN" if negated else "IN"
+                return f"{keyword} (SELECT value FROM {tables[token].name})", {}, []
+
+            sql, params, _ = self._render(template, slots, render_in_list)
+            yield text(sql), params
+        finally:
+            # After a failed query PostgreSQL rejects every statement until
+            # rollback, which discards the tables anyway; a failing drop must
+            # not replace the query's own error.
+            for table in tables.values():
+                try:
+                    table.drop(conn, checkfirst=True)
+                except Exception as e:
+                    say(f"⚠️ Could not drop temp table {table.name}: {e}")
+
+
+def _column_type(values: list):
+    sample = values[0]
+    if isinstance(sample, bool):
+        return Boolean()
+    if isinstance(sample, int):
+        return BigInteger()
+    if isinstance(sample, float):
+        return Float()
+    if isinstance(sample, decimal.Decimal):
+        return Numeric()
+    if isinstance(sample, datetime.datetime):
+        return DateTime()
+    if isinstance(sample, datetime.date):
+        return Date()
+
+    longest = max(len(str(v)) for v in values)
+    return String(255) if longest <= 255 else Text()
+
+
+TRANSPORTS: Dict[str, Type[ValueTransport]] = {
+    transport.name: transport
+    for transport in (
+        LiteralTransport,
+        ExpandingTransport,
+        AnyArrayTransport,
+        BatchedInListTransport,
+        TempTableTransport,
+    )
+}
+
+
+def register_transport(transport: Type[ValueTransport]) -> None:
+    TRANSPORTS[transport.name] = transport
+
+
+def choose_transport(
+    dialect: str,
+    template: QueryTemplate,
+    slots: Dict[str, SlotValues],
+    literal_max: int = 1000,
+    temp_table_min: int = 50000,
+) -> ValueTransport:
+    """Pick a transport from the value cardinality and the dialect."""
+    tokens = in_list_tokens(template)
+    largest = max((len(slots[token].values) for token in tokens), default=0)
+    total = sum(len(slots[token].values) for token in tokens)
+
+    if largest <= literal_max:
+        return LiteralTransport()
+    if AnyArrayTransport().supports(dialect, template, slots):
+        return AnyArrayTransport()
+    if largest >= temp_table_min:
+        return TempTableTransport()
+
+    if total > _MAX_BIND_PARAMS.get(dialect, _DEFAULT_MAX_BIND_PARAMS):
+        batched = BatchedInListTransport()
+        if batched.supports(dialect, template, slots):
+            return batched
+        return TempTableTransport()
+
+    return ExpandingTransport()
+
+
+def resolve_transport(
+    transport: Union[str, ValueTransport, None],
+    dialect: str,
+    template: QueryTemplate,
+    slots: Dict[str, SlotValues],
+) -> ValueTransport:
+    """Turn the ``value_transport`` option into a transport usable for ``template``."""
+    if not slots:
+        return LiteralTransport()
+
+    if transport is None or transport == "auto":
+        return choose_transport(dialect, template, slots)
+
+    if isinstance(transport, str):
+        if transport not in TRANSPORTS:
+            raise ValueError(
+                f"Unknown value transport '{transport}'. Available: {sorted(TRANSPORTS)}"
+            )
+        transport = TRANSPORTS[transport]()
+
+    if not transport.supports(dialect, template, slots):
+        return LiteralTransport()
+    return transport
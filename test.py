@@ -7,19 +7,46 @@ Supported commands:
 """
 from __future__ import annotations
 
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import contextlib
 from datetime import datetime, timezone
 import json
+import math
+import os
 from dataclasses import dataclass
 from pathlib import Path
 import re
+import threading
+import time
 import traceback
-from typing import Dict, Iterable, List
+from typing import Dict, Iterable, List, Optional
 
 import typer
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
 from src.plan_execution import execute_plan
-from src.query_translation import TranslationReturn, translate_query
-from src.utils.metadata_extraction import extract_db_info
+from src.plan_batch import share_steps
+from src.plan_cost import PlanCostEstimator, select_plan
+from src.plan_rewrite import execute_rewritten, rewrite_plan
+from src.plan_validation import PlanValidationError, PlanValidator
+from src.query_translation import (
+    DEFAULT_CACHE_DIR,
+    DEFAULT_MODEL,
+    PROMPTS,
+    TranslationReturn,
+    translate_candidates,
+    translate_queries,
+)
+from src.utils.column_types import DTYPE_BACKENDS, ColumnTypeCatalog
+from src.utils.engine_registry import configure_engine_registry, get_engine_registry
+from src.utils.instrumentation import CollectingHooks, quiet_output
+from src.utils.result_cache import DiskResultCache, MemoryResultCache, StepCache, StepResultCache
+from src.utils.result_files import RESULT_FORMATS, write_result
+from src.utils.metadata_extraction import refresh_metadata
 from src.utils.sort import sort_execution_plan
 
 
@@ -138,10 +165,24 @@ def _load_questions(suite_name: str) -> List[dict]:
 
 def _append_error_jsonl(path: Path, payload: dict) -> None:
     path.parent.mkdir(parents=True, exist_ok=True)
-    with path.open("a", encoding="utf-8") as f:
-        f.write(json.dumps(payload, ensure_ascii=False) + "\n")
+    line = (json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8")
+    # One O_APPEND write under an exclusive lock, so concurrent runs never
+    # interleave or tear lines.
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        os.write(fd, line)
+    finally:
+        os.close(fd)
         
 
+def _write_text_atomic(path: Path, text: str) -> None:
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_text(text, encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
 def _plan_number(path: Path) -> int:
     m = re.search(r"plan_(\d+)\.json$", path.name)
     if not m:
@@ -149,18 +190,47 @@ def _plan_number(path: Path) -> int:
     return int(m.group(1))
 
 
+def _build_step_cache(
+    enabled: bool, cache_dir: Optional[Path], ttl: Optional[float], max_mb: float
+) -> Optional[StepResultCache]:
+    max_bytes = int(max_mb * 1024 * 1024)
+    if cache_dir is not None:
+        return DiskResultCache(cache_dir, max_bytes=max_bytes, ttl_seconds=ttl)
+    if enabled:
+        return MemoryResultCache(max_bytes=max_bytes, ttl_seconds=ttl)
+    return None
+
+
+def _column_types(dtype_backend: str, metadata_path: Path) -> Optional[ColumnTypeCatalog]:
+    if dtype_backend not in DTYPE_BACKENDS:
+        raise typer.BadParameter(f"--dtype-backend must be one of: {', '.join(DTYPE_BACKENDS)}")
+    if dtype_backend != "schema":
+        return None
+    if not metadata_path.exists():
+        raise typer.BadParameter(f"Metadata file not found for --dtype-backend schema: {metadata_path}")
+    return ColumnTypeCatalog.from_file(metadata_path)
+
+
+def _plan_validator(validate: bool, metadata_path: Path) -> Optional[PlanValidator]:
+    if not validate:
+        return None
+    if not metadata_path.exists():
+        raise typer.BadParameter(f"Metadata file not found for --validate: {metadata_path}")
+    return PlanValidator.from_file(metadata_path)
+
+
 @app.command("extract_metadata")
 def extract_metadata(
     containers: List[str] = typer.Argument(..., help="Container names or database URLs"),
     output_path: Path = typer.Option(Path("./metadata.json"), help="Where to save the metadata JSON"),
+    incremental: bool = typer.Option(True, "--incremental/--full", help="Reuse tables whose DDL is unchanged since the last extraction"),
+    max_workers: int = typer.Option(8, help="Databases extracted concurrently"),
 ):
     """Extract database metadata using container names instead of full URLs."""
 
     urls = [_resolve_connection(name) for name in containers]
-    metadata = extract_db_info(urls)
+    refresh_metadata(urls, output_path, incremental=incremental, max_workers=max_workers)
 
-    output_path.parent.mkdir(parents=True, exist_ok=True)
-    output_path.write_text(json.dumps(metadata, indent=4, ensure_ascii=False), encoding="utf-8")
     typer.echo(f"Metadata saved to {output_path.resolve()}")
 
 
@@ -168,40 +238,157 @@ def extract_metadata(
 def translate(
     suite_name: str = typer.Argument(..., help="Name of the test suite (folder under test/schema)"),
     metadata_path: Path = typer.Option(Path("./metadata.json"), help="Path to the metadata JSON"),
+    prompt_version: str = typer.Option("prompt_2", help=f"Prompt template: {', '.join(PROMPTS)}"),
+    model: str = typer.Option(DEFAULT_MODEL, help="Model used for the translation"),
+    cache: bool = typer.Option(True, "--cache/--no-cache", help="Reuse cached translations"),
+    refresh_cache: bool = typer.Option(False, "--refresh-cache", help="Re-translate every question and overwrite (warm) the cache"),
+    cache_dir: Path = typer.Option(DEFAULT_CACHE_DIR, help="Directory of the translation cache"),
+    concurrency: int = typer.Option(4, help="Questions translated concurrently"),
+    requests_per_minute: Optional[float] = typer.Option(None, help="Cap on model requests per minute across all workers"),
+    max_retries: int = typer.Option(3, help="Retries per question on rate limits (429), server errors (5xx) and connection errors"),
+    schema_budget: Optional[int] = typer.Option(None, help="Send only the most relevant tables, within this many tokens, instead of the whole metadata"),
+    candidates: int = typer.Option(1, help="Translate each question this many times and keep the plan with the cheapest EXPLAIN estimate (saved as costs_<id>.json)"),
 ):
     """Translate all questions in a suite into SQL execution plans."""
 
     if not metadata_path.exists():
         raise typer.BadParameter(f"Metadata file not found: {metadata_path}")
+    if candidates < 1:
+        raise typer.BadParameter("--candidates must be at least 1")
 
     questions = _load_questions(suite_name)
     plans_dir = Path("plans") / suite_name
     plans_dir.mkdir(parents=True, exist_ok=True)
 
+    valid_items = []
     for item in questions:
-        question_id = item.get("id")
-        question_text = item.get("question")
-        if question_id is None or not question_text:
+        if item.get("id") is None or not item.get("question"):
             typer.echo(f"Skipping malformed item: {item}")
             continue
+        valid_items.append(item)
+
+    typer.echo(f"Translating {len(valid_items)} question(s) with concurrency {concurrency}...")
+    questions = [item["question"] for item in valid_items]
+    translate_options = dict(
+        concurrency=concurrency,
+        requests_per_minute=requests_per_minute,
+        prompt_version=prompt_version,
+        model=model,
+        cache_dir=cache_dir if cache else None,
+        refresh_cache=refresh_cache,
+        max_retries=max_retries,
+        schema_budget=schema_budget,
+    )
+    if candidates == 1:
+        results = translate_queries(str(metadata_path), questions, **translate_options)
+    else:
+        results = translate_candidates(str(metadata_path), questions, candidates, **translate_options)
+        estimator = PlanCostEstimator()
+        validator = PlanValidator.from_file(metadata_path)
+
+    failed = []
+    for index, result in results:
+        question_id = valid_items[index]["id"]
+        typer.echo(f"Translating question {question_id}: {valid_items[index]['question']}")
+        if candidates > 1:
+            result = _cheapest_candidate(
+                result, estimator, validator, plans_dir / f"costs_{question_id}.json"
+            )
+        if isinstance(result, Exception):
+            typer.echo(f"❌ Failed to translate question {question_id}: {result}")
+            failed.append(question_id)
+            continue
 
-        typer.echo(f"Translating question {question_id}: {question_text}")
-        translation = translate_query(str(metadata_path), question_text)
-        translation.execution_plan = sort_execution_plan(translation.execution_plan)
-
+        result.execution_plan = sort_execution_plan(result.execution_plan)
         output_path = plans_dir / f"plan_{question_id}.json"
-        output_path.write_text(
-            json.dumps(translation.model_dump(), indent=4, ensure_ascii=False), encoding="utf-8"
+        _write_text_atomic(
+            output_path, json.dumps(result.model_dump(), indent=4, ensure_ascii=False)
         )
         typer.echo(f"Saved plan to {output_path}")
 
+    if failed:
+        typer.echo(f"{len(failed)} question(s) failed: {', '.join(str(q) for q in failed)}")
+        raise typer.Exit(code=1)
+
+
+def _cheapest_candidate(
+    results: list,
+    estimator: PlanCostEstimator,
+    validator: PlanValidator,
+    costs_path: Path,
+):
+    """Candidate plan with the cheapest estimate; saves every candidate's estimate to ``costs_path``."""
+    plans = [result for result in results if not isinstance(result, Exception)]
+    if not plans:
+        return results[0]
+    for plan in plans:
+        plan.execution_plan = sort_execution_plan(plan.execution_plan)
+
+    chosen, costs = select_plan(plans, estimator, validator)
+    payload = {
+        "chosen": chosen,
+        "failed_translations": [str(result) for result in results if isinstance(result, Exception)],
+        "candidates": [
+            {**cost.as_dict(), "plan": plan.model_dump()} for plan, cost in zip(plans, costs)
+        ],
+    }
+    _write_text_atomic(costs_path, json.dumps(payload, indent=4, ensure_ascii=False))
+    return plans[chosen]
+
 
 @app.command("run_plans")
 def run_plans(
     suite_name: List[str] = typer.Argument(help="Name of the test suite (folder under test/schemas)", default=["bakery_1", "chat", "ecommerce", "sales", "store"] ),
+    parallel: bool = typer.Option(False, "--parallel", help="Run independent plan steps concurrently"),
+    max_concurrency_per_db: int = typer.Option(2, help="Maximum concurrent steps per database when --parallel is set"),
+    chunksize: Optional[int] = typer.Option(None, help="Stream step results in chunks of this many rows"),
+    memory_budget_mb: Optional[float] = typer.Option(None, help="Per-step memory budget (MB) when streaming"),
+    value_transport: str = typer.Option("auto", help="How $stepN values reach the database: auto, literal, expanding, any_array, batched, temp_table"),
+    semi_join_pushdown: bool = typer.Option(False, "--semi-join-pushdown", help="Prefilter join steps with a summary of the dependency's join keys"),
+    pushdown: bool = typer.Option(False, "--pushdown", help="Fold the final aggregation/projection into the SQL and prune unread step columns"),
+    pool_size: int = typer.Option(5, help="Connections kept open per database across plans"),
+    cache: bool = typer.Option(False, "--cache", help="Reuse results of identical steps (same database and SQL)"),
+    cache_dir: Optional[Path] = typer.Option(None, help="Persist the step cache as Parquet files in this directory (implies --cache)"),
+    cache_ttl: Optional[float] = typer.Option(None, help="Seconds before a cached step result expires"),
+    cache_max_mb: float = typer.Option(256, help="Size bound of the step cache in MB"),
+    dtype_backend: str = typer.Option("numpy", help="Dtypes of step results: numpy, pyarrow, or schema (types from metadata/<suite>.json)"),
+    spill_threshold_mb: Optional[float] = typer.Option(None, help="Spill step results to Arrow files once they hold more than this many MB"),
+    spill_dir: Optional[Path] = typer.Option(None, help="Directory for spilled step results (default: system temp dir)"),
+    workers: int = typer.Option(1, help="Run plans in this many worker processes, each with its own engines and step cache"),
+    plan_timeout: Optional[float] = typer.Option(None, help="Fail a plan that runs longer than this many seconds; the databases also cancel any statement running that long, and a timed-out plan's databases get fresh connection pools (its thread may keep running until its current statement ends)"),
+    metrics: bool = typer.Option(False, "--metrics", help="Save per-step timings, rows and bytes of each plan as metrics_<n>.json next to its result"),
+    quiet: bool = typer.Option(False, "--quiet", help="Hide per-step progress output"),
+    result_format: str = typer.Option("csv", help="File format of saved results: csv, parquet or arrow (columnar formats keep dtypes)"),
+    validate: bool = typer.Option(False, "--validate", help="Check each plan against metadata/<suite>.json and fail it before running when it cannot work"),
+    share: bool = typer.Option(False, "--share-steps", help="Read steps that several plans of a suite share (same database and SQL) only once"),
+    merge_filters: bool = typer.Option(False, "--merge-filters", help="With --share-steps, also merge plain scans of the same table into one query"),
 ):
     """Run all translation plans for the specified test suites."""
 
+    if workers < 1:
+        raise typer.BadParameter("--workers must be at least 1")
+    if share and workers > 1:
+        raise typer.BadParameter("--share-steps runs a suite's plans in one process; use --workers 1")
+    if merge_filters and not share:
+        raise typer.BadParameter("--merge-filters requires --share-steps")
+    if result_format not in RESULT_FORMATS:
+        raise typer.BadParameter(f"--result-format must be one of: {', '.join(RESULT_FORMATS)}")
+
+    cache_config = (cache, cache_dir, cache_ttl, cache_max_mb)
+    run_options = dict(
+        parallel=parallel,
+        max_concurrency_per_db=max_concurrency_per_db,
+        chunksize=chunksize,
+        memory_budget_mb=memory_budget_mb,
+        value_transport=value_transport,
+        semi_join_pushdown=semi_join_pushdown,
+        dtype_backend=dtype_backend,
+        spill_threshold_mb=spill_threshold_mb,
+        spill_dir=spill_dir,
+        quiet=quiet,
+    )
+
+    jobs: List[tuple[str, Path, dict]] = []
     for suite in suite_name:
         plans_dir = Path("plans") / suite
         if not plans_dir.exists():
@@ -209,59 +396,363 @@ def run_plans(
             continue
 
         plan_files = sorted(plans_dir.glob("plan_*.json"), key=_plan_number)
-
-        typer.echo("============================================")
+        column_types = _column_types(dtype_backend, Path("metadata") / f"{suite}.json")
         typer.echo(f"Found {len(plan_files)} plan(s) in {plans_dir}")
-        typer.echo(f"Running plans for suite '{suite}'...")
-        typer.echo("============================================")
-        
-        errors_out_path = Path(f"./test_data/errors/{suite}.jsonl")
-        for i, plan_file in enumerate(plan_files):
-            plan_num = _plan_number(plan_file)
-            typer.echo(f"Processing plan file: {plan_num}")
-            
-            with open(plan_file, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                data = TranslationReturn(**data)
-                try:
-                    result_df = execute_plan(data)
-                except Exception as e:
-                    err_payload = {
-                        "timestamp": datetime.now(timezone.utc).isoformat(),
-                        "suite": suite,
-                        "plan_num": plan_num,
-                        "plan_file": str(plan_file),
-                        "exception_type": type(e).__name__,
-                        "message": str(e),
-                        "traceback": traceback.format_exc(),
-                    }
-                    _append_error_jsonl(errors_out_path, err_payload)
-                    typer.echo(f"[ERROR] suite={suite} plan_num={plan_num} {type(e).__name__}: {e}")
-                    continue
-
-            res_out_path = Path(f"./test_data/results/{suite}/result_{plan_num}.csv")
-            res_out_path.parent.mkdir(parents=True, exist_ok=True)
-            result_df.to_csv(res_out_path, index=False)
-            print(f"Final result saved to {res_out_path.resolve()}")
-            
-        typer.echo("============================================")
-        typer.echo(f"Completed running plans for suite '{suite}'.")
-        typer.echo("============================================")
+        suite_options = {
+            **run_options,
+            "column_types": column_types,
+            "validator": _plan_validator(validate, Path("metadata") / f"{suite}.json"),
+        }
+        jobs.extend((suite, plan_file, suite_options) for plan_file in plan_files)
+
+    started = time.perf_counter()
+    if workers == 1:
+        outcomes = _run_plans_serially(
+            jobs, pushdown, plan_timeout, metrics, result_format, pool_size, cache_config,
+            share, merge_filters,
+        )
+    else:
+        outcomes = _run_plans_in_pool(
+            jobs, pushdown, plan_timeout, metrics, result_format, pool_size, cache_config, workers
+        )
+    elapsed = time.perf_counter() - started
+
+    typer.echo("============================================")
+    typer.echo(_throughput_summary(outcomes, elapsed, workers))
+    typer.echo("============================================")
+
+
+@app.command("validate_plans")
+def validate_plans(
+    suite_name: List[str] = typer.Argument(help="Name of the test suite (folder under plans)", default=["bakery_1", "chat", "ecommerce", "sales", "store"]),
+    show_warnings: bool = typer.Option(False, "--warnings", help="Also list warnings of plans that pass"),
+):
+    """Check the plans of the specified suites against their metadata without running them."""
+
+    failed = 0
+    total = 0
+    for suite in suite_name:
+        plans_dir = Path("plans") / suite
+        if not plans_dir.exists():
+            typer.echo(f"Plans directory not found for suite '{suite}': {plans_dir}")
+            continue
+        validator = _plan_validator(True, Path("metadata") / f"{suite}.json")
+
+        for plan_file in sorted(plans_dir.glob("plan_*.json"), key=_plan_number):
+            total += 1
+            plan = TranslationReturn.model_validate_json(plan_file.read_text(encoding="utf-8"))
+            try:
+                compiled = validator.compile(plan)
+            except PlanValidationError as e:
+                failed += 1
+                typer.echo(f"❌ {plan_file}")
+                for error in e.errors:
+                    typer.echo(f"   - {error}")
+                continue
+            if show_warnings and compiled.warnings:
+                typer.echo(f"⚠️ {plan_file}")
+                for warning in compiled.warnings:
+                    typer.echo(f"   - {warning}")
+
+    typer.echo(f"{total - failed}/{total} plan(s) passed validation")
+    if failed:
+        raise typer.Exit(code=1)
+
+
+def _run_plans_serially(
+    jobs: List[tuple[str, Path, dict]],
+    pushdown: bool,
+    plan_timeout: Optional[float],
+    write_metrics: bool,
+    result_format: str,
+    pool_size: int,
+    cache_config: tuple,
+    share: bool = False,
+    merge_filters: bool = False,
+) -> List[dict]:
+    configure_engine_registry(pool_size=pool_size, statement_timeout=plan_timeout)
+    step_cache = _build_step_cache(*cache_config)
+    suite_cache = step_cache
+
+    outcomes = []
+    for i, (suite, plan_file, options) in enumerate(jobs):
+        if i == 0 or jobs[i - 1][0] != suite:
+            typer.echo("============================================")
+            typer.echo(f"Running plans for suite '{suite}'...")
+            typer.echo("============================================")
+            if share:
+                suite_cache = _shared_suite_steps(
+                    [job for job in jobs if job[0] == suite], merge_filters, pushdown, step_cache
+                )
+
+        typer.echo(f"Processing plan file: {_plan_number(plan_file)}")
+        outcome = _run_plan_file(
+            suite, plan_file, {**options, "cache": suite_cache}, pushdown, plan_timeout, write_metrics,
+            result_format,
+        )
+        _record_outcome(outcome)
+        outcomes.append(outcome)
+
+        if i == len(jobs) - 1 or jobs[i + 1][0] != suite:
+            typer.echo("============================================")
+            typer.echo(f"Completed running plans for suite '{suite}'.")
+            if share:
+                typer.echo(f"Shared steps: {suite_cache.stats}")
+            if step_cache is not None:
+                typer.echo(f"Step cache: {step_cache.stats}")
+    return outcomes
+
+
+def _shared_suite_steps(
+    jobs: List[tuple[str, Path, dict]],
+    merge_filters: bool,
+    pushdown: bool,
+    step_cache: Optional[StepResultCache],
+) -> StepCache:
+    """Read the steps the suite's plans share once, as the plans will run them.
+
+    With ``pushdown`` the plans run rewritten, so the rewritten steps are
+    the ones looked up; a plan whose rewrite fails at run time falls back to
+    its original steps, which read on their own.
+    """
+    plans = []
+    for _, plan_file, _ in jobs:
+        try:
+            plan = TranslationReturn.model_validate_json(plan_file.read_text(encoding="utf-8"))
+            if pushdown:
+                with quiet_output(True):  # the rewrite reports itself when the plan runs
+                    plan = rewrite_plan(plan)
+            plans.append(plan)
+        except Exception:
+            continue  # the plan fails with its own error when it runs
+    options = jobs[0][2]
+    with quiet_output(options["quiet"]):
+        return share_steps(plans, options["dtype_backend"], merge_filters, fallback=step_cache)
+
+
+def _run_plans_in_pool(
+    jobs: List[tuple[str, Path, dict]],
+    pushdown: bool,
+    plan_timeout: Optional[float],
+    write_metrics: bool,
+    result_format: str,
+    pool_size: int,
+    cache_config: tuple,
+    workers: int,
+) -> List[dict]:
+    typer.echo(f"Running {len(jobs)} plan(s) in {workers} worker process(es)...")
+
+    outcomes = []
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_plan_worker,
+        initargs=(pool_size, cache_config, plan_timeout),
+    ) as pool:
+        futures = {
+            pool.submit(
+                _run_plan_in_worker,
+                suite, plan_file, options, pushdown, plan_timeout, write_metrics, result_format,
+            ): (suite, plan_file)
+            for suite, plan_file, options in jobs
+        }
+        for future in as_completed(futures):
+            suite, plan_file = futures[future]
+            try:
+                outcome = future.result()
+            except Exception as e:
+                # The worker died (e.g. BrokenProcessPool); record it like a plan failure.
+                outcome = _failed_outcome(suite, plan_file, e, seconds=0.0)
+            _record_outcome(outcome)
+            outcomes.append(outcome)
+    return outcomes
+
+
+_worker_step_cache: Optional[StepResultCache] = None
+
+
+def _init_plan_worker(pool_size: int, cache_config: tuple, plan_timeout: Optional[float] = None) -> None:
+    global _worker_step_cache
+    configure_engine_registry(pool_size=pool_size, statement_timeout=plan_timeout)
+    _worker_step_cache = _build_step_cache(*cache_config)
+
+
+def _run_plan_in_worker(
+    suite: str,
+    plan_file: Path,
+    options: dict,
+    pushdown: bool,
+    plan_timeout: Optional[float],
+    write_metrics: bool,
+    result_format: str,
+) -> dict:
+    # Step logs of concurrent plans would interleave; errors go to the JSONL log instead.
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        return _run_plan_file(
+            suite, plan_file, {**options, "cache": _worker_step_cache}, pushdown, plan_timeout,
+            write_metrics, result_format,
+        )
+
+
+def _run_plan_file(
+    suite: str,
+    plan_file: Path,
+    options: dict,
+    pushdown: bool,
+    plan_timeout: Optional[float],
+    write_metrics: bool = False,
+    result_format: str = "csv",
+) -> dict:
+    """Execute one plan and save its result; returns what happened, for the summary."""
+    plan_num = _plan_number(plan_file)
+    results_dir = Path(f"./test_data/results/{suite}")
+    hooks = CollectingHooks() if write_metrics else None
+    options = {**options, "hooks": hooks, "label": f"{suite}/{plan_num}"}
+    started = time.perf_counter()
+    try:
+        with open(plan_file, "r", encoding="utf-8") as f:
+            data = TranslationReturn(**json.load(f))
+        run = execute_rewritten if pushdown else execute_plan
+        result_df = _call_with_timeout(lambda: run(data, **options), plan_timeout)
+    except Exception as e:
+        if isinstance(e, TimeoutError):
+            # The abandoned plan still holds pooled connections; later plans get new pools.
+            for step in data.execution_plan:
+                get_engine_registry().dispose(step.database)
+        _write_plan_metrics(hooks, results_dir / f"metrics_{plan_num}.json")
+        return _failed_outcome(suite, plan_file, e, seconds=time.perf_counter() - started)
+    seconds = time.perf_counter() - started
+
+    res_out_path = write_result(result_df, results_dir, f"result_{plan_num}", result_format)
+    _write_plan_metrics(hooks, results_dir / f"metrics_{plan_num}.json")
+    print(f"Final result saved to {res_out_path.resolve()}")
+    return {"suite": suite, "plan_num": plan_num, "seconds": seconds, "error": None}
+
+
+def _write_plan_metrics(hooks: Optional[CollectingHooks], path: Path) -> None:
+    # With --pushdown a failed rewritten plan is followed by the original; keep the last run.
+    if hooks is None or not hooks.plans:
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    _write_text_atomic(path, json.dumps(hooks.plans[-1].to_dict(), indent=2, default=str))
+
+
+def _failed_outcome(suite: str, plan_file: Path, e: BaseException, seconds: float) -> dict:
+    return {
+        "suite": suite,
+        "plan_num": _plan_number(plan_file),
+        "seconds": seconds,
+        "error": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "suite": suite,
+            "plan_num": _plan_number(plan_file),
+            "plan_file": str(plan_file),
+            "exception_type": type(e).__name__,
+            "message": str(e),
+            "traceback": "".join(traceback.format_exception(e)),
+        },
+    }
+
+
+def _record_outcome(outcome: dict) -> None:
+    error = outcome["error"]
+    if error is None:
+        return
+    _append_error_jsonl(Path(f"./test_data/errors/{outcome['suite']}.jsonl"), error)
+    typer.echo(
+        f"[ERROR] suite={outcome['suite']} plan_num={outcome['plan_num']} "
+        f"{error['exception_type']}: {error['message']}"
+    )
+
+
+def _call_with_timeout(fn, seconds: Optional[float]):
+    """Call ``fn``, raising ``TimeoutError`` if it has not returned after ``seconds``.
+
+    The call runs on a daemon thread so that statements stuck inside a driver
+    (where no signal can reach them) cannot hold up the run. An abandoned
+    call keeps running; the registry's ``statement_timeout`` makes the
+    databases cancel its statements, and the caller disposes its engines.
+    """
+    if not seconds:
+        return fn()
+
+    outcome: dict = {}
+
+    def target() -> None:
+        try:
+            outcome["value"] = fn()
+        except BaseException as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=target, name="plan", daemon=True)
+    thread.start()
+    thread.join(seconds)
+    if thread.is_alive():
+        raise TimeoutError(f"Plan exceeded the {seconds:g}s timeout")
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["value"]
+
+
+def _throughput_summary(outcomes: List[dict], elapsed: float, workers: int) -> str:
+    if not outcomes:
+        return "No plans were run."
+
+    latencies = sorted(outcome["seconds"] for outcome in outcomes)
+    failed = sum(1 for outcome in outcomes if outcome["error"] is not None)
+
+    def percentile(q: float) -> float:
+        return latencies[max(0, math.ceil(q * len(latencies)) - 1)]
+
+    return (
+        f"Ran {len(outcomes)} plan(s) with {workers} worker(s) in {elapsed:.2f}s "
+        f"({len(outcomes) / elapsed if elapsed else 0:.2f} plans/s); "
+        f"latency p50={percentile(0.50):.3f}s p95={percentile(0.95):.3f}s; "
+        f"{len(outcomes) - failed} succeeded, {failed} failed"
+    )
+
 
 @app.command("debug_plan")
 def debug_plan(
     plan_path: Path = typer.Argument(..., help="Path to the plan JSON file"),
+    parallel: bool = typer.Option(False, "--parallel", help="Run independent plan steps concurrently"),
+    max_concurrency_per_db: int = typer.Option(2, help="Maximum concurrent steps per database when --parallel is set"),
+    chunksize: Optional[int] = typer.Option(None, help="Stream step results in chunks of this many rows"),
+    memory_budget_mb: Optional[float] = typer.Option(None, help="Per-step memory budget (MB) when streaming"),
+    value_transport: str = typer.Option("auto", help="How $stepN values reach the database: auto, literal, expanding, any_array, batched, temp_table"),
+    semi_join_pushdown: bool = typer.Option(False, "--semi-join-pushdown", help="Prefilter join steps with a summary of the dependency's join keys"),
+    pushdown: bool = typer.Option(False, "--pushdown", help="Fold the final aggregation/projection into the SQL and prune unread step columns"),
+    dtype_backend: str = typer.Option("numpy", help="Dtypes of step results: numpy, pyarrow, or schema (types from the metadata file)"),
+    metadata_path: Optional[Path] = typer.Option(None, help="Metadata JSON for --dtype-backend schema (default: metadata/<suite>.json)"),
+    spill_threshold_mb: Optional[float] = typer.Option(None, help="Spill step results to Arrow files once they hold more than this many MB"),
+    spill_dir: Optional[Path] = typer.Option(None, help="Directory for spilled step results (default: system temp dir)"),
+    validate: bool = typer.Option(False, "--validate", help="Check the plan against the metadata file before running it"),
 ):
     """Debug a single execution plan."""
 
     if not plan_path.exists():
         raise typer.BadParameter(f"Plan file not found: {plan_path}")
+    metadata_path = metadata_path or Path("metadata") / f"{plan_path.parent.name}.json"
+    column_types = _column_types(dtype_backend, metadata_path)
+    validator = _plan_validator(validate, metadata_path)
 
     with open(plan_path, "r", encoding="utf-8") as f:
         data = json.load(f)
         data = TranslationReturn(**data)
         try:
-            result_df = execute_plan(data)
+            result_df = (execute_rewritten if pushdown else execute_plan)(
+                data,
+                parallel=parallel,
+                max_concurrency_per_db=max_concurrency_per_db,
+                chunksize=chunksize,
+                memory_budget_mb=memory_budget_mb,
+                value_transport=value_transport,
+                semi_join_pushdown=semi_join_pushdown,
+                dtype_backend=dtype_backend,
+                column_types=column_types,
+                spill_threshold_mb=spill_threshold_mb,
+                spill_dir=spill_dir,
+                validator=validator,
+            )
             typer.echo("Execution successful. Result:")
             typer.echo(result_df)
         except Exception as e:
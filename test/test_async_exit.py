@@ -0,0 +1,79 @@
+"""``execute_plan_async`` run twice with ``asyncio.run`` leaves nothing keeping the interpreter alive.
+
+aiosqlite runs each connection on a non-daemon thread, so a connection left
+open after its event loop closes keeps the process from exiting. Run as a
+script, this file runs a plan on the SQLite stand-in of a suite twice, each
+time on a new loop, and fails when a non-daemon thread other than the main
+one is still alive afterwards. The pytest test runs it in a subprocess, so a
+leak shows up as a failure rather than as a test run that never ends.
+
+    python test/test_async_exit.py [suite] [plan_num]
+    python -m pytest test/test_async_exit.py
+"""
+
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from src.plan_execution_async import execute_plan_async  # noqa: E402
+from src.query_translation import TranslationReturn  # noqa: E402
+from src.utils.sqlite_standins import build_standin, find_standins, localize_plan  # noqa: E402
+
+
+def run_twice(suite: str, plan_num: int, work_dir: Path) -> list[threading.Thread]:
+    """Run plan ``plan_num`` of ``suite`` twice with ``asyncio.run``; the threads left behind."""
+    standin = find_standins(ROOT / "test" / "schemas")[suite]
+    database = build_standin(standin, 1, work_dir, ROOT / "metadata" / f"{suite}.json")
+    plan_path = ROOT / "plans" / suite / f"plan_{plan_num}.json"
+    plan = TranslationReturn.model_validate_json(plan_path.read_text(encoding="utf-8"))
+    plan = localize_plan(plan, database)
+
+    for _ in range(2):
+        asyncio.run(execute_plan_async(plan, quiet=True))
+
+    left = [
+        thread
+        for thread in threading.enumerate()
+        if thread is not threading.main_thread() and not thread.daemon
+    ]
+    # A connection thread closed with its engine may take a moment to finish.
+    for thread in left:
+        thread.join(timeout=5)
+    return [thread for thread in left if thread.is_alive()]
+
+
+def test_asyncio_run_twice_exits():
+    import pytest
+
+    pytest.importorskip("aiosqlite")
+    try:
+        completed = subprocess.run(
+            [sys.executable, str(Path(__file__).resolve())],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            timeout=120,
+        )
+    except subprocess.TimeoutExpired:
+        pytest.fail("Running the plan twice with asyncio.run did not exit within 120s")
+    assert completed.returncode == 0, completed.stdout + completed.stderr
+
+
+if __name__ == "__main__":
+    suite = sys.argv[1] if len(sys.argv) > 1 else "bakery_1"
+    plan_num = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    with tempfile.TemporaryDirectory() as work_dir:
+        left = run_twice(suite, plan_num, Path(work_dir))
+    if left:
+        print(f"❌ Threads still running after both loops closed: {[t.name for t in left]}")
+        sys.stdout.flush()
+        # The leaked threads would keep a normal exit waiting forever.
+        os._exit(1)
+    print("✅ Ran the plan twice with asyncio.run and left no threads behind")